@@ -0,0 +1,187 @@
+"""
+Generates synthetic precinct files that are shaped like the OpenElections data, so that the performance of the tests
+can be measured reproducibly.  The files are deterministic for a given seed, and can contain a configurable share of
+bad rows, quoted fields and ragged rows.
+
+    python -m benchmarks.corpus /tmp/corpus --years 2020 2022 --files-per-year 3 --rows 100000 --error-rate 0.01
+"""
+import argparse
+import os
+import random
+from typing import Iterator, NamedTuple
+
+# The known schema of `VoteBreakdownTotals`, whose vote breakdowns are compared with the votes for equality.
+VOTE_BREAKDOWN_HEADERS = ["county", "precinct", "office", "district", "party", "candidate", "votes", "early_voting",
+                          "election_day", "provisional", "mail"]
+
+SCHEMAS = {
+    "basic": ["county", "precinct", "office", "district", "party", "candidate", "votes"],
+    "absentee": ["county", "precinct", "office", "district", "party", "candidate", "votes", "absentee",
+                 "election_day"],
+    "vote_breakdown": VOTE_BREAKDOWN_HEADERS,
+}
+
+# The kinds of bad rows, each of which fails at least one of the checks.
+ERRORS = ["breakdown_mismatch", "consecutive_spaces", "duplicate", "empty_row", "leading_space", "line_break",
+          "missing_value", "negative_votes", "non_integer_votes", "tab"]
+
+_counties = ["Adams", "Baker", "Clark", "Douglas", "Franklin", "Grant", "Jefferson", "Lincoln", "Madison", "Monroe",
+             "Polk", "Union", "Warren", "Washington", "Wayne"]
+_offices = [
+    ("President", "", [("DEM", "Jane Doe"), ("REP", "John Roe"), ("LIB", "Alex Poe"), ("", "Write-ins")]),
+    ("U.S. Senate", "", [("DEM", "Maria Lopez"), ("REP", "Tom Baker")]),
+    ("U.S. House", "3", [("DEM", "Ann Lee"), ("REP", "Bob Smith"), ("GRN", "Carl Jones")]),
+    ("State Senate", "12", [("DEM", "Dana White"), ("REP", "Evan Black")]),
+    ("Registered Voters", "", [("", "")]),
+    ("Ballots Cast", "", [("", "")]),
+]
+_quote_characters = {",", "\"", "\n", "\r"}
+
+
+class Corpus(NamedTuple):
+    schema: str = "vote_breakdown"
+    error_rate: float = 0.0
+    quote_rate: float = 0.0
+    ragged_rate: float = 0.0
+    seed: int = 0
+
+
+def _get_entries(rng: random.Random, headers: list[str], county: str, precinct: str, office: str, district: str,
+                 party: str, candidate: str) -> dict[str, str]:
+    entries = {"county": county, "precinct": precinct, "office": office, "district": district, "party": party,
+               "candidate": candidate}
+    breakdowns = [x for x in headers if x in {"absentee", "early_voting", "election_day", "mail", "provisional"}]
+    votes = 0
+    for header in breakdowns:
+        value = rng.randrange(400)
+        entries[header] = str(value)
+        votes += value
+    entries["votes"] = str(votes if breakdowns else rng.randrange(2000))
+    return entries
+
+
+def _add_error(rng: random.Random, headers: list[str], row: list[str], previous_row: list[str]) -> list[str]:
+    error = rng.choice(ERRORS)
+    row = list(row)
+    if error == "breakdown_mismatch" and "election_day" in headers:
+        row[headers.index("votes")] = str(int(row[headers.index("votes")]) + rng.randrange(1, 10))
+    elif error == "consecutive_spaces":
+        row[headers.index("candidate")] = row[headers.index("candidate")].replace(" ", "  ", 1) or "A  B"
+    elif error == "duplicate" and previous_row:
+        row = list(previous_row)
+    elif error == "empty_row":
+        row = []
+    elif error == "leading_space":
+        row[headers.index("precinct")] = f" {row[headers.index('precinct')]}"
+    elif error == "line_break":
+        row[headers.index("office")] = row[headers.index("office")].replace(" ", "\n", 1) or "A\nB"
+    elif error == "missing_value":
+        row[headers.index(rng.choice(["county", "precinct", "office"]))] = ""
+    elif error == "negative_votes":
+        row[headers.index("votes")] = f"-{rng.randrange(1, 100)}"
+    elif error == "non_integer_votes":
+        row[headers.index("votes")] = f"{rng.randrange(100)}.5"
+    elif error == "tab":
+        row[headers.index("county")] = f"{row[headers.index('county')]}\t"
+    else:
+        # Schemas without vote breakdowns, and the first row, fall back to a negative vote count.
+        row[headers.index("votes")] = "-1"
+    return row
+
+
+def generate_rows(rows: int, corpus: Corpus = Corpus()) -> Iterator[list[str]]:
+    """
+    Yields the headers of the schema of `corpus`, followed by `rows` rows of precinct results.  A share of the rows
+    given by `error_rate` has one of the `ERRORS`, and a share given by `ragged_rate` has a column too many or too few.
+    """
+    headers = SCHEMAS[corpus.schema]
+    rng = random.Random(corpus.seed)
+    yield list(headers)
+
+    count = 0
+    previous_row = []
+    precinct_number = 0
+    while True:
+        county = _counties[precinct_number % len(_counties)]
+        precinct_number += 1
+        precinct = f"Precinct {precinct_number:04d}"
+        for office, district, candidates in _offices:
+            for party, candidate in candidates:
+                if count == rows:
+                    return
+                count += 1
+
+                entries = _get_entries(rng, headers, county, precinct, office, district, party, candidate)
+                row = [entries[x] for x in headers]
+                if rng.random() < corpus.error_rate:
+                    row = _add_error(rng, headers, row, previous_row)
+                if rng.random() < corpus.ragged_rate:
+                    if rng.random() < 0.5:
+                        row = row[:-1]
+                    else:
+                        row = row + [""]
+
+                previous_row = row
+                yield row
+
+
+def _format_entry(rng: random.Random, entry: str, quote_rate: float) -> str:
+    if rng.random() < quote_rate or any(x in entry for x in _quote_characters):
+        return "\"" + entry.replace("\"", "\"\"") + "\""
+    return entry
+
+
+def write_file(path: str, rows: int, corpus: Corpus = Corpus()):
+    """
+    Writes the rows generated for `corpus` to the CSV file at `path`.  A share of the fields given by `quote_rate` is
+    quoted even though it doesn't need to be.
+    """
+    rng = random.Random(corpus.seed + 1)
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    with open(path, "w", encoding="utf-8", newline="") as csv_file:
+        lines = []
+        for row in generate_rows(rows, corpus):
+            lines.append(",".join(_format_entry(rng, x, corpus.quote_rate) for x in row) + "\n")
+            if len(lines) == 10000:
+                csv_file.writelines(lines)
+                lines.clear()
+        csv_file.writelines(lines)
+
+
+def write_corpus(root_path: str, years: list[str], files_per_year: int, rows: int,
+                 corpus: Corpus = Corpus()) -> list[str]:
+    """
+    Writes `files_per_year` files of `rows` rows under a directory per year in `root_path`, as the tests expect them,
+    and returns their paths.  Each file is generated with a different seed.
+    """
+    paths = []
+    for year in years:
+        for i in range(files_per_year):
+            path = os.path.join(root_path, year, f"{year}__precinct_{i:03d}.csv")
+            write_file(path, rows, corpus._replace(seed=corpus.seed + len(paths)))
+            paths.append(path)
+
+    return paths
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic corpus of precinct files.")
+    parser.add_argument("root_path", type=str, help="the directory to write the files to")
+    parser.add_argument("--years", type=str, nargs="+", default=["2020"], help="the years to write files for")
+    parser.add_argument("--files-per-year", type=int, default=1, metavar="N", help="the number of files per year")
+    parser.add_argument("--rows", type=int, default=10000, metavar="N", help="the number of rows per file")
+    parser.add_argument("--schema", choices=sorted(SCHEMAS), default="vote_breakdown", help="the headers of the files")
+    parser.add_argument("--error-rate", type=float, default=0.0, metavar="RATE",
+                        help="the share of the rows that fail one of the checks")
+    parser.add_argument("--quote-rate", type=float, default=0.0, metavar="RATE",
+                        help="the share of the fields that are quoted")
+    parser.add_argument("--ragged-rate", type=float, default=0.0, metavar="RATE",
+                        help="the share of the rows with an inconsistent number of columns")
+    parser.add_argument("--seed", type=int, default=0, help="the seed of the random number generator")
+    args = parser.parse_args()
+
+    write_corpus(args.root_path, args.years, args.files_per_year, args.rows,
+                 Corpus(args.schema, args.error_rate, args.quote_rate, args.ragged_rate, args.seed))
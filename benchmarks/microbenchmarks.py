@@ -0,0 +1,232 @@
+"""
+Measures the throughput of each check, and of each data test of `run_tests.py`, over synthetic files of increasing
+sizes.  The files are generated by `benchmarks.corpus` in a work directory, and are reused by later runs with the same
+parameters, so that runs before and after a change can be compared.
+
+    python -m benchmarks.microbenchmarks --sizes 10k 1M 10M --error-rate 0.01 --output results.jsonl
+"""
+import argparse
+import io
+import itertools
+import json
+import os
+import tempfile
+import time
+import unittest
+from typing import Callable, Iterator, NamedTuple, Optional
+
+from benchmarks import corpus
+from data_tests import columnar, files, format_tests
+from data_tests.duplicate_entries import DuplicateEntries
+from data_tests.inconsistencies import VoteBreakdownTotals
+from data_tests.missing_values import MissingValue
+from data_tests.test_data import (CrossFileDuplicatesTest, DuplicateEntriesTest, FileFormatTests, MissingValuesTest,
+                                  TestCase, VoteBreakdownTotalsTest)
+
+# The rows are read in chunks of this many rows, so that only the time spent in the checks is measured, while the
+# memory used doesn't depend on the size of the file.
+_chunk_size = 10000
+
+
+def _get_value_checks(headers: list[str]) -> list:
+    return [format_tests.ConsecutiveSpaces(), format_tests.LeadingAndTrailingSpaces(),
+            format_tests.PrematureLineBreaks(), format_tests.TabCharacters()]
+
+
+def _get_columnar_checks(headers: list[str]) -> list:
+    return _get_value_checks(headers) + [format_tests.NegativeVotes(headers), format_tests.NonIntegerVotes(headers),
+                                         VoteBreakdownTotals(headers)]
+
+
+# The checks that are measured, keyed by their names.  Each check is created from the headers and the path of the file.
+CHECKS: dict[str, Callable[[list[str], str], object]] = {
+    "ConsecutiveSpaces": lambda headers, csv_file: format_tests.ConsecutiveSpaces(),
+    "DuplicateEntries": lambda headers, csv_file: DuplicateEntries(headers, csv_file=csv_file),
+    "EmptyRows": lambda headers, csv_file: format_tests.EmptyRows(),
+    "InconsistentNumberOfColumns": lambda headers, csv_file: format_tests.InconsistentNumberOfColumns(headers),
+    "LeadingAndTrailingSpaces": lambda headers, csv_file: format_tests.LeadingAndTrailingSpaces(),
+    "MissingValue(county)": lambda headers, csv_file: MissingValue("county", headers),
+    "MissingValue(office)": lambda headers, csv_file: MissingValue("office", headers),
+    "MissingValue(precinct)": lambda headers, csv_file: MissingValue("precinct", headers),
+    "NegativeVotes": lambda headers, csv_file: format_tests.NegativeVotes(headers),
+    "NonIntegerVotes": lambda headers, csv_file: format_tests.NonIntegerVotes(headers),
+    "PrematureLineBreaks": lambda headers, csv_file: format_tests.PrematureLineBreaks(),
+    "TabCharacters": lambda headers, csv_file: format_tests.TabCharacters(),
+    "VoteBreakdownTotals": lambda headers, csv_file: VoteBreakdownTotals(headers),
+    # The composite executors that run several checks at once.
+    "FusedValueTests": lambda headers, csv_file: format_tests.FusedValueTests(_get_value_checks(headers)),
+    "ColumnarChecks": lambda headers, csv_file: columnar.ColumnarChecks(headers, _get_columnar_checks(headers)),
+}
+
+TESTS = {
+    "cross_file_duplicates": CrossFileDuplicatesTest,
+    "duplicate_entries": DuplicateEntriesTest,
+    "file_format": FileFormatTests,
+    "missing_values": MissingValuesTest,
+    "vote_breakdown_totals": VoteBreakdownTotalsTest,
+}
+
+
+class Measurement(NamedTuple):
+    benchmark: str
+    name: str
+    rows: int
+    seconds: float
+
+    @property
+    def rows_per_second(self) -> Optional[float]:
+        return self.rows / self.seconds if self.seconds > 0 else None
+
+
+def parse_size(size: str) -> int:
+    """
+    Parses a number of rows with an optional "k" or "M" suffix, e.g., "10k" or "1M".
+    """
+    multipliers = {"k": 1000, "K": 1000, "m": 1000000, "M": 1000000}
+    if size and size[-1] in multipliers:
+        return int(float(size[:-1]) * multipliers[size[-1]])
+    return int(size)
+
+
+def get_corpus_root(work_dir: str, rows: int, corpus_options: corpus.Corpus) -> str:
+    """
+    Returns the root of a corpus with a single file of `rows` rows, generating it in `work_dir` unless a previous run
+    already has.
+    """
+    name = "-".join(str(x) for x in (rows, *corpus_options))
+    root_path = os.path.join(work_dir, name)
+    complete_marker = os.path.join(root_path, ".complete")
+    if not os.path.exists(complete_marker):
+        corpus.write_corpus(root_path, ["2020"], 1, rows, corpus_options)
+        open(complete_marker, "w").close()
+
+    return root_path
+
+
+def _read_chunks(csv_file: str) -> Iterator[list[list[str]]]:
+    rows = files.read_rows(csv_file)
+    while chunk := list(itertools.islice(rows, _chunk_size)):
+        yield chunk
+
+
+def measure_check(name: str, csv_file: str) -> Measurement:
+    """
+    Measures the time that the check called `name` takes to test every row of `csv_file` and to count its failures.
+    The time spent reading and parsing the file isn't included.
+    """
+    rows = files.read_rows(csv_file)
+    headers = next(rows)
+    rows.close()
+    check = CHECKS[name](headers, csv_file)
+
+    # Like in the suites, the headers are tested as the first row.
+    row_count = 0
+    seconds = 0.0
+    for chunk in _read_chunks(csv_file):
+        start = time.perf_counter()
+        for row in chunk:
+            check.test(row)
+        seconds += time.perf_counter() - start
+        row_count += len(chunk)
+
+    start = time.perf_counter()
+    if hasattr(check, "finish"):
+        check.finish()
+    if hasattr(check, "failure_count"):
+        _ = check.failure_count
+    seconds += time.perf_counter() - start
+
+    return Measurement("check", name, row_count - 1, seconds)
+
+
+def measure_test(name: str, root_path: str, rows: int, max_examples: int = 10) -> Measurement:
+    """
+    Measures the time that the data test called `name` takes to run over the corpus at `root_path`, including reading
+    the files and building the failure messages.
+    """
+    TestCase.root_path = root_path
+    TestCase.tests = [name]
+    TestCase.max_examples = max_examples
+    TestCase._completed_suites = set()
+    TestCase._pending_results = {}
+
+    test_suite = unittest.defaultTestLoader.loadTestsFromTestCase(TESTS[name])
+    start = time.perf_counter()
+    unittest.TextTestRunner(stream=io.StringIO()).run(test_suite)
+    return Measurement("test", name, rows, time.perf_counter() - start)
+
+
+def format_measurements(measurements: list[Measurement]) -> str:
+    lines = [f"{'benchmark':<10}{'name':<30}{'rows':>12}{'time (s)':>12}{'rows/s':>14}"]
+    for measurement in measurements:
+        rate = measurement.rows_per_second
+        rate = f"{rate:.0f}" if rate is not None else "-"
+        lines.append(f"{measurement.benchmark:<10}{measurement.name:<30}{measurement.rows:>12}"
+                     f"{measurement.seconds:>12.3f}{rate:>14}")
+
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure the throughput of the checks and of the data tests.")
+    parser.add_argument("--sizes", type=str, nargs="+", default=["10k", "1M", "10M"], metavar="SIZE",
+                        help="the numbers of rows of the files to measure, with an optional k or M suffix")
+    parser.add_argument("--checks", type=str, nargs="*", choices=sorted(CHECKS), metavar="CHECK",
+                        help="the checks to measure.  By default, every check is measured.")
+    parser.add_argument("--tests", type=str, nargs="*", choices=sorted(TESTS), metavar="TEST",
+                        help="the data tests to measure.  By default, every data test is measured.")
+    parser.add_argument("--repeat", type=int, default=1, metavar="N",
+                        help="measure each benchmark this many times, and keep the fastest time")
+    parser.add_argument("--work-dir", type=str,
+                        help="the directory that the generated files are kept in, so that they can be reused.  By "
+                             "default, a temporary directory is used.")
+    parser.add_argument("--output", type=str,
+                        help="the path to a file that a JSON record of each measurement is appended to")
+    parser.add_argument("--schema", choices=sorted(corpus.SCHEMAS), default="vote_breakdown",
+                        help="the headers of the generated files")
+    parser.add_argument("--error-rate", type=float, default=0.01, metavar="RATE",
+                        help="the share of the rows that fail one of the checks")
+    parser.add_argument("--quote-rate", type=float, default=0.05, metavar="RATE",
+                        help="the share of the fields that are quoted")
+    parser.add_argument("--ragged-rate", type=float, default=0.001, metavar="RATE",
+                        help="the share of the rows with an inconsistent number of columns")
+    parser.add_argument("--seed", type=int, default=0, help="the seed of the random number generator")
+    args = parser.parse_args()
+
+    check_names = args.checks if args.checks is not None else list(CHECKS)
+    if not columnar.is_available():
+        check_names = [x for x in check_names if x != "ColumnarChecks"]
+    test_names = args.tests if args.tests is not None else list(TESTS)
+    corpus_options = corpus.Corpus(args.schema, args.error_rate, args.quote_rate, args.ragged_rate, args.seed)
+
+    temporary_directory = None
+    work_dir = args.work_dir
+    if work_dir is None:
+        temporary_directory = tempfile.TemporaryDirectory()
+        work_dir = temporary_directory.name
+
+    measurements = []
+    try:
+        for size in args.sizes:
+            rows = parse_size(size)
+            root_path = get_corpus_root(work_dir, rows, corpus_options)
+            csv_file = os.path.join(root_path, "2020", "2020__precinct_000.csv")
+
+            size_measurements = []
+            for check_name in check_names:
+                size_measurements.append(min((measure_check(check_name, csv_file) for _ in range(args.repeat)),
+                                             key=lambda x: x.seconds))
+            for test_name in test_names:
+                size_measurements.append(min((measure_test(test_name, root_path, rows) for _ in range(args.repeat)),
+                                             key=lambda x: x.seconds))
+
+            print(f"{format_measurements(size_measurements)}\n", flush=True)
+            measurements.extend(size_measurements)
+    finally:
+        if temporary_directory is not None:
+            temporary_directory.cleanup()
+
+    if args.output is not None:
+        with open(args.output, "a") as output:
+            for measurement in measurements:
+                output.write(json.dumps({**measurement._asdict(), "corpus": corpus_options._asdict()}) + "\n")
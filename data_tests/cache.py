@@ -0,0 +1,158 @@
+import functools
+import glob
+import hashlib
+import json
+import os
+import sqlite3
+import time
+import zlib
+from typing import Optional
+
+from data_tests import files, schemas
+from data_tests.failures import SpooledMessage
+from data_tests.suites import CheckResult, FileResult
+
+
+@functools.lru_cache(maxsize=None)
+def _get_source_version() -> str:
+    digest = hashlib.blake2b(digest_size=16)
+    for source_file in sorted(glob.glob(os.path.join(os.path.dirname(__file__), "*.py"))):
+        digest.update(os.path.basename(source_file).encode())
+        with open(source_file, "rb") as source:
+            digest.update(source.read())
+
+    return digest.hexdigest()
+
+
+def get_code_version() -> str:
+    """
+    Returns a fingerprint of the source code of the checks, and of the known schemas that they use.  Cached results are
+    only used if they were produced by the same version of the code.
+    """
+    return f"{_get_source_version()}-{schemas.get_registry().fingerprint}"
+
+
+def get_content_hash(file_path: str, chunk_size: int = 1 << 20) -> str:
+    digest = hashlib.blake2b(digest_size=16)
+    with files.open_raw(file_path) as data:
+        while chunk := data.read(chunk_size):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """
+    An on-disk cache of file results, keyed by the hash of the file contents, the version of the check code, the suite,
+    and the number of examples in the failure messages.
+    """
+    file_name = "results.sqlite3"
+
+    # The version of the schema of the results table.  Tables with another schema are dropped.
+    schema_version = 2
+
+    # Results whose messages are larger than this are not cached, since they would bloat the cache.
+    max_message_size = 1 << 20
+
+    def __init__(self, cache_dir: str):
+        os.makedirs(cache_dir, exist_ok=True)
+        self._connection = sqlite3.connect(os.path.join(cache_dir, ResultCache.file_name), timeout=60)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        if self._connection.execute("PRAGMA user_version").fetchone()[0] != ResultCache.schema_version:
+            self._connection.execute("DROP TABLE IF EXISTS results")
+            self._connection.execute(f"PRAGMA user_version={ResultCache.schema_version}")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "content_hash TEXT NOT NULL, "
+            "code_version TEXT NOT NULL, "
+            "suite TEXT NOT NULL, "
+            "max_examples INTEGER NOT NULL, "
+            "log_max_examples INTEGER NOT NULL, "
+            "passed INTEGER NOT NULL, "
+            "failure_count INTEGER NOT NULL, "
+            "console_message BLOB NOT NULL, "
+            "log_message BLOB NOT NULL, "
+            "checks BLOB NOT NULL, "
+            "last_used REAL NOT NULL, "
+            "PRIMARY KEY (content_hash, code_version, suite, max_examples, log_max_examples))"
+        )
+        self._connection.commit()
+
+    def __len__(self) -> int:
+        return self._connection.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    def clear(self):
+        with self._connection:
+            self._connection.execute("DELETE FROM results")
+
+    def close(self):
+        self._connection.close()
+
+    def evict(self, max_entries: Optional[int] = None, max_age: Optional[float] = None):
+        """
+        Removes the results produced by other versions of the code, the results that haven't been used in `max_age`
+        seconds, and the least recently used results beyond `max_entries`.
+        """
+        with self._connection:
+            self._connection.execute("DELETE FROM results WHERE code_version != ?", (get_code_version(),))
+            if max_age is not None:
+                self._connection.execute("DELETE FROM results WHERE last_used < ?", (time.time() - max_age,))
+            if max_entries is not None:
+                self._connection.execute(
+                    "DELETE FROM results WHERE rowid NOT IN "
+                    "(SELECT rowid FROM results ORDER BY last_used DESC LIMIT ?)",
+                    (max(max_entries, 0),)
+                )
+
+    def get(self, content_hash: str, suite_name: str, max_examples: int,
+            log_max_examples: int) -> Optional[FileResult]:
+        key = (content_hash, get_code_version(), suite_name, max_examples, log_max_examples)
+        row = self._connection.execute(
+            "SELECT passed, failure_count, console_message, log_message, checks FROM results WHERE content_hash = ? "
+            "AND code_version = ? AND suite = ? AND max_examples = ? AND log_max_examples = ?",
+            key
+        ).fetchone()
+
+        if row is None:
+            return None
+
+        with self._connection:
+            self._connection.execute(
+                "UPDATE results SET last_used = ? WHERE content_hash = ? AND code_version = ? AND suite = ? AND "
+                "max_examples = ? AND log_max_examples = ?",
+                (time.time(), *key)
+            )
+
+        passed, failure_count, console_message, log_message, checks = row
+        check_results = tuple(
+            CheckResult(name, check_passed, check_failure_count, [(x, y) for x, y in examples])
+            for name, check_passed, check_failure_count, examples in json.loads(zlib.decompress(checks))
+        )
+        return FileResult(bool(passed), failure_count, zlib.decompress(console_message).decode(),
+                          SpooledMessage([zlib.decompress(log_message).decode()]), check_results)
+
+    def put(self, content_hash: str, suite_name: str, max_examples: int, log_max_examples: int, result: FileResult):
+        # The results of files whose rows weren't all tested aren't cached, since they depend on when testing stopped.
+        if not result.complete or len(result.console_message) + len(result.log_message) > ResultCache.max_message_size:
+            return
+
+        with self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (content_hash, get_code_version(), suite_name, max_examples, log_max_examples, int(result.passed),
+                 result.failure_count, zlib.compress(result.console_message.encode()),
+                 zlib.compress(str(result.log_message).encode()), zlib.compress(json.dumps(result.checks).encode()),
+                 time.time())
+            )
+
+
+# Connections can't be shared between processes, so each process opens its own.
+_caches = {}
+
+
+def get_cache(cache_dir: str) -> ResultCache:
+    key = (os.getpid(), cache_dir)
+    if key not in _caches:
+        _caches[key] = ResultCache(cache_dir)
+
+    return _caches[key]
@@ -0,0 +1,68 @@
+import functools
+import re
+from typing import Iterable, NamedTuple, Optional
+
+
+class ExemptionRule(NamedTuple):
+    # A regular expression that is searched for in the lowercased candidate.
+    pattern: str
+
+    # The names of the checks whose failures are ignored for the candidates that match.
+    checks: frozenset[str]
+
+    # Whether the spaces are removed from the candidate before the pattern is searched for.
+    ignore_spaces: bool = False
+
+
+DEFAULT_EXEMPTIONS = [
+    # There are cases where over votes and under votes are reported as a single aggregate.  As such, it's possible for
+    # the votes to be negative, and for the vote breakdowns not to add up.
+    ExemptionRule(r"over/under|under/over", frozenset({"NegativeVotes", "VoteBreakdownTotals"}), ignore_spaces=True),
+    # Under votes are sometimes reported as negative values.
+    ExemptionRule(r"\Aunder votes\Z", frozenset({"NegativeVotes"})),
+    # There are some rare cases where the value represents a turnout percentage.
+    ExemptionRule(r"%|pct|percent", frozenset({"NonIntegerVotes"})),
+]
+
+
+class CandidateClassifier:
+    """
+    Classifies candidates by the checks whose failures they are exempt from.  A file only has a few distinct candidates,
+    so the classifications are kept in a bounded LRU cache, and the rules are only evaluated once per distinct
+    candidate rather than once per vote.
+    """
+    cache_size = 4096
+
+    def __init__(self, rules: Iterable[ExemptionRule] = DEFAULT_EXEMPTIONS):
+        self._rules = [(re.compile(x.pattern), frozenset(x.checks), x.ignore_spaces) for x in rules]
+        self.get_exemptions = functools.lru_cache(maxsize=CandidateClassifier.cache_size)(self._get_exemptions)
+
+    def _get_exemptions(self, candidate: str) -> frozenset[str]:
+        """
+        Returns the names of the checks whose failures are ignored for `candidate`.
+        """
+        lowered_candidate = candidate.lower()
+        compact_candidate = lowered_candidate.replace(" ", "")
+
+        exemptions = set()
+        for regex, checks, ignore_spaces in self._rules:
+            if regex.search(compact_candidate if ignore_spaces else lowered_candidate):
+                exemptions.update(checks)
+
+        return frozenset(exemptions)
+
+
+class ExemptibleCheck:
+    """
+    A check whose failures are ignored for some candidates.  The exemption rules name the check by its
+    `exemption_name`, which subclasses inherit along with the exemptions.
+    """
+    exemption_name: str = None
+
+    _classifier: CandidateClassifier = None
+
+    def is_exempt(self, candidate: Optional[str]) -> bool:
+        """
+        Returns whether the failures of the rows of `candidate` are ignored, according to the exemption rules.
+        """
+        return candidate is not None and self.exemption_name in self._classifier.get_exemptions(candidate)
@@ -0,0 +1,43 @@
+import pathlib
+import re
+import subprocess
+
+from data_tests.files import is_csv_file
+
+_year_regex = re.compile(r"[0-9]{4}")
+
+
+def _git(root_path: str, *args: str) -> list[str]:
+    completed_process = subprocess.run(["git", "-C", root_path, *args], capture_output=True, check=True)
+    return [x for x in completed_process.stdout.decode().split("\0") if x]
+
+
+def get_changed_files(root_path: str, ref: str) -> list[str]:
+    """
+    Returns the CSV files and ZIP archives under the year directories of `root_path` that have been added or modified
+    since `ref`, including uncommitted and untracked files.  Renamed files are returned under their new path, and
+    deleted files are omitted.  The paths are relative to `root_path`.
+
+    Raises `subprocess.CalledProcessError` if `root_path` isn't in a git repository, or if `ref` isn't a valid revision.
+    """
+    changed_files = set()
+
+    # Each entry is a status followed by a path, or by the old and new paths for renames and copies.
+    entries = iter(_git(root_path, "diff", "--name-status", "--relative", "-z", "-M", ref, "--"))
+    for status in entries:
+        path = next(entries)
+        if status[0] in {"R", "C"}:
+            path = next(entries)
+        if status[0] != "D":
+            changed_files.add(path)
+
+    changed_files.update(_git(root_path, "ls-files", "--others", "--exclude-standard", "-z"))
+
+    csv_files = []
+    for path in sorted(changed_files):
+        parts = pathlib.PurePosixPath(path).parts
+        if len(parts) > 1 and _year_regex.fullmatch(parts[0]) and \
+                (is_csv_file(path) or path.lower().endswith(".zip")):
+            csv_files.append(str(pathlib.Path(*parts)))
+
+    return csv_files
@@ -0,0 +1,181 @@
+"""
+Validates a large file in parallel, by splitting it into byte ranges that each hold whole records, running the suites
+over each range in a worker process, and merging the states of their checks in the order of the ranges.
+
+The ranges are split at line breaks that follow an even number of quote characters, which are outside quoted entries
+for well-formed files.  Since a quote character in the middle of an unquoted entry is taken literally by the csv module,
+each worker also parses a sentinel record after the end of its range, which is only parsed as a record of its own if the
+range ends outside of a quoted entry.  If any range doesn't, the file is validated as a whole instead.
+"""
+import csv
+import io
+import locale
+import multiprocessing.pool
+from typing import Optional, Type
+
+from data_tests import files
+from data_tests.row_context import RowContext
+
+_sentinel = "openelections-chunk-sentinel"
+
+
+def find_boundaries(data: bytes, chunk_count: int) -> list[int]:
+    """
+    Returns the offsets of the ends of the records of `data` that split it into the headers and up to `chunk_count`
+    ranges of about the same size, starting with the end of the headers and ending with the end of `data`.
+    """
+    header_end, quote_count = _find_record_end(data, 0, 0)
+    boundaries = [header_end]
+    for i in range(1, chunk_count):
+        target = header_end + i * (len(data) - header_end) // chunk_count
+        if target <= boundaries[-1]:
+            continue
+        quote_count += _count_quotes(data, boundaries[-1], target)
+        boundary, quote_count = _find_record_end(data, target, quote_count)
+        if boundary >= len(data):
+            break
+        boundaries.append(boundary)
+
+    if boundaries[-1] < len(data):
+        boundaries.append(len(data))
+    return boundaries
+
+
+def _count_quotes(data: bytes, start: int, end: int) -> int:
+    # Memory-mapped files can't count their bytes, but their slices can.
+    return data[start:end].count(b'"')
+
+
+def _find_record_end(data: bytes, position: int, quote_count: int) -> tuple[int, int]:
+    # Returns the offset after the first line break at or after `position` that follows an even number of quotes, given
+    # the number of quotes before `position`, along with the number of quotes before that offset.
+    while True:
+        line_break = data.find(b"\n", position)
+        if line_break == -1:
+            return len(data), quote_count + _count_quotes(data, position, len(data))
+
+        line_quote_count = _count_quotes(data, position, line_break)
+        if (quote_count + line_quote_count) % 2 == 0:
+            return line_break + 1, quote_count + line_quote_count
+
+        # The line break is inside a quoted entry, which ends at the next quote at the earliest.
+        next_quote = data.find(b'"', line_break)
+        if next_quote == -1:
+            return len(data), quote_count + line_quote_count
+        quote_count += line_quote_count + 1
+        position = next_quote + 1
+
+
+def _parse(raw_data: bytes, is_last: bool) -> Optional[list[list[str]]]:
+    # The rows are decoded and parsed like the rows that are read from the file.  Ranges that don't end outside of a
+    # quoted entry are rejected.
+    if not is_last:
+        raw_data += f"{_sentinel}\n".encode()
+    rows = list(csv.reader(io.TextIOWrapper(io.BytesIO(raw_data), encoding=locale.getpreferredencoding(False))))
+    if not is_last:
+        if not rows or rows[-1] != [_sentinel]:
+            return None
+        rows.pop()
+
+    return rows
+
+
+def get_chunk_state(check):
+    """
+    Returns the state of `check` after testing the rows of a chunk, which is merged into the check of the whole file.
+    Checks that only test the headers have no state.
+    """
+    if hasattr(check, "get_chunk_state"):
+        return check.get_chunk_state()
+
+    failures = getattr(check, "failures", None)
+    return None if failures is None else failures.get_chunk_state()
+
+
+def merge_chunk_state(check, state, row_offset: int):
+    if hasattr(check, "merge_chunk_state"):
+        check.merge_chunk_state(state, row_offset)
+    elif state is not None:
+        check.failures.merge_chunk_state(state, row_offset)
+
+
+def _validate_chunk(task: tuple) -> Optional[tuple[int, list[list]]]:
+    # The rows of the chunk are numbered from 1, and are numbered after the rows of the previous chunks once merged.
+    csv_file, start, end, is_last, headers, suite_classes, options = task
+    with open(csv_file, "rb") as raw_data:
+        raw_data.seek(start)
+        chunk = raw_data.read(end - start)
+
+    rows = _parse(chunk, is_last)
+    if rows is None:
+        return None
+
+    suites = [suite_class(headers, csv_file=csv_file, options=options) for suite_class in suite_classes]
+    for suite in suites:
+        suite.prescan(chunk)
+        suite.test_headers(headers, test_row=False)
+
+    context = RowContext(headers)
+    for row in rows:
+        context.update(row)
+        for suite in suites:
+            suite.test(row, context)
+
+    for suite in suites:
+        suite.finish()
+
+    suite_states = [[get_chunk_state(x) for x in suite.checks] for suite in suites]
+    for suite in suites:
+        suite.close()
+
+    return len(rows), suite_states
+
+
+def run_chunked(csv_file: str, suite_classes: list[Type], options, pool: multiprocessing.pool.Pool,
+                chunk_count: int) -> Optional[list]:
+    """
+    Runs the suites in `suite_classes` over `csv_file` split into up to `chunk_count` chunks, which are validated by the
+    workers of `pool`.  Returns the suites with the merged states of their checks, or None if the file can't be split.
+    """
+    with files.map_file(csv_file) as data:
+        if data is None:
+            return None
+
+        boundaries = find_boundaries(data, chunk_count)
+        if len(boundaries) < 3:
+            return None
+
+        # The headers are parsed like the chunks, so that they are known to end where the first chunk starts.
+        header_rows = _parse(data[:boundaries[0]], is_last=False)
+        if header_rows is None or len(header_rows) != 1:
+            return None
+        headers = header_rows[0]
+
+        suites = [suite_class(headers, csv_file=csv_file, options=options) for suite_class in suite_classes]
+        for suite in suites:
+            suite.prescan(data)
+
+    # The headers are tested as the first row, and any rows buffered by the checks are tested before the failures of
+    # the chunks are merged, so that the failures stay in row order.
+    for suite in suites:
+        suite.test_headers(headers)
+        suite.finish()
+
+    tasks = [
+        (csv_file, start, end, end == boundaries[-1], headers, suite_classes, options)
+        for start, end in zip(boundaries, boundaries[1:])
+    ]
+    row_offset = 1
+    for chunk_result in pool.imap(_validate_chunk, tasks):
+        if chunk_result is None:
+            for suite in suites:
+                suite.close()
+            return None
+
+        row_count, suite_states = chunk_result
+        for suite, check_states in zip(suites, suite_states):
+            for check, state in zip(suite.checks, check_states):
+                merge_chunk_state(check, state, row_offset)
+        row_offset += row_count
+
+    return suites
@@ -0,0 +1,235 @@
+"""
+A columnar engine that runs some of the checks as vectorized NumPy operations over chunks of rows, instead of testing
+each entry in Python.  NumPy is an optional dependency, and the engine is only used when it's installed and selected.
+"""
+import itertools
+import operator
+import sys
+
+from data_tests import format_tests
+from data_tests.inconsistencies import VoteBreakdownTotals
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+def is_available() -> bool:
+    return numpy is not None
+
+
+# Entries that consist of up to this many ASCII digits are parsed as numbers without calling float().
+_max_digits = 15
+
+_whitespace_table = None
+
+
+def _get_whitespace_table():
+    # Maps code points to whether they are whitespace, which is what both str.isspace() and the \s regular expression
+    # class match.  Code points beyond the end of the table aren't whitespace.
+    global _whitespace_table
+    if _whitespace_table is None:
+        whitespace = [x for x in range(sys.maxunicode + 1) if chr(x).isspace()]
+        _whitespace_table = numpy.zeros(max(whitespace) + 2, dtype=bool)
+        _whitespace_table[whitespace] = True
+
+    return _whitespace_table
+
+
+def _get_code_points(entries: list[str]):
+    """
+    Returns the code points of `entries` laid end to end in a single array, along with the lengths of the entries and
+    the offsets in the array where the entries end.
+    """
+    lengths = numpy.fromiter(map(len, entries), dtype=numpy.intp, count=len(entries))
+    code_points = numpy.frombuffer("".join(entries).encode("utf-32-le", "surrogatepass"), dtype=numpy.uint32)
+    return code_points, lengths, numpy.cumsum(lengths)
+
+
+def _parse_numbers(entries: list[str]):
+    """
+    Returns the values of `entries` as floats, along with a mask of the entries that float() accepts.
+    """
+    code_points, lengths, ends = _get_code_points(entries)
+    starts = ends - lengths
+
+    # The code points below "0" wrap around, so that a single comparison selects the digits.
+    digits = code_points - numpy.uint32(ord("0"))
+    non_digits = numpy.concatenate(([0], numpy.cumsum(digits > 9)))
+    is_simple = (lengths > 0) & (lengths <= _max_digits) & (non_digits[ends] == non_digits[starts])
+
+    # The value of an entry of digits is the sum of each digit times the power of ten of its position.  The powers
+    # and their sums are exact integers in floating point, since the entries have at most 15 digits.
+    entry_indices = numpy.repeat(numpy.arange(len(entries)), lengths)
+    is_simple_digit = is_simple[entry_indices]
+    exponents = numpy.where(is_simple_digit, ends[entry_indices] - 1 - numpy.arange(len(code_points)), 0)
+    weights = numpy.where(is_simple_digit, digits * numpy.power(10.0, exponents), 0.0)
+    values = numpy.bincount(entry_indices, weights=weights, minlength=len(entries))
+
+    # float() rejects empty entries, and accepts some others that aren't only digits, such as "1.5" or " 4 ".
+    is_valid = is_simple.copy()
+    for i in numpy.flatnonzero(~is_simple & (lengths > 0)):
+        try:
+            values[i] = float(entries[i])
+            is_valid[i] = True
+        except ValueError:
+            pass
+
+    return values, is_valid
+
+
+class ColumnarChecks:
+    """
+    Buffers rows into chunks, and runs the supported checks over each chunk as vectorized operations over its columns.
+    The failures are recorded in the checks themselves, so the failure messages are unchanged.
+    """
+    chunk_size = 10000
+    _value_tests = {
+        format_tests.ConsecutiveSpaces,
+        format_tests.LeadingAndTrailingSpaces,
+        format_tests.PrematureLineBreaks,
+        format_tests.TabCharacters,
+    }
+    _votes_tests = {format_tests.NegativeVotes, format_tests.NonIntegerVotes}
+
+    def __init__(self, headers: list[str], checks: list):
+        self._headers = headers
+        self._value_checks = [x for x in checks if type(x) in ColumnarChecks._value_tests]
+        self._votes_checks = [x for x in checks if type(x) in ColumnarChecks._votes_tests]
+        self._breakdown_checks = [x for x in checks if type(x) is VoteBreakdownTotals]
+        self._next_row = 1
+        self._rows = []
+
+    @property
+    def saturated(self) -> bool:
+        return not (self._value_checks or self._votes_checks or self._breakdown_checks)
+
+    @staticmethod
+    def supports(check) -> bool:
+        return type(check) in ColumnarChecks._value_tests | ColumnarChecks._votes_tests | {VoteBreakdownTotals}
+
+    def drop_saturated(self):
+        """
+        Stops running the checks that are saturated, including over the rows that are buffered.
+        """
+        self._value_checks = [x for x in self._value_checks if not x.saturated]
+        self._votes_checks = [x for x in self._votes_checks if not x.saturated]
+        self._breakdown_checks = [x for x in self._breakdown_checks if not x.saturated]
+
+    def finish(self):
+        if self._rows:
+            self._test_chunk()
+
+    def test(self, row: list[str]):
+        self._rows.append(row)
+        if len(self._rows) >= ColumnarChecks.chunk_size:
+            self._test_chunk()
+
+    def _test_chunk(self):
+        rows = self._rows
+        first_row = self._next_row
+        self._rows = []
+        self._next_row += len(rows)
+
+        row_lengths = numpy.fromiter(map(len, rows), dtype=numpy.intp, count=len(rows))
+        if self._value_checks:
+            self._test_values(rows, row_lengths, first_row)
+
+        # The vote checks only apply to the rows with a consistent number of columns.
+        row_numbers = first_row + numpy.flatnonzero(row_lengths == len(self._headers))
+        if len(row_numbers) == 0:
+            return
+        complete_rows = rows if len(row_numbers) == len(rows) else [rows[i - first_row] for i in row_numbers]
+
+        # The columns that several checks test are only parsed once.
+        numbers = {}
+
+        def get_numbers(index: int):
+            if index not in numbers:
+                numbers[index] = _parse_numbers(list(map(operator.itemgetter(index), complete_rows)))
+            return numbers[index]
+
+        for check in self._votes_checks:
+            self._test_votes(check, complete_rows, row_numbers, get_numbers)
+        for check in self._breakdown_checks:
+            self._test_breakdowns(check, complete_rows, row_numbers, get_numbers)
+
+    def _test_values(self, rows: list[list[str]], row_lengths, first_row: int):
+        entries = list(itertools.chain.from_iterable(rows))
+        code_points, lengths, ends = _get_code_points(entries)
+        if len(code_points) == 0:
+            return
+
+        whitespace_table = _get_whitespace_table()
+        is_whitespace = whitespace_table[numpy.minimum(code_points, len(whitespace_table) - 1)]
+
+        # The characters are matched across the whole chunk, and then mapped back to their entries.  Two whitespace
+        # characters are only consecutive within the same entry.
+        starts = ends - lengths
+        is_start = numpy.zeros(len(code_points) + 1, dtype=bool)
+        is_start[starts] = True
+        non_empty = lengths > 0
+        first_characters = is_whitespace[numpy.minimum(starts, len(code_points) - 1)]
+        last_characters = is_whitespace[numpy.maximum(ends - 1, 0)]
+        bad_characters = {
+            format_tests.ConsecutiveSpaces: is_whitespace[:-1] & is_whitespace[1:] & ~is_start[1:-1],
+            format_tests.PrematureLineBreaks: code_points == ord("\n"),
+            format_tests.TabCharacters: code_points == ord("\t"),
+        }
+
+        row_indices = numpy.repeat(numpy.arange(len(rows)), row_lengths)
+        for check in self._value_checks:
+            if type(check) is format_tests.LeadingAndTrailingSpaces:
+                bad_entries = numpy.flatnonzero(non_empty & (first_characters | last_characters))
+            else:
+                bad_entries = numpy.searchsorted(ends, numpy.flatnonzero(bad_characters[type(check)]), side="right")
+
+            for i in numpy.unique(row_indices[bad_entries]):
+                check.add_failure(first_row + int(i), rows[i])
+
+    @staticmethod
+    def _add_failures(check, complete_rows: list[list[str]], row_numbers, bad_rows):
+        # The exemptions only depend on the candidate, so they are only evaluated for the rows that fail.
+        for i in numpy.flatnonzero(bad_rows):
+            row = complete_rows[i]
+            if not check.is_exempt(None if check.candidate_index is None else row[check.candidate_index]):
+                check.add_failure(int(row_numbers[i]), row)
+
+    @staticmethod
+    def _test_votes(check, complete_rows: list[list[str]], row_numbers, get_numbers):
+        bad_rows = numpy.zeros(len(complete_rows), dtype=bool)
+        for index in check.indices_to_check:
+            values, is_valid = get_numbers(index)
+            if type(check) is format_tests.NegativeVotes:
+                bad_values = values < 0
+            else:
+                with numpy.errstate(invalid="ignore"):
+                    bad_values = ~(numpy.isfinite(values) & (numpy.floor(values) == values))
+            bad_rows |= is_valid & bad_values
+
+        ColumnarChecks._add_failures(check, complete_rows, row_numbers, bad_rows)
+
+    @staticmethod
+    def _test_breakdowns(check: VoteBreakdownTotals, complete_rows: list[list[str]], row_numbers, get_numbers):
+        if check.votes_index is None or not check.component_indices:
+            return
+
+        votes, has_votes = get_numbers(check.votes_index)
+
+        # The components are summed in the same order as the Python implementation, so that the sums are identical.
+        # Like in Python, components of inf and -inf add up to nan without a warning.
+        component_sums = numpy.zeros(len(complete_rows))
+        has_components = numpy.zeros(len(complete_rows), dtype=bool)
+        with numpy.errstate(invalid="ignore"):
+            for index in check.component_indices:
+                values, is_valid = get_numbers(index)
+                component_sums = component_sums + numpy.where(is_valid, values, 0.0)
+                has_components |= is_valid
+
+            if check.check_equality:
+                bad_totals = votes != component_sums
+            else:
+                bad_totals = votes < component_sums
+
+        ColumnarChecks._add_failures(check, complete_rows, row_numbers, has_votes & has_components & bad_totals)
@@ -0,0 +1,185 @@
+import itertools
+import json
+import os
+import sqlite3
+import tempfile
+from typing import Iterator
+
+from data_tests import files
+from data_tests.duplicate_entries import fingerprint, get_indices_to_hash
+from data_tests.row_context import is_empty
+
+
+class CrossFileDuplicateEntries:
+    """
+    The entries of a single file that are duplicated in other files.
+    """
+    def __init__(self, index: "CrossFileDuplicates", file_id: int, headers: list[str]):
+        self._index = index
+        self._file_id = file_id
+        self._headers = headers
+
+    @property
+    def failure_count(self) -> int:
+        return self._index.count_duplicates(self._file_id)
+
+    @property
+    def passed(self) -> bool:
+        return self.failure_count == 0
+
+    def examples(self, max_examples: int = -1) -> Iterator[tuple[int, list[str]]]:
+        duplicates = self._index.iter_duplicates(self._file_id)
+        if max_examples >= 0:
+            duplicates = itertools.islice(duplicates, max_examples)
+        for row_number, row, _, _ in duplicates:
+            yield row_number, row
+
+    def get_failure_message(self, max_examples: int = -1) -> str:
+        return "".join(self.iter_failure_message(max_examples=max_examples))
+
+    def iter_failure_message(self, max_examples: int = -1) -> Iterator[str]:
+        yield f"{self.failure_count} entries are duplicated in other files:\n\n" \
+              f"\tHeaders: {self._headers}:"
+        count = 0
+        for row_number, row, other_path, other_row_number in self._index.iter_duplicates(self._file_id):
+            if (max_examples >= 0) and (count >= max_examples):
+                yield f"\n\t[Truncated to {max_examples} examples]"
+                return
+            else:
+                yield f"\n\tRow {row_number}: {row} (also {other_path}, row {other_row_number})"
+                count += 1
+
+
+class CrossFileDuplicates:
+    """
+    Detects entries that are duplicated across files.  The fingerprints of the rows are stored in an on-disk SQLite
+    index, so the memory used doesn't depend on the number of files or rows.  Two entries are duplicates if they have
+    the same values in the same non-vote columns (i.e., the columns that `DuplicateEntries` hashes), irrespective of
+    the order of the columns.  Rows with an inconsistent number of columns, as well as empty rows, are ignored.
+    """
+    _batch_size = 10000
+
+    def __init__(self):
+        self._directory = tempfile.TemporaryDirectory()
+        self._connection = sqlite3.connect(os.path.join(self._directory.name, "index.sqlite3"))
+        self._connection.execute("PRAGMA journal_mode=OFF")
+        self._connection.execute("PRAGMA synchronous=OFF")
+        self._connection.execute("CREATE TABLE files (file_id INTEGER PRIMARY KEY, csv_file TEXT, path TEXT)")
+        self._connection.execute("CREATE TABLE fingerprints (fingerprint BLOB, file_id INTEGER, row_number INTEGER)")
+        self._connection.execute("CREATE TABLE candidates (file_id INTEGER, row_number INTEGER, key TEXT, row TEXT)")
+        self._connection.execute("CREATE TABLE duplicated_keys (key TEXT PRIMARY KEY) WITHOUT ROWID")
+        self._finalized = False
+
+    def add_file(self, csv_file: str, short_path: str) -> CrossFileDuplicateEntries:
+        """
+        Adds the fingerprints of the entries in `csv_file` to the index, and returns the entries that will hold the
+        duplicates once the index has been finalized.
+        """
+        rows = files.read_rows(csv_file)
+        headers = next(rows)
+        key_indices, key_signature = CrossFileDuplicates._get_key(headers)
+
+        with self._connection:
+            file_id = self._connection.execute("INSERT INTO files (csv_file, path) VALUES (?, ?)",
+                                               (csv_file, short_path)).lastrowid
+
+            batch = []
+            for row_number, row in enumerate(rows, start=2):
+                if len(row) == len(headers) and not is_empty(row):
+                    key = [key_signature]
+                    key.extend(row[i] for i in key_indices)
+                    batch.append((fingerprint(key), file_id, row_number))
+                    if len(batch) == CrossFileDuplicates._batch_size:
+                        self._connection.executemany("INSERT INTO fingerprints VALUES (?, ?, ?)", batch)
+                        batch.clear()
+            self._connection.executemany("INSERT INTO fingerprints VALUES (?, ?, ?)", batch)
+
+        return CrossFileDuplicateEntries(self, file_id, headers)
+
+    def close(self):
+        self._connection.close()
+        self._directory.cleanup()
+
+    def count_duplicates(self, file_id: int) -> int:
+        self._finalize()
+        return self._connection.execute(
+            "SELECT COUNT(*) FROM candidates JOIN duplicated_keys USING (key) WHERE file_id = ?", (file_id,)
+        ).fetchone()[0]
+
+    def iter_duplicates(self, file_id: int) -> Iterator[tuple[int, list[str], str, int]]:
+        """
+        Yields the number and contents of each duplicated row in the file, along with the path and the row number of
+        its first occurrence in another file.
+        """
+        self._finalize()
+        cursor = self._connection.execute(
+            "SELECT row_number, row, key FROM candidates JOIN duplicated_keys USING (key) WHERE file_id = ? "
+            "ORDER BY row_number",
+            (file_id,)
+        )
+        for row_number, row, key in cursor:
+            other_path, other_row_number = self._connection.execute(
+                "SELECT path, row_number FROM candidates JOIN files USING (file_id) WHERE key = ? AND file_id != ? "
+                "ORDER BY file_id, row_number LIMIT 1",
+                (key, file_id)
+            ).fetchone()
+            yield row_number, json.loads(row), other_path, other_row_number
+
+    def _finalize(self):
+        if self._finalized:
+            return
+        self._finalized = True
+
+        with self._connection:
+            # Rows whose fingerprints appear in several files are candidates.  Their actual entries are read from the
+            # files and compared, so that colliding fingerprints aren't reported as duplicates.
+            self._connection.execute(
+                "CREATE TABLE duplicated_fingerprints (fingerprint BLOB PRIMARY KEY) WITHOUT ROWID"
+            )
+            self._connection.execute(
+                "INSERT INTO duplicated_fingerprints SELECT fingerprint FROM fingerprints GROUP BY fingerprint "
+                "HAVING COUNT(DISTINCT file_id) > 1"
+            )
+
+            candidates = self._connection.execute(
+                "SELECT file_id, row_number FROM fingerprints JOIN duplicated_fingerprints USING (fingerprint) "
+                "ORDER BY file_id, row_number"
+            )
+            for file_id, file_candidates in itertools.groupby(candidates, key=lambda x: x[0]):
+                self._add_candidates(file_id, {x[1] for x in file_candidates})
+
+            self._connection.execute(
+                "INSERT INTO duplicated_keys SELECT key FROM candidates GROUP BY key HAVING COUNT(DISTINCT file_id) > 1"
+            )
+            self._connection.execute("CREATE INDEX candidates_by_file ON candidates (file_id, row_number)")
+            self._connection.execute("CREATE INDEX candidates_by_key ON candidates (key, file_id, row_number)")
+
+    def _add_candidates(self, file_id: int, candidate_rows: set[int]):
+        csv_file = self._connection.execute("SELECT csv_file FROM files WHERE file_id = ?", (file_id,)).fetchone()[0]
+
+        rows = files.read_rows(csv_file)
+        headers = next(rows)
+        key_indices, key_signature = CrossFileDuplicates._get_key(headers)
+
+        last_row = max(candidate_rows)
+        batch = []
+        for row_number, row in enumerate(rows, start=2):
+            if row_number > last_row:
+                break
+            if row_number in candidate_rows:
+                key = [key_signature]
+                key.extend(row[i] for i in key_indices)
+                batch.append((file_id, row_number, repr(key), json.dumps(row)))
+                if len(batch) == CrossFileDuplicates._batch_size:
+                    self._connection.executemany("INSERT INTO candidates VALUES (?, ?, ?, ?)", batch)
+                    batch.clear()
+        self._connection.executemany("INSERT INTO candidates VALUES (?, ?, ?, ?)", batch)
+
+    @staticmethod
+    def _get_key(headers: list[str]) -> tuple[list[int], str]:
+        # The key columns are ordered by name, and the names are part of the key, so that files with the same columns
+        # in a different order can be compared, but files with different columns can't.
+        lowered_headers = [x.strip().lower() for x in headers]
+        key_indices = sorted(get_indices_to_hash(headers), key=lambda i: lowered_headers[i])
+        key_signature = "\x1e".join(lowered_headers[i] for i in key_indices)
+        return key_indices, key_signature
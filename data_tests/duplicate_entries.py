@@ -1,74 +1,355 @@
-import re
+import hashlib
+import itertools
+from array import array
+from typing import Iterable, Iterator, Optional
 
+from data_tests import files, schemas
+from data_tests.row_context import RowContext, is_empty
 
-class DuplicateEntries:
-    _non_whitespace_regex = re.compile(r"\S")
+_fingerprint_key = b"openelections-data-tests"
+
+
+def fingerprint(entries: Iterable[str]) -> bytes:
+    """
+    Returns a 128-bit fingerprint of `entries` that is stable across processes, so that it can be persisted and compared
+    between workers.  Distinct entries can share a fingerprint (e.g., if an entry contains the separator character), so
+    a matching fingerprint should be verified against the entries themselves.
+    """
+    return hashlib.blake2b("\x1f".join(entries).encode(), digest_size=16, key=_fingerprint_key).digest()
+
+
+def get_indices_to_hash(headers: list[str]) -> list[int]:
+    """
+    Returns the indices of the columns that identify an entry, which are all the columns except the vote columns.
+    """
+    return list(schemas.get_plan(headers).indices_to_hash)
+
+
+def _rehash(row_fingerprint: bytes) -> bytes:
+    return hashlib.blake2b(row_fingerprint, digest_size=16, key=_fingerprint_key).digest()
+
+
+class _FingerprintIndex:
+    """
+    An open addressing hash table that maps row fingerprints to the number of the first row with that fingerprint.  The
+    entries are stored in typed arrays, so the memory used per row is a small constant.
+    """
+    _initial_capacity = 1 << 10
+
+    def __init__(self):
+        capacity = _FingerprintIndex._initial_capacity
+        self._low_words = array("Q", bytes(8 * capacity))
+        self._high_words = array("Q", bytes(8 * capacity))
+        # A row number of 0 marks an empty slot, since the row numbers start at 1.
+        self._row_numbers = array("q", bytes(8 * capacity))
+        self._mask = capacity - 1
+        self._size = 0
+
+    def add(self, row_fingerprint: bytes, row_number: int) -> int:
+        """
+        Adds `row_fingerprint` to the index if it isn't present, and returns the number of the first row with that
+        fingerprint.
+        """
+        return self._add(int.from_bytes(row_fingerprint[:8], "little"), int.from_bytes(row_fingerprint[8:], "little"),
+                         row_number)
+
+    def add_words(self, low_word: int, high_word: int, row_number: int) -> int:
+        """
+        Like `add`, for a fingerprint that has been split into its two words, e.g., by `items`.
+        """
+        return self._add(low_word, high_word, row_number)
+
+    def items(self) -> Iterator[tuple[int, int, int]]:
+        """
+        Yields the two words of each fingerprint in the index, and the number of the first row with that fingerprint.
+        """
+        for low_word, high_word, row_number in zip(self._low_words, self._high_words, self._row_numbers):
+            if row_number != 0:
+                yield low_word, high_word, row_number
+
+    def _add(self, low_word: int, high_word: int, row_number: int) -> int:
+        index = low_word & self._mask
+        while self._row_numbers[index] != 0:
+            if self._low_words[index] == low_word and self._high_words[index] == high_word:
+                return self._row_numbers[index]
+            index = (index + 1) & self._mask
+
+        self._low_words[index] = low_word
+        self._high_words[index] = high_word
+        self._row_numbers[index] = row_number
+        self._size += 1
+        if 2 * self._size > self._mask:
+            self._grow()
+
+        return row_number
 
-    def __init__(self, headers: list[str]):
+    def _grow(self):
+        low_words = self._low_words
+        high_words = self._high_words
+        row_numbers = self._row_numbers
+
+        capacity = 2 * (self._mask + 1)
+        self._low_words = array("Q", bytes(8 * capacity))
+        self._high_words = array("Q", bytes(8 * capacity))
+        self._row_numbers = array("q", bytes(8 * capacity))
+        self._mask = capacity - 1
+        self._size = 0
+
+        for low_word, high_word, row_number in zip(low_words, high_words, row_numbers):
+            if row_number != 0:
+                self._add(low_word, high_word, row_number)
+
+
+class DuplicateEntries:
+    def __init__(self, headers: list[str], csv_file: Optional[str] = None):
+        """
+        If `csv_file` is provided, only the fingerprints and numbers of the rows are kept in memory, and the duplicate
+        rows are read again from `csv_file` when the failure message is built.  Otherwise, every row is kept in memory.
+        """
         super().__init__()
+        self._csv_file = csv_file
         self._current_row = 0
+        self._duplicate_count = 0
         self._hash_to_row_map = {}
         self._passed = True
         self._headers = headers
 
-        indices_to_hash = []
-        for i, x in enumerate(self._headers):
-            lowered_header = x.lower()
-            not_vote_column = "votes" not in lowered_header
-            not_vote_column &= lowered_header not in {"absentee", "early_voting", "election_day", "mail", "provisional"}
-            if not_vote_column:
-                indices_to_hash.append(i)
+        # The compact representation of the duplicates is a pair of the first row and the duplicate row.  The pairs are
+        # only candidates until they have been verified against the rows in the file.
+        self._fingerprint_index = _FingerprintIndex()
+        self._duplicate_first_rows = array("q")
+        self._duplicate_rows = array("q")
+        self._example_rows = {}
+        self._verified = True
+
+        self._indices_to_hash = schemas.get_plan(headers).indices_to_hash
+
+        # The number of duplicates after which the check stops testing rows, or -1 to test every row.
+        self.saturate_after = -1
+
+        # The number of example rows that are kept when the duplicates are verified, or -1 to keep every duplicate row.
+        self.max_examples = -1
+
+    @property
+    def failure_count(self) -> int:
+        if self._csv_file is not None:
+            self._verify_duplicates()
+            return len(self._duplicate_rows)
+
+        num_duplicates = 0
+        for _, rows in self._hash_to_row_map.items():
+            if len(rows) > 1:
+                num_duplicates += len(rows) - 1
 
-        self._indices_to_hash = indices_to_hash
+        return num_duplicates
 
     @property
     def passed(self) -> bool:
+        if self._csv_file is not None:
+            self._verify_duplicates()
         return self._passed
 
-    def _hash_row(self, row: list[str]) -> int:
+    @property
+    def saturated(self) -> bool:
+        """
+        Whether `saturate_after` duplicates have been found.  The candidate duplicates are verified first, by reading
+        the file up to the last candidate, so that a fingerprint collision doesn't stop the check early.
+        """
+        if self.saturate_after < 0:
+            return False
+        if self._csv_file is None:
+            return self.saturate_after <= self._duplicate_count
+        if len(self._duplicate_rows) < self.saturate_after:
+            return False
+
+        self._verify_duplicates()
+        return self.saturate_after <= len(self._duplicate_rows)
+
+    def get_chunk_state(self) -> tuple[array, array, array, array, array]:
+        """
+        Returns the fingerprints of a chunk of the file, with the number of the first row of each, and the candidate
+        duplicates of the chunk, to be merged into the check of the whole file.  The duplicates are verified once they
+        have been merged.
+        """
+        low_words, high_words, row_numbers = array("Q"), array("Q"), array("q")
+        for low_word, high_word, row_number in self._fingerprint_index.items():
+            low_words.append(low_word)
+            high_words.append(high_word)
+            row_numbers.append(row_number)
+
+        return low_words, high_words, row_numbers, self._duplicate_first_rows, self._duplicate_rows
+
+    def merge_chunk_state(self, state: tuple[array, array, array, array, array], row_offset: int):
+        low_words, high_words, row_numbers, duplicate_first_rows, duplicate_rows = state
+
+        # The first rows of the chunk that aren't the first rows of the file are duplicates of earlier rows, and so are
+        # the duplicates of the chunk, whose first rows are mapped to the first rows of the file.
+        chunk_first_rows = set(duplicate_first_rows)
+        first_rows = {}
+        for low_word, high_word, row_number in zip(low_words, high_words, row_numbers):
+            first_row = self._fingerprint_index.add_words(low_word, high_word, row_number + row_offset)
+            if first_row != row_number + row_offset:
+                self._duplicate_first_rows.append(first_row)
+                self._duplicate_rows.append(row_number + row_offset)
+            if row_number in chunk_first_rows:
+                first_rows[row_number] = first_row
+
+        for first_row, row_number in zip(duplicate_first_rows, duplicate_rows):
+            self._duplicate_first_rows.append(first_rows[first_row])
+            self._duplicate_rows.append(row_number + row_offset)
+
+        if len(self._duplicate_rows) > 0:
+            self._passed = False
+            self._verified = False
+
+    def _get_entries_to_hash(self, row: list[str]) -> list[str]:
         if len(row) == len(self._headers):
-            entries_to_hash = (row[i] for i in self._indices_to_hash)
+            return [row[i] for i in self._indices_to_hash]
+        else:
+            return row
+
+    def _verify_duplicates(self):
+        """
+        Compares the entries of the candidate duplicates in the file, and discards the candidates whose fingerprints
+        collide with the fingerprint of a different row.
+        """
+        if self._verified:
+            return
+        self._verified = True
+
+        first_rows = dict(zip(self._duplicate_rows, self._duplicate_first_rows))
+        first_row_entries = dict.fromkeys(self._duplicate_first_rows)
+        last_row = max(self._duplicate_rows)
+
+        # Rows that collide with their first row are compared with each other instead.
+        colliding_rows = {}
+
+        # The rows that the messages show as examples are kept, so that the file isn't read again to build them.
+        # Unless some fingerprints collide, they are the first rows in the order of the candidates.
+        example_row_numbers = self._get_duplicate_row_numbers()
+        if self.max_examples >= 0:
+            example_row_numbers = example_row_numbers[:self.max_examples]
+        example_row_numbers = set(example_row_numbers)
+        self._example_rows = {}
+
+        duplicate_first_rows = array("q")
+        duplicate_rows = array("q")
+        for row_number, row in enumerate(files.read_rows(self._csv_file), start=1):
+            if row_number > last_row:
+                break
+
+            if row_number in example_row_numbers:
+                self._example_rows[row_number] = row
+            if row_number in first_row_entries:
+                first_row_entries[row_number] = self._get_entries_to_hash(row)
+
+            if row_number in first_rows:
+                entries = self._get_entries_to_hash(row)
+                if entries == first_row_entries[first_rows[row_number]]:
+                    duplicate_first_rows.append(first_rows[row_number])
+                    duplicate_rows.append(row_number)
+                else:
+                    first_row = colliding_rows.setdefault(tuple(entries), row_number)
+                    if first_row != row_number:
+                        duplicate_first_rows.append(first_row)
+                        duplicate_rows.append(row_number)
+
+        self._duplicate_first_rows = duplicate_first_rows
+        self._duplicate_rows = duplicate_rows
+        self._passed = len(duplicate_rows) == 0
+
+    def _get_duplicate_row_numbers(self) -> list[int]:
+        # Order the duplicates by their first row, and then by their own row, which matches the order in which the
+        # duplicates are reported when every row is kept in memory.
+        order = sorted(range(len(self._duplicate_rows)), key=self._duplicate_first_rows.__getitem__)
+
+        row_numbers = []
+        previous_first_row = None
+        for i in order:
+            first_row = self._duplicate_first_rows[i]
+            if first_row != previous_first_row:
+                row_numbers.append(first_row)
+                previous_first_row = first_row
+            row_numbers.append(self._duplicate_rows[i])
+
+        return row_numbers
+
+    def _iter_duplicates(self, max_examples: int) -> Iterator[tuple[int, Optional[list[str]]]]:
+        if self._csv_file is None:
+            for row_map in self._hash_to_row_map.values():
+                if len(row_map) > 1:
+                    yield from row_map.items()
         else:
-            entries_to_hash = row
+            self._verify_duplicates()
+            row_numbers = self._get_duplicate_row_numbers()
+            rows_to_read = set(row_numbers)
+            if max_examples >= 0:
+                # One more row number than the examples is needed to know whether the examples are truncated.
+                row_numbers = row_numbers[:max_examples + 1]
+                rows_to_read = set(row_numbers[:max_examples])
 
-        hashed_entries = (hash(x) for x in entries_to_hash)
-        return hash(tuple(hashed_entries))
+            # The rows are only read again if they weren't kept when the duplicates were verified, e.g., if some
+            # fingerprints collided, or more examples are requested than were kept.
+            rows = {x: self._example_rows[x] for x in rows_to_read if x in self._example_rows}
+            if len(rows) < len(rows_to_read):
+                for row_number, row in enumerate(files.read_rows(self._csv_file), start=1):
+                    if row_number in rows_to_read:
+                        rows[row_number] = row
+                        if len(rows) == len(rows_to_read):
+                            break
 
-    @staticmethod
-    def _is_empty(row: list) -> bool:
-        has_content = False
-        for entry in row:
-            has_content |= bool(DuplicateEntries._non_whitespace_regex.search(entry))
+            for row_number in row_numbers:
+                yield row_number, rows.get(row_number)
 
-        return not has_content
+    def examples(self, max_examples: int = -1) -> Iterator[tuple[int, list[str]]]:
+        """
+        Yields the number and contents of up to `max_examples` of the duplicate rows, including the first row of each
+        group of duplicates.
+        """
+        return itertools.islice(self._iter_duplicates(max_examples), max_examples if max_examples >= 0 else None)
 
     def get_failure_message(self, max_examples: int = -1) -> str:
-        num_duplicates = 0
-        for _, rows in self._hash_to_row_map.items():
-            if len(rows) > 1:
-                num_duplicates += len(rows) - 1
+        return "".join(self.iter_failure_message(max_examples=max_examples))
 
-        message = f"{num_duplicates} duplicate entries detected:\n\n" \
-                  f"\tHeaders: {self._headers}:"
+    def iter_failure_message(self, max_examples: int = -1) -> Iterator[str]:
+        yield f"{self.failure_count} duplicate entries detected:\n\n" \
+              f"\tHeaders: {self._headers}:"
         count = 0
-        for row_hash, row_map in self._hash_to_row_map.items():
-            if len(row_map) > 1:
-                for row_number, row in row_map.items():
-                    if (max_examples >= 0) and (count >= max_examples):
-                        message += f"\n\t[Truncated to {max_examples} examples]"
-                        return message
-                    else:
-                        message += f"\n\tRow {row_number}: {row}"
-                        count += 1
-
-        return message
+        for row_number, row in self._iter_duplicates(max_examples):
+            if (max_examples >= 0) and (count >= max_examples):
+                yield f"\n\t[Truncated to {max_examples} examples]"
+                return
+            else:
+                yield f"\n\tRow {row_number}: {row}"
+                count += 1
 
     def test(self, row: list):
+        self._test(row, is_empty(row))
+
+    def test_context(self, context: RowContext):
+        self._test(context.row, context.is_empty)
+
+    def _test(self, row: list, row_is_empty: bool):
         self._current_row += 1
-        if not DuplicateEntries._is_empty(row):
-            row_hash = self._hash_row(row)
-            if row_hash in self._hash_to_row_map:
-                self._passed = False
-                self._hash_to_row_map[row_hash][self._current_row] = row
+        if not row_is_empty:
+            entries = self._get_entries_to_hash(row)
+            row_fingerprint = fingerprint(entries)
+            if self._csv_file is not None:
+                first_row = self._fingerprint_index.add(row_fingerprint, self._current_row)
+                if first_row != self._current_row:
+                    self._passed = False
+                    self._verified = False
+                    self._duplicate_first_rows.append(first_row)
+                    self._duplicate_rows.append(self._current_row)
             else:
-                self._hash_to_row_map[row_hash] = {self._current_row: row}
+                # Verify the rows that share a fingerprint, and move on to another fingerprint if they collide.
+                while row_fingerprint in self._hash_to_row_map:
+                    row_map = self._hash_to_row_map[row_fingerprint]
+                    if self._get_entries_to_hash(next(iter(row_map.values()))) == entries:
+                        self._passed = False
+                        self._duplicate_count += 1
+                        row_map[self._current_row] = row
+                        return
+                    row_fingerprint = _rehash(row_fingerprint)
+
+                self._hash_to_row_map[row_fingerprint] = {self._current_row: row}
@@ -0,0 +1,255 @@
+import os
+import pickle
+import random
+import tempfile
+from typing import Iterable, Iterator
+
+
+class FailureCollector:
+    """
+    Collects the failing rows of a check.  Every failure is counted, but only the first `max_examples` failures are kept
+    as examples, or a uniform sample of them if `sample` is set.  If every failure is kept, the failures spill over from
+    memory to a temporary file in batches of `batch_size`, so the memory used doesn't depend on the number of failures.
+    """
+    batch_size = 10000
+
+    def __init__(self, max_examples: int = -1, sample: bool = False, saturate_after: int = -1):
+        self._count = 0
+        self._examples = []
+        self._last_row_number = None
+        self._max_examples = max_examples
+        self._random = random.Random(0) if sample else None
+        self._saturate_after = saturate_after
+        self._spill_file = None
+
+    def __len__(self) -> int:
+        return self._count
+
+    @property
+    def saturated(self) -> bool:
+        """
+        Whether `saturate_after` failures have been added, after which the check stops testing rows.  Sampled failures
+        are never saturated, since the sample depends on every failure.
+        """
+        return self._random is None and 0 <= self._saturate_after <= self._count
+
+    def add(self, row_number: int, row: list[str]):
+        # The rows are tested in order, so a row that fails several times is only counted once.
+        if row_number == self._last_row_number:
+            return
+        self._last_row_number = row_number
+        self._count += 1
+
+        if self._max_examples < 0:
+            self._examples.append((row_number, row))
+            if len(self._examples) == FailureCollector.batch_size:
+                if self._spill_file is None:
+                    self._spill_file = tempfile.TemporaryFile()
+                self._spill_file.seek(0, 2)
+                pickle.dump(self._examples, self._spill_file, protocol=pickle.HIGHEST_PROTOCOL)
+                self._examples = []
+        elif len(self._examples) < self._max_examples:
+            self._examples.append((row_number, row))
+        elif self._random is not None:
+            # Reservoir sampling, which keeps each of the failures with the same probability.
+            index = self._random.randrange(self._count)
+            if index < self._max_examples:
+                self._examples[index] = (row_number, row)
+
+    def close(self):
+        """
+        Removes the temporary file that the failures spilled over to, once they have been reported.
+        """
+        if self._spill_file is not None:
+            self._spill_file.close()
+            self._spill_file = None
+
+    def examples(self, max_examples: int = -1) -> Iterator[tuple[int, list[str]]]:
+        """
+        Yields the row number and the contents of up to `max_examples` of the kept failures, in row order.  If
+        `max_examples` is negative, every kept failure is yielded.
+        """
+        if max_examples < 0:
+            max_examples = self._count
+
+        if self._spill_file is not None:
+            # The batches are read in the order that they were spilled, from the start of the file.
+            position = 0
+            for _ in range((self._count - len(self._examples)) // FailureCollector.batch_size):
+                self._spill_file.seek(position)
+                batch = pickle.load(self._spill_file)
+                position = self._spill_file.tell()
+                yield from batch[:max_examples]
+                max_examples -= len(batch)
+                if max_examples <= 0:
+                    return
+
+        examples = self._examples if self._random is None else sorted(self._examples)
+        yield from examples[:max_examples]
+
+    def get_chunk_state(self) -> tuple[int, list[tuple[int, list[str]]]]:
+        """
+        Returns the number of failures and the kept failures, to be merged into the collector of the whole file.
+        """
+        return self._count, list(self.examples())
+
+    def merge_chunk_state(self, state: tuple[int, list[tuple[int, list[str]]]], row_offset: int):
+        """
+        Adds the failures of a chunk of the file whose rows follow the rows that have been tested, numbering its rows
+        after `row_offset`.  Sampled failures can't be merged, since the samples of the chunks aren't uniform samples of
+        the failures of the file.
+        """
+        if self._random is not None:
+            raise ValueError("sampled failures can't be merged")
+
+        count, examples = state
+        total_count = self._count + count
+        for row_number, row in examples:
+            if 0 <= self._max_examples <= len(self._examples):
+                break
+            self.add(row_number + row_offset, row)
+        self._count = total_count
+
+    def limit(self, max_examples: int, sample: bool = False, saturate_after: int = -1):
+        """
+        Keeps only `max_examples` failures as examples, or every failure if `max_examples` is negative, and saturates
+        the collector after `saturate_after` failures, or never if it's negative.  The limit must be set before any
+        failures are added.
+        """
+        if self._count:
+            raise ValueError("the limit must be set before any failures are added")
+        self.close()
+        self.__init__(max_examples, sample=sample, saturate_after=saturate_after)
+
+
+class FailureCollectingCheck:
+    """
+    A check that collects its failing rows in a `FailureCollector`.  Its failure message is a summary of the failures,
+    followed by the failing rows that are kept as examples.
+    """
+    _failures: FailureCollector = None
+
+    @property
+    def failures(self) -> FailureCollector:
+        return self._failures
+
+    @property
+    def failure_count(self) -> int:
+        return len(self._failures)
+
+    @property
+    def passed(self) -> bool:
+        return len(self._failures) == 0
+
+    @property
+    def saturated(self) -> bool:
+        return self._failures.saturated
+
+    def add_failure(self, row_number: int, row: list[str]):
+        self._failures.add(row_number, row)
+
+    def close(self):
+        self._failures.close()
+
+    def examples(self, max_examples: int = -1) -> Iterator[tuple[int, list[str]]]:
+        return self._failures.examples(max_examples)
+
+    def get_failure_message(self, max_examples: int = -1) -> str:
+        return "".join(self.iter_failure_message(max_examples=max_examples))
+
+    def iter_failure_message(self, max_examples: int = -1) -> Iterator[str]:
+        yield self._get_failure_summary()
+
+        count = 0
+        for row_number, row in self._failures.examples(max_examples):
+            yield self._format_example(row_number, row)
+            count += 1
+
+        if count < len(self._failures):
+            yield f"\n\t[Truncated to {count} examples]"
+
+    def _format_example(self, row_number: int, row: list[str]) -> str:
+        return f"\n\tRow {row_number}: {row}"
+
+    def _get_failure_summary(self) -> str:
+        raise NotImplementedError()
+
+
+class SpooledMessage:
+    """
+    A failure message that is written piece by piece into memory, and spills over to a temporary file once it's longer
+    than `max_size` characters, so that long messages never exist as a single string.  A message that has spilled over
+    is sent to other processes as the path of its file, which is removed once the message is closed.
+    """
+    max_size = 1 << 20
+
+    def __init__(self, pieces: Iterable[str] = ()):
+        self._length = 0
+        self._path = None
+        self._text = None
+
+        buffer = []
+        spill_file = None
+        for piece in pieces:
+            self._length += len(piece)
+            if spill_file is not None:
+                spill_file.write(piece)
+            else:
+                buffer.append(piece)
+                if self._length > SpooledMessage.max_size:
+                    spill_file = self._create_spill_file()
+                    spill_file.writelines(buffer)
+                    buffer = None
+
+        if spill_file is None:
+            self._text = "".join(buffer)
+        else:
+            spill_file.close()
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, (SpooledMessage, str)):
+            return str(self) == str(other)
+        return NotImplemented
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __str__(self) -> str:
+        return "".join(self.chunks())
+
+    def chunks(self, chunk_size: int = 1 << 16) -> Iterator[str]:
+        """
+        Yields the message in chunks of about `chunk_size` characters.
+        """
+        if self._path is None:
+            yield self._text
+        else:
+            with open(self._path, "r", encoding="utf-8", errors="surrogatepass", newline="") as spill_file:
+                while chunk := spill_file.read(chunk_size):
+                    yield chunk
+
+    def close(self):
+        """
+        Removes the file of a message that has spilled over, after which the message is empty.  Closing a message more
+        than once has no effect.
+        """
+        if self._path is not None:
+            os.remove(self._path)
+            self._length = 0
+            self._path = None
+            self._text = ""
+
+    def spill(self):
+        """
+        Moves a message that is kept in memory to a temporary file, e.g., while it waits to be reported.
+        """
+        if self._path is None and self._length > 0:
+            with self._create_spill_file() as spill_file:
+                spill_file.write(self._text)
+            self._text = None
+
+    def _create_spill_file(self):
+        spill_file = tempfile.NamedTemporaryFile("w", encoding="utf-8", errors="surrogatepass", suffix=".txt",
+                                                 delete=False)
+        self._path = spill_file.name
+        return spill_file
@@ -0,0 +1,310 @@
+import bz2
+import codecs
+import contextlib
+import csv
+import fnmatch
+import gzip
+import io
+import locale
+import lzma
+import mmap
+import os
+import queue
+import re
+import threading
+import zipfile
+from typing import BinaryIO, Iterable, Iterator, Optional
+
+_archive_regex = re.compile(r"\.zip[/\\]", re.IGNORECASE)
+_year_regex = re.compile(r"[0-9]{4}")
+
+# The suffixes of the compressed CSV files, and the functions that open them as decompressed binary streams.
+DECOMPRESSORS = {".csv.bz2": bz2.open, ".csv.gz": gzip.open, ".csv.xz": lzma.open}
+
+
+def is_csv_file(path: str) -> bool:
+    """
+    Returns whether `path` names a CSV file, either as it is or compressed.
+    """
+    lowered_path = path.lower()
+    return lowered_path.endswith(".csv") or lowered_path.endswith(tuple(DECOMPRESSORS))
+
+
+def is_compressed(csv_file: str) -> bool:
+    """
+    Returns whether `csv_file` is a compressed file, a ZIP archive, or a member of a ZIP archive.
+    """
+    lowered_path = csv_file.lower()
+    return lowered_path.endswith((*DECOMPRESSORS, ".zip")) or split_archive_path(csv_file)[1] is not None
+
+
+def split_archive_path(csv_file: str) -> tuple[str, Optional[str]]:
+    """
+    Splits the path of a member of a ZIP archive, e.g., "2020/a.zip/b.csv", into the path of the archive and the name
+    of the member.  The name of the member is None if `csv_file` isn't in an archive.
+    """
+    for match in _archive_regex.finditer(csv_file):
+        archive = csv_file[:match.end() - 1]
+        if os.path.isfile(archive):
+            return archive, csv_file[match.end():].replace(os.sep, "/")
+
+    return csv_file, None
+
+
+def list_archive(archive: str) -> Iterator[str]:
+    """
+    Yields the paths of the CSV members of the ZIP archive `archive`, in sorted order, skipping hidden members.  The
+    path of the archive itself is yielded instead if it can't be read, so that the error is reported when it's tested.
+    """
+    try:
+        with zipfile.ZipFile(archive) as archive_data:
+            members = sorted(x for x in archive_data.namelist() if x.lower().endswith(".csv"))
+    except (OSError, zipfile.BadZipFile):
+        yield archive
+        return
+
+    for member in members:
+        if not any(x.startswith(".") for x in member.split("/")):
+            yield os.path.join(archive, *member.split("/"))
+
+
+def expand_archive(path: str) -> Iterator[str]:
+    """
+    Yields the paths of the CSV members of `path` if it's a ZIP archive, or `path` itself otherwise.
+    """
+    if path.lower().endswith(".zip"):
+        yield from list_archive(path)
+    else:
+        yield path
+
+
+def get_stored_size(csv_file: str) -> int:
+    """
+    Returns the number of bytes that `csv_file` takes on disk, which is its compressed size if it's compressed or a
+    member of a ZIP archive, or 0 if it can't be read.
+    """
+    archive, member = split_archive_path(csv_file)
+    try:
+        if member is None:
+            return os.path.getsize(csv_file)
+        with zipfile.ZipFile(archive) as archive_data:
+            return archive_data.getinfo(member).compress_size
+    except (KeyError, OSError, zipfile.BadZipFile):
+        return 0
+
+
+@contextlib.contextmanager
+def open_raw(csv_file: str) -> Iterator[BinaryIO]:
+    """
+    Opens the contents of `csv_file` as they are stored, which are compressed for compressed files.  The members of
+    ZIP archives are decompressed, since an archive can hold several members.
+    """
+    archive, member = split_archive_path(csv_file)
+    if member is None:
+        with open(csv_file, "rb") as raw_data:
+            yield raw_data
+    else:
+        with zipfile.ZipFile(archive) as archive_data, archive_data.open(member) as member_data:
+            yield member_data
+
+
+@contextlib.contextmanager
+def open_decompressed(csv_file: str) -> Iterator[BinaryIO]:
+    """
+    Opens the decompressed contents of the compressed file or ZIP archive member `csv_file` as a binary stream.
+    """
+    archive, member = split_archive_path(csv_file)
+    if member is not None:
+        with open_raw(csv_file) as member_data:
+            yield member_data
+    elif csv_file.lower().endswith(".zip"):
+        # Archives are only tested as they are if they couldn't be listed.
+        with zipfile.ZipFile(csv_file):
+            raise ValueError(f"{csv_file} is an archive, whose members are tested instead")
+    else:
+        decompressor = next(x for suffix, x in DECOMPRESSORS.items() if csv_file.lower().endswith(suffix))
+        with decompressor(csv_file, "rb") as decompressed_data:
+            yield decompressed_data
+
+
+class DecompressedStream(io.RawIOBase):
+    """
+    The decompressed contents of a compressed file, which are decompressed in a background thread while the previous
+    chunks are parsed and tested.  The decompressors release the GIL, so the decompression overlaps the checks.  At most
+    `queue_size` chunks are decompressed ahead of the reads, so the memory used doesn't depend on the size of the file.
+    """
+    chunk_size = 1 << 20
+    queue_size = 4
+
+    def __init__(self, csv_file: str):
+        super().__init__()
+        self._chunk = memoryview(b"")
+        self._end_of_file = False
+        self._queue = queue.Queue(maxsize=DecompressedStream.queue_size)
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._decompress, args=(csv_file,), daemon=True)
+        self._thread.start()
+
+    def close(self):
+        if not self.closed:
+            self._stopped.set()
+            self._thread.join()
+        super().close()
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        if not self._chunk:
+            if self._end_of_file:
+                return 0
+
+            chunk = self._queue.get()
+            if isinstance(chunk, Exception):
+                self._end_of_file = True
+                raise chunk
+            if not chunk:
+                self._end_of_file = True
+                return 0
+            self._chunk = memoryview(chunk)
+
+        size = min(len(buffer), len(self._chunk))
+        buffer[:size] = self._chunk[:size]
+        self._chunk = self._chunk[size:]
+        return size
+
+    def _decompress(self, csv_file: str):
+        # Errors are raised by the reads, so that they are reported against the file.
+        try:
+            with open_decompressed(csv_file) as decompressed_data:
+                while not self._stopped.is_set():
+                    chunk = decompressed_data.read(DecompressedStream.chunk_size)
+                    self._put(chunk)
+                    if not chunk:
+                        return
+        except Exception as exception:
+            self._put(exception)
+
+    def _put(self, item):
+        # Waiting for the reads is interrupted if the stream is closed before it's read to the end.
+        while not self._stopped.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+
+@contextlib.contextmanager
+def map_file(csv_file: str) -> Iterator[Optional[mmap.mmap]]:
+    """
+    Memory-maps the raw contents of `csv_file`, so that they can be scanned without being decoded or parsed.  None is
+    yielded instead if the file is empty or compressed, or if the files aren't read as UTF-8, since the scans assume
+    that encoding.
+    """
+    if codecs.lookup(locale.getpreferredencoding(False)).name != "utf-8" or is_compressed(csv_file):
+        yield None
+        return
+
+    with open(csv_file, "rb") as raw_data:
+        if os.fstat(raw_data.fileno()).st_size == 0:
+            yield None
+            return
+
+        with mmap.mmap(raw_data.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            yield data
+
+
+def read_rows(csv_file: str) -> Iterator[list[str]]:
+    """
+    Yields the parsed rows of `csv_file`, starting with the headers.  Compressed files are decompressed as they are
+    read.
+    """
+    if is_compressed(csv_file):
+        csv_data = io.TextIOWrapper(io.BufferedReader(DecompressedStream(csv_file)),
+                                    encoding=locale.getpreferredencoding(False))
+    else:
+        csv_data = open(csv_file, "r")
+
+    with csv_data:
+        yield from csv.reader(csv_data)
+
+
+def matches(short_path: str, patterns: Iterable[str]) -> bool:
+    """
+    Returns whether `short_path`, with its components separated by slashes, matches any of the glob `patterns`.
+    """
+    return any(fnmatch.fnmatch(short_path, x) for x in patterns)
+
+
+def parse_years(years: str) -> set[str]:
+    """
+    Parses a comma-separated list of years and ranges of years, e.g., "2016-2018,2022", into a set of years.
+    """
+    parsed_years = set()
+    for part in years.split(","):
+        first_year, separator, last_year = part.strip().partition("-")
+        if not separator:
+            last_year = first_year
+        if not _year_regex.fullmatch(first_year) or not _year_regex.fullmatch(last_year) or first_year > last_year:
+            raise ValueError(f"invalid years: {part.strip()!r}")
+        parsed_years.update(str(x) for x in range(int(first_year), int(last_year) + 1))
+
+    return parsed_years
+
+
+def walk_csv_files(root_path: str, years: Optional[set[str]] = None, include: Iterable[str] = (),
+                   exclude: Iterable[str] = ()) -> Iterator[str]:
+    """
+    Yields the paths of the CSV files under the year directories of `root_path` as they are found, in sorted order,
+    including the compressed CSV files and the CSV members of ZIP archives, which are walked like directories.
+    Only the files in `years` are yielded if it's provided, and only the files whose paths relative to `root_path`
+    match one of the `include` globs if any are provided.  Files and directories that match one of the `exclude` globs
+    are skipped, as are hidden files and directories.  Directories that can't contain matching files aren't entered.
+    """
+    include = list(include)
+    exclude = list(exclude)
+    with os.scandir(root_path) as entries:
+        year_entries = sorted((x for x in entries if _year_regex.fullmatch(x.name) and x.is_dir()),
+                              key=lambda x: x.name)
+
+    for entry in year_entries:
+        if (years is not None and entry.name not in years) or matches(entry.name, exclude):
+            continue
+        if not include or any(_could_contain(entry.name, x) for x in include):
+            yield from _walk_directory(entry.path, entry.name, include, exclude)
+
+
+def _could_contain(short_path: str, pattern: str) -> bool:
+    # The part of the pattern before its first wildcard must be consistent with the path of the directory, since a
+    # wildcard can match any characters, including slashes.
+    prefix = re.split(r"[*?\[]", pattern, maxsplit=1)[0]
+    directory = short_path + "/"
+    return prefix.startswith(directory) or directory.startswith(prefix)
+
+
+def _walk_directory(path: str, short_path: str, include: list[str], exclude: list[str]) -> Iterator[str]:
+    # The entries are listed before any of them is yielded, so that the directory isn't held open while the files are
+    # tested.
+    with os.scandir(path) as entries:
+        entries = sorted(entries, key=lambda x: x.name)
+
+    for entry in entries:
+        entry_short_path = f"{short_path}/{entry.name}"
+        if entry.name.startswith(".") or matches(entry_short_path, exclude):
+            continue
+
+        if entry.is_dir():
+            if not include or any(_could_contain(entry_short_path, x) for x in include):
+                yield from _walk_directory(entry.path, entry_short_path, include, exclude)
+        elif entry.name.lower().endswith(".zip"):
+            if not include or any(_could_contain(entry_short_path, x) for x in include):
+                for member in list_archive(entry.path):
+                    member_name = split_archive_path(member)[1]
+                    member_short_path = entry_short_path if member_name is None else \
+                        f"{entry_short_path}/{member_name}"
+                    if (not include or matches(member_short_path, include)) and \
+                            not matches(member_short_path, exclude):
+                        yield member
+        elif is_csv_file(entry.name) and (not include or matches(entry_short_path, include)):
+            yield entry.path
@@ -1,8 +1,18 @@
 import re
 from abc import ABC, abstractmethod
+from typing import Iterator, Optional
+
+from data_tests import schemas
+from data_tests.candidates import ExemptibleCheck
+from data_tests.failures import FailureCollectingCheck, FailureCollector
+from data_tests.row_context import RowContext, is_empty
 
 
 class FormatTest(ABC):
+    @property
+    def failure_count(self) -> int:
+        return 0 if self.passed else 1
+
     @property
     @abstractmethod
     def passed(self) -> bool:
@@ -12,6 +22,19 @@ class FormatTest(ABC):
     def get_failure_message(self, max_examples: int) -> str:
         raise NotImplementedError()
 
+    def examples(self, max_examples: int = -1) -> Iterator[tuple[int, list[str]]]:
+        """
+        Yields the row number and the contents of up to `max_examples` of the failing rows, or of all of them if
+        `max_examples` is negative.
+        """
+        return iter(())
+
+    def iter_failure_message(self, max_examples: int) -> Iterator[str]:
+        """
+        Yields the failure message in pieces, so that long messages can be written out without being built in memory.
+        """
+        yield self.get_failure_message(max_examples)
+
     @abstractmethod
     def test(self, value):
         raise NotImplementedError()
@@ -36,32 +59,41 @@ class RowTest(FormatTest):
         raise NotImplementedError()
 
 
-class ValueTest(RowTest):
+class ValueTest(FailureCollectingCheck, RowTest):
+    # A regular expression that is found in the entries of a row, joined by `FusedValueTests.separator`, whenever any of
+    # the entries is bad.  It may match rows that have no bad entries, but it must not miss any.  Value tests that set
+    # it are run by `FusedValueTests`, unless they inherit it from a class whose `is_bad_value` they change.
+    row_pattern: Optional[str] = None
+
     def __init__(self):
         super().__init__()
-        self._failures = {}
+        self._failures = FailureCollector()
 
     @property
     @abstractmethod
     def description(self) -> str:
         raise NotImplementedError()
 
-    @property
-    def passed(self):
-        return len(self._failures) == 0
-
-    def get_failure_message(self, max_examples=-1):
-        message = f"There are {len(self._failures)} rows that have entries with {self.description}:\n"
-        count = 0
-        for key, value in self._failures.items():
-            if (max_examples >= 0) and (count >= max_examples):
-                message += f"\n\t[Truncated to {max_examples} examples]"
-                return message
-            else:
-                message += f"\n\tRow {key}: {value}"
-                count += 1
-
-        return message
+    def _get_failure_summary(self) -> str:
+        return f"There are {len(self._failures)} rows that have entries with {self.description}:\n"
+
+    def could_fail(self, data: bytes) -> bool:
+        """
+        Returns whether any entry of the file whose raw UTF-8 contents are `data` could be bad.  Tests that can't rule
+        out failures without parsing the file return True.  It's only trusted if it's defined along with
+        `is_bad_value`, see `defines_with_is_bad_value`.
+        """
+        return True
+
+    def defines_with_is_bad_value(self, attribute: str) -> bool:
+        """
+        Returns whether `attribute` is defined by the class that defines `is_bad_value`, or by one of its subclasses.
+        An attribute that describes the bad values, such as `row_pattern` or `could_fail`, doesn't apply to a subclass
+        that changes `is_bad_value` without redefining it.
+        """
+        mro = type(self).__mro__
+        defining_class = next(x for x in mro if attribute in vars(x))
+        return mro.index(defining_class) <= mro.index(next(x for x in mro if "is_bad_value" in vars(x)))
 
     @abstractmethod
     def is_bad_value(self, value) -> bool:
@@ -70,10 +102,51 @@ class ValueTest(RowTest):
     def _test_row(self, row: list[str]):
         for entry in row:
             if self.is_bad_value(entry):
-                self._failures[self.current_row] = row
+                self._failures.add(self.current_row, row)
                 break
 
 
+class FusedValueTests:
+    """
+    Runs several value tests with a single regular expression search per row, instead of testing each entry once per
+    test.  The rows that the combined expression matches are tested by the individual tests, and the failures are
+    recorded in the tests themselves, so their failure messages are unchanged.
+    """
+    separator = "\x00"
+
+    def __init__(self, checks: list[ValueTest], current_row: int = 0):
+        self._checks = checks
+        self._current_row = current_row
+        self._regexes = [re.compile(x.row_pattern) for x in checks]
+        self._regex = re.compile("|".join(f"(?:{x.row_pattern})" for x in checks))
+
+    @property
+    def saturated(self) -> bool:
+        return not self._checks
+
+    @staticmethod
+    def supports(check) -> bool:
+        return (isinstance(check, ValueTest) and check.row_pattern is not None and
+                check.defines_with_is_bad_value("row_pattern"))
+
+    def drop_saturated(self):
+        """
+        Stops running the tests that are saturated.
+        """
+        if any(x.saturated for x in self._checks):
+            self.__init__([x for x in self._checks if not x.saturated], current_row=self._current_row)
+
+    def test(self, row: list[str]):
+        self._current_row += 1
+        text = FusedValueTests.separator.join(row)
+        if self._regex.search(text) is None:
+            return
+
+        for check, regex in zip(self._checks, self._regexes):
+            if regex.search(text) and any(check.is_bad_value(x) for x in row):
+                check.add_failure(self._current_row, row)
+
+
 class EmptyHeaders(FormatTest):
     def __init__(self):
         super().__init__()
@@ -169,133 +242,149 @@ class WhitespaceInHeaders(FormatTest):
 
 class ConsecutiveSpaces(ValueTest):
     regex = re.compile(r"\s{2,}")
+    row_pattern = regex.pattern
+
+    # The UTF-8 encodings of the whitespace characters, excluding the line breaks.  The csv module only removes quote
+    # characters from within an entry, so the whitespace characters of an entry can only be separated by quotes in the
+    # raw contents.  Line breaks can only be part of quoted entries, and "\r\n" is read as a single line break.
+    _raw_whitespace = rb"[\t\x0b\x0c\x1c-\x1f ]|\xc2[\x85\xa0]|\xe1\x9a\x80|\xe2\x80[\x80-\x8a\xa8\xa9\xaf]|" \
+                      rb"\xe2\x81\x9f|\xe3\x80\x80"
+    _raw_line_break = rb"\r\n|\r(?!\n)|\n"
+    _raw_regex = re.compile(rb'(?:%s)"*(?:%s)' % (_raw_whitespace, _raw_whitespace))
+    _raw_quoted_regex = re.compile(rb'(?:%s|%s)"*(?:%s|%s)' % (_raw_whitespace, _raw_line_break, _raw_whitespace,
+                                                             _raw_line_break))
 
     @property
     def description(self):
         return "consecutive whitespace characters"
 
+    def could_fail(self, data):
+        if data.find(b'"') == -1:
+            return bool(ConsecutiveSpaces._raw_regex.search(data))
+        else:
+            return bool(ConsecutiveSpaces._raw_quoted_regex.search(data))
+
     def is_bad_value(self, value):
         return bool(ConsecutiveSpaces.regex.search(value))
 
 
 class EmptyRows(RowTest):
-    regex = re.compile(r"\S")
-
     def __init__(self):
         super().__init__()
         self._empty_row_count = 0
 
+        # The number of empty rows after which the check stops testing rows, or -1 to test every row.
+        self.saturate_after = -1
+
+    @property
+    def failure_count(self):
+        return self._empty_row_count
+
     @property
     def passed(self):
         return self._empty_row_count == 0
 
+    @property
+    def saturated(self):
+        return 0 <= self.saturate_after <= self._empty_row_count
+
     def get_failure_message(self, max_examples=0):
         return f"Has {self._empty_row_count} empty rows."
 
-    def _test_row(self, row: list[str]):
-        has_content = False
-        for entry in row:
-            has_content |= bool(EmptyRows.regex.search(entry))
+    def get_chunk_state(self) -> int:
+        return self._empty_row_count
+
+    def merge_chunk_state(self, state: int, row_offset: int):
+        self._empty_row_count += state
 
-        if not has_content:
+    def test_context(self, context: RowContext):
+        self._current_row += 1
+        if context.is_empty:
             self._empty_row_count += 1
 
+    def _test_row(self, row: list[str]):
+        if is_empty(row):
+            self._empty_row_count += 1
 
-class InconsistentNumberOfColumns(RowTest):
+
+class InconsistentNumberOfColumns(FailureCollectingCheck, RowTest):
     def __init__(self, headers):
         super().__init__()
-        self._failures = {}
+        self._failures = FailureCollector()
         self._headers = headers
 
-    @property
-    def passed(self):
-        return len(self._failures) == 0
-
-    def get_failure_message(self, max_examples=-1):
-        message = f"Header has {len(self._headers)} entries, but there are {len(self._failures)} " \
-                  f"rows with an inconsistent number of columns:\n\n" \
-                  f"\tHeaders ({len(self._headers)} entries): {self._headers}:"
-
-        count = 0
-        for key, value in self._failures.items():
-            if (max_examples >= 0) and (count >= max_examples):
-                message += f"\n\t[Truncated to {max_examples} examples]"
-                return message
-            else:
-                message += f"\n\tRow {key} ({len(value)} entries): {value}"
-                count += 1
+    def _format_example(self, row_number: int, row: list[str]) -> str:
+        return f"\n\tRow {row_number} ({len(row)} entries): {row}"
 
-        return message
+    def _get_failure_summary(self) -> str:
+        return f"Header has {len(self._headers)} entries, but there are {len(self._failures)} " \
+               f"rows with an inconsistent number of columns:\n\n" \
+               f"\tHeaders ({len(self._headers)} entries): {self._headers}:"
 
     def _test_row(self, row: list[str]):
         if len(row) != len(self._headers):
-            self._failures[self.current_row] = row
+            self._failures.add(self.current_row, row)
 
 
-class VotesTest(RowTest):
+class VotesTest(FailureCollectingCheck, RowTest, ExemptibleCheck):
     def __init__(self, headers: list[str]):
         super().__init__()
-        self._failures = {}
+        self._classifier = schemas.get_classifier()
+        self._context = RowContext(headers)
+        self._failures = FailureCollector()
         self._headers = headers
+        self._plan = schemas.get_plan(headers)
 
-        columns_to_check = {"absentee", "early_voting", "election_day", "mail", "provisional", "votes"}
-        lowercase_headers = [x.strip().lower() for x in headers]
-        indices_to_check = []
-        for index, header in enumerate(lowercase_headers):
-            if header in columns_to_check:
-                indices_to_check.append(index)
-        self._indices_to_check = indices_to_check
+    @property
+    def applies(self) -> bool:
+        return self._plan.has_votes
 
-        if "candidate" in lowercase_headers:
-            self._candidate_index = lowercase_headers.index("candidate")
-        else:
-            self._candidate_index = None
+    @property
+    def candidate_index(self) -> Optional[int]:
+        return self._plan.candidate_index
+
+    @property
+    def indices_to_check(self) -> tuple[int, ...]:
+        return self._plan.vote_indices
 
     @property
     @abstractmethod
     def _failure_description(self) -> str:
         raise NotImplementedError()
 
-    @property
-    def passed(self) -> bool:
-        return len(self._failures) == 0
-
     @abstractmethod
-    def _is_bad_value(self, candidate: str, value: float) -> bool:
+    def _is_bad_number(self, value: float) -> bool:
         raise NotImplementedError()
 
-    def get_failure_message(self, max_examples=-1) -> str:
-        message = f"There are {len(self._failures)} rows with votes that {self._failure_description}:\n\n" \
-                  f"\tHeaders: {self._headers}:"
-
-        count = 0
-        for key, value in self._failures.items():
-            if (max_examples >= 0) and (count >= max_examples):
-                message += f"\n\t[Truncated to {max_examples} examples]"
-                return message
-            else:
-                message += f"\n\tRow {key}: {value}"
-                count += 1
+    def _get_failure_summary(self) -> str:
+        return f"There are {len(self._failures)} rows with votes that {self._failure_description}:\n\n" \
+               f"\tHeaders: {self._headers}:"
 
-        return message
+    def test_context(self, context: RowContext):
+        self._current_row += 1
+        self._test_context(context)
+
+    def _test_context(self, context: RowContext):
+        # The values that aren't numeric are skipped.  This can be due to the row having an inconsistent number of
+        # columns (hence the index of the "votes" column is invalid), or the value has been redacted and is represented
+        # by a non-numeric character.
+        votes = context.votes
+        for index in self._plan.vote_indices:
+            value = votes.get(index)
+            if value is not None and self._is_bad_number(value):
+                # The exemptions only depend on the candidate, so they are only evaluated for the rows that could fail.
+                if self.exemption_name not in context.exemptions:
+                    self._failures.add(self.current_row, context.row)
+                return
 
     def _test_row(self, row: list[str]):
-        if len(row) == len(self._headers):
-            for value in (row[i] for i in self._indices_to_check):
-                # If the value isn't numeric, skip the test.  This can be due to the row having an inconsistent
-                # number of columns (hence the index of the "votes" column is invalid), or the value has been
-                # redacted and is represented by a non-numeric character.
-                try:
-                    float_value = float(value)
-                except ValueError:
-                    continue
-
-                candidate = None if self._candidate_index is None else row[self._candidate_index]
-                if self._is_bad_value(candidate, float(value)):
-                    self._failures[self.current_row] = row
+        self._context.update(row)
+        self._test_context(self._context)
 
 
 class NegativeVotes(VotesTest):
+    exemption_name = "NegativeVotes"
+
     def __init__(self, headers: list[str]):
         super().__init__(headers)
 
@@ -303,22 +392,13 @@ class NegativeVotes(VotesTest):
     def _failure_description(self) -> str:
         return "are negative"
 
-    def _is_bad_value(self, candidate: str, value: float) -> bool:
-        # There are cases where over votes and under votes are reported as a single aggregate.  As such, it's
-        # possible for the votes to be negative.  We will try and avoid these rows.
-        if candidate is not None:
-            aggregates = {"over/under", "under/over"}
-            if any(x in candidate.lower().replace(" ", "") for x in aggregates):
-                return False
-
-            # Under votes are sometimes reported as negative values.  We will try and avoid these rows.
-            if candidate.lower() == "under votes":
-                return False
-
+    def _is_bad_number(self, value: float) -> bool:
         return value < 0
 
 
 class NonIntegerVotes(VotesTest):
+    exemption_name = "NonIntegerVotes"
+
     def __init__(self, headers: list[str]):
         super().__init__(headers)
 
@@ -326,19 +406,15 @@ class NonIntegerVotes(VotesTest):
     def _failure_description(self) -> str:
         return "aren't integers"
 
-    def _is_bad_value(self, candidate: str, value: float) -> bool:
-        # There are some rare cases where the value represents a turnout percentage.  We will try and avoid
-        # these rows.
-        if candidate is not None:
-            percentages = {"%", "pct", "percent"}
-            if any(x in candidate.lower() for x in percentages):
-                return False
-
+    def _is_bad_number(self, value: float) -> bool:
         # This allows for "3" and "3.0", but not "3.1".
         return not value.is_integer()
 
 
 class LeadingAndTrailingSpaces(ValueTest):
+    # str.strip() removes the same characters that \s matches.
+    row_pattern = r"(?:\A|\x00)\s|\s(?:\x00|\Z)"
+
     @property
     def description(self):
         return "leading or trailing whitespace characters"
@@ -359,18 +435,29 @@ class NonAlphanumericEntries(ValueTest):
 
 
 class PrematureLineBreaks(ValueTest):
+    row_pattern = r"\n"
+
     @property
     def description(self):
         return "newline characters"
 
+    def could_fail(self, data):
+        # Line breaks can only be part of quoted entries.
+        return data.find(b'"') != -1
+
     def is_bad_value(self, value):
         return "\n" in value
 
 
 class TabCharacters(ValueTest):
+    row_pattern = r"\t"
+
     @property
     def description(self):
         return "tab characters"
 
+    def could_fail(self, data):
+        return data.find(b"\t") != -1
+
     def is_bad_value(self, value):
         return "\t" in value
@@ -1,84 +1,88 @@
-class VoteBreakdownTotals:
+from typing import Optional
+
+from data_tests import schemas
+from data_tests.candidates import ExemptibleCheck
+from data_tests.failures import FailureCollectingCheck, FailureCollector
+from data_tests.row_context import RowContext
+
+
+class VoteBreakdownTotals(FailureCollectingCheck, ExemptibleCheck):
+    exemption_name = "VoteBreakdownTotals"
+
     def __init__(self, headers: list[str]):
+        self._classifier = schemas.get_classifier()
+        self._context = RowContext(headers)
         self._headers = headers
-        self._failures = {}
+        self._failures = FailureCollector()
         self._current_row = 0
 
-        votes = "votes"
-        if votes in self._headers:
-            self._votes_index = self._headers.index(votes)
-        else:
-            self._votes_index = None
+        # If the column headers match some known schemas, we can check for exact equality.
+        self._plan = schemas.get_plan(headers)
+        self._candidate_index = self._plan.column_indices.get("candidate")
+        self._votes_index = self._plan.column_indices.get("votes")
 
-        if "candidate" in self._headers:
-            self._candidate_index = self._headers.index("candidate")
-        else:
-            self._candidate_index = None
+    @property
+    def applies(self) -> bool:
+        return self._plan.has_breakdowns
+
+    @property
+    def candidate_index(self) -> Optional[int]:
+        return self._candidate_index
 
-        components = {"absentee", "early_voting", "election_day", "mail", "provisional"}
-        self._component_indices = [i for i, x in enumerate(self._headers) if x in components]
+    @property
+    def check_equality(self) -> bool:
+        return self._plan.check_equality
 
-        # If the column headers match some known schemas, we can check for exact equality.
-        known_schemas = [
-            {"county", "precinct", "office", "district", "party", "candidate", "votes", "early_voting", "election_day",
-             "provisional", "mail"}
-        ]
-        self._check_equality = set(self._headers) in known_schemas
+    @property
+    def component_indices(self) -> tuple[int, ...]:
+        return self._plan.component_indices
 
     @property
-    def passed(self) -> bool:
-        return len(self._failures) == 0
+    def votes_index(self) -> Optional[int]:
+        return self._votes_index
 
-    def get_failure_message(self, max_examples: int = -1) -> str:
-        components = [self._headers[i] for i in self._component_indices]
-        if self._check_equality:
+    def _get_failure_summary(self) -> str:
+        components = [self._headers[i] for i in self._plan.component_indices]
+        if self._plan.check_equality:
             relation = "not equal to"
         else:
             relation = "greater than"
-        message = f"There are {len(self._failures)} rows where the sum of {components} is {relation} 'votes':\n\n" \
-                  f"\tHeaders: {self._headers}:"
-
-        count = 0
-        for row_number, row in self._failures.items():
-            if (max_examples >= 0) and (count >= max_examples):
-                message += f"\n\t[Truncated to {max_examples} examples]"
-                return message
-            else:
-                message += f"\n\tRow {row_number}: {row}"
-                count += 1
-
-        return message
+        return f"There are {len(self._failures)} rows where the sum of {components} is {relation} 'votes':\n\n" \
+               f"\tHeaders: {self._headers}:"
 
     def test(self, row: list[str]):
+        self._context.update(row)
+        self.test_context(self._context)
+
+    def test_context(self, context: RowContext):
         self._current_row += 1
 
-        if (len(row) == len(self._headers)) and self._votes_index is not None and self._component_indices:
-            # There are cases where over votes and under votes are reported as a single aggregate.  As such, it's
-            # possible for the votes to be negative.  We will try and avoid these rows.
-            if self._candidate_index is not None:
-                aggregates = {"over/under", "under/over"}
-                if any(x in row[self._candidate_index].lower().replace(" ", "") for x in aggregates):
-                    return
-
-            try:
-                # We use float instead of int to allow for values like "3.0".
-                votes = float(row[self._votes_index])
-            except ValueError:
+        if self._plan.has_breakdowns:
+            # The votes of ragged rows are left out of the context.
+            votes = context.votes
+            if self._votes_index not in votes:
                 return
 
             component_sum = 0
             has_components = False
-            for component in (row[i] for i in self._component_indices):
-                try:
-                    component_value = float(component)
+            for i in self._plan.component_indices:
+                component_value = votes.get(i)
+                if component_value is not None:
                     has_components = True
-                except ValueError:
-                    component_value = 0
-                component_sum += component_value
+                    component_sum += component_value
 
             if has_components:
-                if self._check_equality:
-                    if votes != component_sum:
-                        self._failures[self._current_row] = row
-                elif votes < component_sum:
-                    self._failures[self._current_row] = row
+                if self._plan.check_equality:
+                    is_bad = votes[self._votes_index] != component_sum
+                else:
+                    is_bad = votes[self._votes_index] < component_sum
+
+                # Some candidates are exempt, e.g., over votes and under votes reported as a single aggregate, which
+                # can be negative.
+                if is_bad and not self._is_exempt_row(context):
+                    self._failures.add(self._current_row, context.row)
+
+    def _is_exempt_row(self, context: RowContext) -> bool:
+        if self._candidate_index == context.candidate_index:
+            return self.exemption_name in context.exemptions
+        return self._candidate_index is not None and self.is_exempt(context.row[self._candidate_index])
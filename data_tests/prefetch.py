@@ -0,0 +1,88 @@
+import collections
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, Iterator, TypeVar
+
+T = TypeVar("T")
+
+
+class _Task:
+    def __init__(self, path: str):
+        self.bytes_read = 0
+        self.cancelled = False
+        self.path = path
+
+
+class Prefetcher:
+    """
+    Reads the upcoming files in background threads while the current file is tested, so that their contents are in the
+    page cache by the time they are tested, instead of the tests waiting on the disk or the network.  The contents are
+    read into a small buffer and discarded, and at most `max_bytes` are read ahead of the tests, so a large file is only
+    partly read ahead rather than evicting the files before it.
+    """
+    chunk_size = 1 << 20
+    threads = 2
+
+    def __init__(self, entries: Iterable[T], get_path: Callable[[T], str], depth: int, max_bytes: int):
+        self._depth = depth
+        self._entries = entries
+        self._get_path = get_path
+        self._lock = threading.Lock()
+        self._max_bytes = max_bytes
+        self._read_ahead_bytes = 0
+
+    def __iter__(self) -> Iterator[T]:
+        entries = iter(self._entries)
+        upcoming = collections.deque()
+        with ThreadPoolExecutor(max_workers=Prefetcher.threads, thread_name_prefix="prefetch") as executor:
+            try:
+                while True:
+                    # The current entry and up to `depth` entries after it are read ahead.
+                    while len(upcoming) <= self._depth:
+                        entry = next(entries, None)
+                        if entry is None:
+                            break
+                        task = _Task(self._get_path(entry))
+                        upcoming.append((entry, task))
+                        executor.submit(self._read, task)
+
+                    if not upcoming:
+                        return
+
+                    entry, task = upcoming.popleft()
+                    self._cancel(task)
+                    yield entry
+            finally:
+                for _, task in upcoming:
+                    self._cancel(task)
+
+    @property
+    def read_ahead_bytes(self) -> int:
+        """
+        The number of bytes that have been read ahead of the tests, excluding the files that have been reached.
+        """
+        return self._read_ahead_bytes
+
+    def _cancel(self, task: _Task):
+        # Once the tests reach a file, it's no longer read ahead, and the bytes read from it no longer count towards
+        # the limit.
+        with self._lock:
+            task.cancelled = True
+            self._read_ahead_bytes -= task.bytes_read
+
+    def _read(self, task: _Task):
+        # Prefetching is only an optimization, so files that can't be read are left for the tests to report.
+        buffer = bytearray(Prefetcher.chunk_size)
+        try:
+            with open(task.path, "rb", buffering=0) as data:
+                while True:
+                    with self._lock:
+                        if task.cancelled or self._read_ahead_bytes + len(buffer) > self._max_bytes:
+                            return
+                        self._read_ahead_bytes += len(buffer)
+                        task.bytes_read += len(buffer)
+
+                    if data.readinto(buffer) < len(buffer):
+                        return
+        except OSError:
+            pass
@@ -0,0 +1,109 @@
+import time
+from typing import Iterable, Iterator, NamedTuple
+
+
+class Timer:
+    """
+    Accumulates the number of calls to an operation and the time spent in them.
+    """
+    def __init__(self):
+        self.calls = 0
+        self.seconds = 0.0
+
+    def add(self, start: float):
+        self.calls += 1
+        self.seconds += time.perf_counter() - start
+
+
+class TimedTest:
+    """
+    Wraps a row test, timing the calls to its `test()`, `test_context()` and `finish()` methods.
+    """
+    def __init__(self, row_test):
+        self.row_test = row_test
+        self.timer = Timer()
+
+    @property
+    def name(self) -> str:
+        return type(self.row_test).__name__
+
+    @property
+    def saturated(self) -> bool:
+        return getattr(self.row_test, "saturated", False)
+
+    def drop_saturated(self):
+        drop_saturated = getattr(self.row_test, "drop_saturated", None)
+        if drop_saturated is not None:
+            drop_saturated()
+
+    def finish(self):
+        finish = getattr(self.row_test, "finish", None)
+        if finish is not None:
+            start = time.perf_counter()
+            finish()
+            self.timer.seconds += time.perf_counter() - start
+
+    def test(self, row: list[str]):
+        start = time.perf_counter()
+        self.row_test.test(row)
+        self.timer.add(start)
+
+    def test_context(self, context):
+        start = time.perf_counter()
+        self.row_test.test_context(context)
+        self.timer.add(start)
+
+
+def time_iterator(iterable: Iterable, timer: Timer) -> Iterator:
+    """
+    Yields the items of `iterable`, adding the time spent producing each of them to `timer`.
+    """
+    iterator = iter(iterable)
+    while True:
+        start = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            timer.seconds += time.perf_counter() - start
+            return
+        timer.add(start)
+        yield item
+
+
+class FileProfile(NamedTuple):
+    rows: int
+    seconds: float
+    # The number of calls and the time spent in each operation, keyed by the name of the operation.
+    timings: dict[str, tuple[int, float]]
+
+
+class Profiler:
+    """
+    Aggregates the profiles of the tested files, and reports the time spent in each operation and the slowest files.
+    """
+    slowest_files = 10
+
+    def __init__(self):
+        self._files = []
+        self._timings = {}
+
+    def add(self, short_path: str, profile: FileProfile):
+        self._files.append((profile.seconds, short_path, profile.rows))
+        for name, (calls, seconds) in profile.timings.items():
+            total_calls, total_seconds = self._timings.get(name, (0, 0.0))
+            self._timings[name] = (total_calls + calls, total_seconds + seconds)
+
+    def get_report(self) -> str:
+        total_rows = sum(x[2] for x in self._files)
+        total_seconds = sum(x[0] for x in self._files)
+        lines = [f"Profiled {len(self._files)} files with {total_rows} rows in {total_seconds:.3f} s:", "",
+                 f"{'operation':<40}{'calls':>12}{'time (s)':>12}{'calls/s':>14}"]
+        for name, (calls, seconds) in sorted(self._timings.items(), key=lambda x: -x[1][1]):
+            rate = f"{calls / seconds:.0f}" if seconds > 0 else "-"
+            lines.append(f"{name:<40}{calls:>12}{seconds:>12.3f}{rate:>14}")
+
+        lines.extend(["", "Slowest files:"])
+        for seconds, short_path, rows in sorted(self._files, reverse=True)[:Profiler.slowest_files]:
+            lines.append(f"{seconds:>10.3f} s  {short_path} ({rows} rows)")
+
+        return "\n".join(lines)
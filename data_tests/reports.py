@@ -0,0 +1,138 @@
+import json
+import pathlib
+import queue
+import threading
+from typing import Iterable, Optional
+
+from data_tests.failures import SpooledMessage
+
+
+class ReportWriter:
+    """
+    Writes the reports of the tests on a background thread, so that the tests don't wait for the writes.  The failure
+    messages are written to the log file in a human-readable format, and a JSON record of the result of each check for
+    each file is written to the report file, one record per line.  Both files are written through large buffers.
+    """
+    buffer_size = 1 << 20
+
+    # The number of pending writes beyond which the tests wait for the writes to catch up, which bounds the memory used
+    # by the pending writes.
+    max_pending_writes = 1000
+
+    def __init__(self, log_file: Optional[str] = None, report_file: Optional[str] = None):
+        self._error = None
+        self._log_data = None
+        self._report_data = None
+        if log_file is not None:
+            self._log_data = open(log_file, "a", buffering=ReportWriter.buffer_size)
+        if report_file is not None:
+            self._report_data = open(report_file, "w", buffering=ReportWriter.buffer_size)
+
+        self._queue = queue.Queue(maxsize=ReportWriter.max_pending_writes)
+        self._thread = threading.Thread(target=self._write, name="ReportWriter", daemon=True)
+        self._thread.start()
+
+    @property
+    def has_log_file(self) -> bool:
+        return self._log_data is not None
+
+    def close(self):
+        """
+        Waits for the pending writes, and closes the files.  Errors raised by the writes are raised again here.
+        """
+        self._queue.put(None)
+        self._thread.join()
+        for data in (self._log_data, self._report_data):
+            if data is not None:
+                data.close()
+
+        if self._error is not None:
+            raise self._error
+
+    def write_failure(self, description: str, message: SpooledMessage):
+        """
+        Writes the failure message of a test to the log file.  The message is closed once it has been written.
+        """
+        if self._log_data is None:
+            message.close()
+        else:
+            self._queue.put((self._write_failure, description, message))
+
+    def write_record(self, record: dict):
+        if self._report_data is not None:
+            self._queue.put((self._write_record, record))
+
+    def _write(self):
+        while (item := self._queue.get()) is not None:
+            function, *args = item
+            try:
+                function(*args)
+            except Exception as exception:
+                # The remaining writes are still consumed, so that the tests never wait on a full queue.
+                if self._error is None:
+                    self._error = exception
+
+    def _write_failure(self, description: str, message: SpooledMessage):
+        try:
+            self._log_data.write("======================================================================\n"
+                                 f"FAIL: {description}\n"
+                                 "----------------------------------------------------------------------\n")
+            for chunk in message.chunks():
+                self._log_data.write(chunk)
+            self._log_data.write("\n\n")
+        finally:
+            message.close()
+
+    def _write_record(self, record: dict):
+        self._report_data.write(f"{json.dumps(record)}\n")
+
+
+def read_reports(report_files: Iterable[str]) -> list[dict]:
+    """
+    Reads the records of the report files of several runs, e.g., of the shards of a run, and orders them as a single
+    run would have written them: by test, in the order that the tests ran, and then by path.
+    """
+    records = []
+    for report_file in report_files:
+        with open(report_file, "r") as report_data:
+            records.extend(json.loads(x) for x in report_data if x.strip())
+
+    test_order = {}
+    for record in records:
+        test_order.setdefault(record["test"], len(test_order))
+
+    # The sort is stable, so the records of the checks of each file stay in the order that they were written in.
+    records.sort(key=lambda x: (test_order[x["test"]], pathlib.PurePath(x["path"]).parts))
+    return records
+
+
+def format_failures(records: Iterable[dict], group_failures: bool = False) -> str:
+    """
+    Formats the failed checks and the errors of the report `records`, ordered by year.  If `group_failures` is True,
+    the failures of each year are grouped using the GitHub Actions group and endgroup workflow commands, like the
+    console output of the tests.
+    """
+    paths = set()
+    failures = {}
+    for record in records:
+        paths.add(record["path"])
+        if "error" in record:
+            failures.setdefault(record["year"], []).append(f"ERROR: {record['test']} [{record['path']}]\n"
+                                                           f"{record['error']}\n")
+        elif not record["passed"]:
+            count = f"at least {record['count']}" if record.get("lower_bound") else record["count"]
+            lines = [f"FAIL: {record['test']} [{record['path']}]\n{record['check']}: {count} rows\n"]
+            lines.extend(f"\tRow {x}: {y}\n" for x, y in zip(record["row_numbers"], record["rows"]))
+            failures.setdefault(record["year"], []).append("".join(lines))
+
+    output = []
+    for year in sorted(failures):
+        if group_failures:
+            output.append(f"::group::{year}\n")
+        output.extend(failures[year])
+        if group_failures:
+            output.append("::endgroup::\n")
+
+    failure_count = sum(len(x) for x in failures.values())
+    output.append(f"{failure_count} failures in {len(paths)} files\n")
+    return "".join(output)
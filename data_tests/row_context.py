@@ -0,0 +1,92 @@
+import re
+from typing import Optional
+
+from data_tests import schemas
+
+_non_whitespace_regex = re.compile(r"\S")
+
+
+def is_empty(row: list[str]) -> bool:
+    """
+    Returns whether every entry of `row` is empty or only contains whitespace.
+    """
+    return not any(_non_whitespace_regex.search(x) for x in row)
+
+
+class RowContext:
+    """
+    The values of a row that several checks need, derived once per row and shared by all the checks that test the row,
+    instead of being derived again by each of them.  A single context is updated with each row of a file.  The values
+    are derived on first use, so checks that don't need them don't pay for them.
+    """
+    def __init__(self, headers: list[str]):
+        self._headers = headers
+        self._row = []
+
+        plan = schemas.get_plan(headers)
+        self._vote_indices = plan.vote_indices
+        self._candidate_index = plan.candidate_index
+        self._classifier = schemas.get_classifier()
+
+        self._exemptions = None
+        self._is_empty = None
+        self._votes = None
+
+    @property
+    def candidate_index(self) -> Optional[int]:
+        return self._candidate_index
+
+    @property
+    def is_empty(self) -> bool:
+        if self._is_empty is None:
+            self._is_empty = is_empty(self._row)
+        return self._is_empty
+
+    @property
+    def is_ragged(self) -> bool:
+        return len(self._row) != len(self._headers)
+
+    @property
+    def exemptions(self) -> frozenset[str]:
+        """
+        The names of the checks whose failures are ignored for the candidate of the row.  Rows are only exempt if the
+        file has a candidate column and the row isn't ragged.
+        """
+        if self._exemptions is None:
+            if self._candidate_index is None or self.is_ragged:
+                self._exemptions = frozenset()
+            else:
+                self._exemptions = self._classifier.get_exemptions(self._row[self._candidate_index])
+        return self._exemptions
+
+    @property
+    def row(self) -> list[str]:
+        return self._row
+
+    @property
+    def votes(self) -> dict[int, float]:
+        """
+        The numeric values of the vote columns of the row, keyed by the index of the column.  Values that aren't numeric
+        (e.g., redacted values) are left out, as are all the values of ragged rows, whose columns can't be matched with
+        the headers.
+        """
+        if self._votes is None:
+            self._votes = {}
+            if not self.is_ragged:
+                for i in self._vote_indices:
+                    value = self._row[i]
+                    # float() rejects empty values, which are common enough that raising an exception for them is slow.
+                    if value:
+                        try:
+                            # We use float instead of int to allow for values like "3.0".
+                            self._votes[i] = float(value)
+                        except ValueError:
+                            pass
+
+        return self._votes
+
+    def update(self, row: list[str]):
+        self._row = row
+        self._exemptions = None
+        self._is_empty = None
+        self._votes = None
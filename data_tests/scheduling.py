@@ -0,0 +1,63 @@
+"""
+Schedules the files that are validated in parallel from the most to the least costly, so that a run doesn't end with a
+single worker validating a large file while the others are idle, and reports their results in the order of the files.
+"""
+import json
+import os
+from typing import Iterable, Iterator, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+def estimate_costs(sizes: list[int], seconds: list[Optional[float]]) -> list[float]:
+    """
+    Estimates the cost of validating each file, in seconds, from the time that it took in a previous run if it's known,
+    or else from the size of the file, at the rate of the files whose times are known.
+    """
+    known_size = sum(x for x, y in zip(sizes, seconds) if y is not None)
+    known_seconds = sum(y for y in seconds if y is not None)
+    seconds_per_byte = known_seconds / known_size if known_size > 0 and known_seconds > 0 else 1.0
+    return [y if y is not None else x * seconds_per_byte for x, y in zip(sizes, seconds)]
+
+
+def get_schedule(costs: list[float]) -> list[int]:
+    """
+    Returns the indices of the files from the most to the least costly, and in their order for equal costs.
+    """
+    return sorted(range(len(costs)), key=lambda x: (-costs[x], x))
+
+
+def in_order(indexed_results: Iterable[tuple[int, T]]) -> Iterator[T]:
+    """
+    Yields the results that are received with their indices out of order in the order of their indices, each as soon
+    as the results before it have been received.
+    """
+    pending_results = {}
+    next_index = 0
+    for index, result in indexed_results:
+        pending_results[index] = result
+        while next_index in pending_results:
+            yield pending_results.pop(next_index)
+            next_index += 1
+
+
+def load_timings(timings_file: str) -> dict[str, float]:
+    """
+    Reads the number of seconds that each file took to validate, keyed by the path of the file relative to the root
+    path, from the JSON file `timings_file`.  No timings are returned if the file doesn't exist yet.
+    """
+    if not os.path.exists(timings_file):
+        return {}
+
+    with open(timings_file, "r") as timings_data:
+        timings = json.load(timings_data)
+
+    if not isinstance(timings, dict) or not all(isinstance(x, (int, float)) for x in timings.values()):
+        raise ValueError(f"{timings_file} should map the paths of the files to the number of seconds that they took")
+
+    return timings
+
+
+def save_timings(timings_file: str, timings: dict[str, float]):
+    with open(timings_file, "w") as timings_data:
+        json.dump(timings, timings_data, indent=0, sort_keys=True)
@@ -0,0 +1,200 @@
+"""
+Compiles the headers of the files into the plans that the checks run with.  A data repository reuses a few distinct
+headers across many files, so each distinct header is compiled once per process, and the checks of every file with that
+header share its plan.  The registry also holds the rules that exempt some candidates from the vote checks.
+"""
+import hashlib
+import json
+import re
+from typing import Iterable, NamedTuple, Optional
+
+from data_tests.candidates import DEFAULT_EXEMPTIONS, CandidateClassifier, ExemptionRule
+
+# The columns that hold vote counts, matched against the stripped and lowercased headers.
+VOTE_COLUMNS = {"absentee", "early_voting", "election_day", "mail", "provisional", "votes"}
+
+# The columns that the votes are broken down into, matched against the headers as they are.
+BREAKDOWN_COLUMNS = {"absentee", "early_voting", "election_day", "mail", "provisional"}
+
+# Schemas whose vote breakdowns are compared with the votes for equality, rather than for not exceeding them.
+DEFAULT_KNOWN_SCHEMAS = [
+    ["county", "precinct", "office", "district", "party", "candidate", "votes", "early_voting", "election_day",
+     "provisional", "mail"],
+]
+
+
+class SchemaPlan(NamedTuple):
+    headers: tuple[str, ...]
+
+    # The first index of each header, as it is.
+    column_indices: dict[str, int]
+
+    # The indices of the vote columns, and of the candidate column, matched against the stripped and lowercased
+    # headers.
+    vote_indices: tuple[int, ...]
+    candidate_index: Optional[int]
+
+    # The indices of the columns whose values identify an entry, which are all the columns except the vote columns.
+    indices_to_hash: tuple[int, ...]
+
+    # The indices of the vote breakdown columns, and whether their sum must equal the votes.
+    component_indices: tuple[int, ...]
+    check_equality: bool
+
+    @property
+    def has_breakdowns(self) -> bool:
+        return "votes" in self.column_indices and len(self.component_indices) > 0
+
+    @property
+    def has_votes(self) -> bool:
+        return len(self.vote_indices) > 0
+
+
+def compile_plan(headers: Iterable[str], known_schemas: Iterable[frozenset[str]] = ()) -> SchemaPlan:
+    headers = tuple(headers)
+    lowercase_headers = [x.strip().lower() for x in headers]
+
+    column_indices = {}
+    for index, header in enumerate(headers):
+        column_indices.setdefault(header, index)
+
+    indices_to_hash = []
+    for index, header in enumerate(headers):
+        lowered_header = header.lower()
+        not_vote_column = "votes" not in lowered_header
+        not_vote_column &= lowered_header not in BREAKDOWN_COLUMNS
+        if not_vote_column:
+            indices_to_hash.append(index)
+
+    return SchemaPlan(
+        headers=headers,
+        column_indices=column_indices,
+        vote_indices=tuple(i for i, x in enumerate(lowercase_headers) if x in VOTE_COLUMNS),
+        candidate_index=lowercase_headers.index("candidate") if "candidate" in lowercase_headers else None,
+        indices_to_hash=tuple(indices_to_hash),
+        component_indices=tuple(i for i, x in enumerate(headers) if x in BREAKDOWN_COLUMNS),
+        check_equality=frozenset(headers) in set(known_schemas),
+    )
+
+
+class SchemaRegistry:
+    """
+    The known schemas and the exemption rules, and the plans compiled for each distinct header, keyed by the header.
+    """
+    def __init__(self, known_schemas: Iterable[Iterable[str]] = DEFAULT_KNOWN_SCHEMAS,
+                 exemptions: Iterable[ExemptionRule] = DEFAULT_EXEMPTIONS):
+        self._exemptions = list(exemptions)
+        self._classifier = CandidateClassifier(self._exemptions)
+        self._fingerprint = None
+        self._known_schemas = []
+        self._plans = {}
+        for schema in known_schemas:
+            self.add_known_schema(schema)
+
+    @property
+    def classifier(self) -> CandidateClassifier:
+        return self._classifier
+
+    @property
+    def exemptions(self) -> tuple[ExemptionRule, ...]:
+        return tuple(self._exemptions)
+
+    @property
+    def fingerprint(self) -> str:
+        """
+        A fingerprint of the known schemas and of the exemption rules, which change the results of the checks.
+        """
+        if self._fingerprint is None:
+            config = {
+                "known_schemas": sorted(sorted(x) for x in set(self._known_schemas)),
+                "exemptions": [[x.pattern, sorted(x.checks), x.ignore_spaces] for x in self._exemptions],
+            }
+            self._fingerprint = hashlib.blake2b(json.dumps(config).encode(), digest_size=16).hexdigest()
+        return self._fingerprint
+
+    @property
+    def known_schemas(self) -> tuple[frozenset[str], ...]:
+        return tuple(self._known_schemas)
+
+    def add_exemption(self, rule: ExemptionRule):
+        self._exemptions.append(rule)
+        self._classifier = CandidateClassifier(self._exemptions)
+        self._fingerprint = None
+
+    def add_known_schema(self, headers: Iterable[str]):
+        self._known_schemas.append(frozenset(headers))
+        self._fingerprint = None
+        self._plans.clear()
+
+    def get_plan(self, headers: Iterable[str]) -> SchemaPlan:
+        key = tuple(headers)
+        plan = self._plans.get(key)
+        if plan is None:
+            plan = compile_plan(key, self._known_schemas)
+            self._plans[key] = plan
+
+        return plan
+
+    def load(self, schemas_file: str):
+        """
+        Adds the known schemas and the exemption rules listed in the JSON file `schemas_file`, e.g.:
+
+            {
+                "known_schemas": [["county", "precinct", "office", "candidate", "votes", "absentee", "election_day"]],
+                "exemptions": [{"pattern": "turnout", "checks": ["NonIntegerVotes"], "ignore_spaces": false}]
+            }
+        """
+        with open(schemas_file, "r") as schemas_data:
+            config = json.load(schemas_data)
+
+        if not isinstance(config, dict):
+            raise ValueError(f"{schemas_file} should have a \"known_schemas\" list or an \"exemptions\" list")
+
+        known_schemas = config.get("known_schemas", [])
+        if not isinstance(known_schemas, list) or \
+                not all(isinstance(x, list) and all(isinstance(y, str) for y in x) for x in known_schemas):
+            raise ValueError(f"{schemas_file} should have a \"known_schemas\" list of lists of headers")
+
+        exemptions = []
+        for exemption in config.get("exemptions", []):
+            if not isinstance(exemption, dict) or not isinstance(exemption.get("pattern"), str) or \
+                    not isinstance(exemption.get("checks"), list) or \
+                    not all(isinstance(x, str) for x in exemption["checks"]):
+                raise ValueError(f"{schemas_file} has an invalid exemption {exemption!r}, which should have a "
+                                 f"\"pattern\" and a \"checks\" list")
+            try:
+                re.compile(exemption["pattern"])
+            except re.error as error:
+                raise ValueError(f"{schemas_file} has an invalid exemption pattern: {error}") from error
+
+            exemptions.append(ExemptionRule(exemption["pattern"], frozenset(exemption["checks"]),
+                                            bool(exemption.get("ignore_spaces", False))))
+
+        for schema in known_schemas:
+            self.add_known_schema(schema)
+        for rule in exemptions:
+            self.add_exemption(rule)
+
+
+_registry = SchemaRegistry()
+
+
+def get_classifier() -> CandidateClassifier:
+    return _registry.classifier
+
+
+def get_plan(headers: Iterable[str]) -> SchemaPlan:
+    return _registry.get_plan(headers)
+
+
+def get_registry() -> SchemaRegistry:
+    return _registry
+
+
+def set_registry(known_schemas: Iterable[Iterable[str]], exemptions: Iterable[ExemptionRule]):
+    """
+    Replaces the registry with one that has `known_schemas` and `exemptions`.  This is how worker processes are set up
+    with the registry of the main process.
+    """
+    global _registry
+    _registry = SchemaRegistry(known_schemas, exemptions)
@@ -0,0 +1,35 @@
+import heapq
+import re
+
+# The fixed cost of testing a file, in bytes, which keeps the many small files from all being assigned to one shard.
+FILE_OVERHEAD = 64 * 1024
+
+_shard_regex = re.compile(r"([0-9]+)/([0-9]+)")
+
+
+def assign_shards(costs: dict[str, int], shard_count: int) -> dict[str, int]:
+    """
+    Assigns each unit of work in `costs` to one of `shard_count` shards, numbered from 1, so that the total costs of the
+    shards are balanced.  The units are assigned from the most to the least costly, each to the shard with the lowest
+    total cost so far.  Ties are broken by the names of the units and by the numbers of the shards, so that every
+    machine assigns the same units to the same shards.
+    """
+    shard_costs = [(0, i) for i in range(1, shard_count + 1)]
+    assignments = {}
+    for unit in sorted(costs, key=lambda x: (-costs[x], x)):
+        shard_cost, shard = heapq.heappop(shard_costs)
+        assignments[unit] = shard
+        heapq.heappush(shard_costs, (shard_cost + costs[unit], shard))
+
+    return assignments
+
+
+def parse_shard(shard: str) -> tuple[int, int]:
+    """
+    Parses a shard of the form "i/N", e.g., "2/4", into the number of the shard, from 1 to N, and the number of shards.
+    """
+    match = _shard_regex.fullmatch(shard.strip())
+    if match is None or not 1 <= int(match.group(1)) <= int(match.group(2)):
+        raise ValueError(f"invalid shard: {shard.strip()!r}, which should be of the form i/N, where 1 <= i <= N")
+
+    return int(match.group(1)), int(match.group(2))
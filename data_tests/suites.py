@@ -0,0 +1,455 @@
+import itertools
+import time
+from typing import Iterator, NamedTuple, Optional, Type
+
+from data_tests import chunks, columnar, files, format_tests, profiling
+from data_tests.duplicate_entries import DuplicateEntries
+from data_tests.failures import SpooledMessage
+from data_tests.inconsistencies import VoteBreakdownTotals
+from data_tests.missing_values import MissingValue
+from data_tests.row_context import RowContext
+
+
+class CheckResult(NamedTuple):
+    name: str
+    passed: bool
+    failure_count: int
+    # The row number and the contents of the first failing rows, up to the number of examples printed to the console.
+    examples: list[tuple[int, list[str]]]
+
+
+class FileResult(NamedTuple):
+    passed: bool
+    failure_count: int
+    console_message: str
+    log_message: SpooledMessage
+    checks: tuple[CheckResult, ...] = ()
+    profile: Optional[profiling.FileProfile] = None
+
+    # Whether every check tested every row.  Otherwise, the failure counts are lower bounds, and the checks that passed
+    # may have failed on the rows that they didn't test.
+    complete: bool = True
+
+
+class RunOptions(NamedTuple):
+    # The engine that runs the checks: "python" tests each row in Python, and "numpy" runs the checks that support it
+    # as vectorized operations over chunks of rows.
+    engine: str = "python"
+
+    # Whether the time spent in each row test, and in reading and parsing the file, is measured.
+    profile: bool = False
+
+    # The number of failing rows that each check keeps as examples for its failure message, or -1 to keep every failing
+    # row.  If `sample_examples` is set, the examples are a uniform sample of the failing rows instead of the first
+    # ones.
+    max_examples: int = -1
+    sample_examples: bool = False
+
+    # Whether each check stops testing rows once it has `max_examples` failing rows, and whether each suite stops
+    # testing rows once any of its checks has failed.  The file stops being read once no check tests rows.
+    stop_after_examples: bool = False
+    fail_fast: bool = False
+
+
+class CheckSuite:
+    """
+    A family of checks that is run over a single file.  Each family corresponds to one of the data tests that can be
+    selected in `run_tests.py`.  Suites are fed the parsed rows of a file, so that any number of them can share a single
+    read of the file.
+    """
+    name = None
+
+    # The number of rows between the times that the checks are asked whether they're saturated.
+    saturation_interval = 1000
+
+    def __init__(self, headers: list[str], csv_file: Optional[str] = None, options: RunOptions = RunOptions()):
+        self._complete = True
+        self._context = RowContext(headers)
+        self._context_tests = []
+        self._header_checks = []
+        self._options = options
+        self._row_checks = []
+        self._row_tests = []
+        self._skipped_checks = []
+
+    @property
+    def checks(self) -> list:
+        return self._header_checks + self._row_checks
+
+    @property
+    def complete(self) -> bool:
+        return self._complete
+
+    @property
+    def failure_count(self) -> int:
+        return sum(check.failure_count for check in self.checks if not check.passed)
+
+    @property
+    def passed(self) -> bool:
+        return all(check.passed for check in self.checks)
+
+    def get_failure_message(self, max_examples: int = -1) -> str:
+        return "".join(self.iter_failure_message(max_examples=max_examples))
+
+    def get_console_message(self, max_examples: int = -1) -> str:
+        return f"\n\n{self.get_failure_message(max_examples=max_examples)}"
+
+    def get_check_results(self, max_examples: int = -1) -> tuple[CheckResult, ...]:
+        check_results = []
+        for check in self._sorted_checks():
+            if check.passed:
+                check_results.append(CheckResult(self._get_check_name(check), True, 0, []))
+            else:
+                check_results.append(CheckResult(self._get_check_name(check), False, check.failure_count,
+                                                 list(check.examples(max_examples=max_examples))))
+
+        return tuple(check_results)
+
+    def get_result(self, max_examples: int, log_max_examples: int) -> FileResult:
+        check_results = self.get_check_results(max_examples=max_examples)
+        if self.passed:
+            return FileResult(True, 0, "", SpooledMessage(), check_results, complete=self._complete)
+
+        note = "" if self._complete else "\n\n[Stopped testing rows early, so the counts are lower bounds]"
+        return FileResult(False, self.failure_count, self.get_console_message(max_examples=max_examples) + note,
+                          SpooledMessage(itertools.chain(self.iter_failure_message(max_examples=log_max_examples),
+                                                         [note])),
+                          check_results, complete=self._complete)
+
+    def close(self):
+        """
+        Releases the resources held by the checks, such as the temporary files of their failures, once their results
+        have been built.
+        """
+        for check in self.checks:
+            close = getattr(check, "close", None)
+            if close is not None:
+                close()
+
+    def drop_saturated_tests(self) -> bool:
+        """
+        Stops testing the rows with the checks that are saturated, or with every check once any check has failed if
+        the suite fails fast.  Returns whether no check tests rows anymore.
+        """
+        if not any(getattr(x, "saturated", False) for x in self._row_checks):
+            if not self._options.fail_fast or all(x.passed for x in self._header_checks):
+                return not self._row_tests and not self._context_tests
+
+        self._complete = False
+        row_tests = self._row_tests + self._context_tests
+        if self._options.fail_fast:
+            saturated_tests = row_tests
+        else:
+            for row_test in row_tests:
+                drop_saturated = getattr(row_test, "drop_saturated", None)
+                if drop_saturated is not None:
+                    drop_saturated()
+            saturated_tests = [x for x in row_tests if getattr(x, "saturated", False)]
+
+        # The saturated tests are finished, so that the rows that they have buffered are tested.
+        for row_test in saturated_tests:
+            finish = getattr(row_test, "finish", None)
+            if finish is not None:
+                finish()
+        self._row_tests = [x for x in self._row_tests if x not in saturated_tests]
+        self._context_tests = [x for x in self._context_tests if x not in saturated_tests]
+
+        return not self._row_tests and not self._context_tests
+
+    def finish(self):
+        """
+        Completes the checks once every row has been tested.
+        """
+        for row_test in self._row_tests + self._context_tests:
+            finish = getattr(row_test, "finish", None)
+            if finish is not None:
+                finish()
+
+    def get_timings(self) -> dict[str, tuple[int, float]]:
+        """
+        Returns the number of calls and the time spent in each row test, keyed by the name of the test, if the suite
+        is profiled.
+        """
+        timings = {}
+        for row_test in self._row_tests + self._context_tests:
+            if isinstance(row_test, profiling.TimedTest):
+                calls, seconds = timings.get(row_test.name, (0, 0.0))
+                timings[row_test.name] = (calls + row_test.timer.calls, seconds + row_test.timer.seconds)
+
+        return timings
+
+    def iter_failure_message(self, max_examples: int = -1) -> Iterator[str]:
+        separator = ""
+        for check in self._sorted_checks():
+            if not check.passed:
+                yield f"{separator}* "
+                yield from check.iter_failure_message(max_examples=max_examples)
+                separator = "\n\n"
+
+    def prescan(self, data: bytes):
+        """
+        Skips the value tests that can't fail on the raw contents `data` of the file, so that the rows aren't tested by
+        them.  The tests that inherit `could_fail` from a class whose `is_bad_value` they change are never skipped.
+        """
+        self._skipped_checks = [
+            x for x in self._row_checks
+            if isinstance(x, format_tests.ValueTest) and x.defines_with_is_bad_value("could_fail") and
+            not x.could_fail(data)
+        ]
+
+    def test_headers(self, headers: list[str], test_row: bool = True):
+        """
+        Tests the headers, and selects the tests that the rows are fed to.  Unless `test_row` is false, e.g., for the
+        chunks of a file that is validated in parallel, the headers are also tested as the first row.
+        """
+        # Checks are saturated once testing more rows can't change what's reported about them.
+        if self._options.fail_fast:
+            saturate_after = 1
+        elif self._options.stop_after_examples and self._options.max_examples >= 0:
+            saturate_after = max(self._options.max_examples, 1)
+        else:
+            saturate_after = -1
+
+        for check in self._row_checks:
+            failures = getattr(check, "failures", None)
+            if failures is not None:
+                failures.limit(self._options.max_examples, sample=self._options.sample_examples,
+                               saturate_after=saturate_after)
+            elif hasattr(check, "saturate_after"):
+                check.saturate_after = saturate_after
+                if hasattr(check, "max_examples"):
+                    check.max_examples = self._options.max_examples
+
+        # Checks that can't fail on the schema of the file, such as the vote checks of a file without vote columns,
+        # don't test the rows either.
+        self._row_tests = [
+            x for x in self._row_checks if x not in self._skipped_checks and getattr(x, "applies", True)
+        ]
+
+        # A profile times each check separately, so the checks are only combined when the suites aren't profiled.
+        if self._options.engine == "numpy" and not self._options.profile:
+            vectorized_checks = [x for x in self._row_tests if columnar.ColumnarChecks.supports(x)]
+            if vectorized_checks:
+                self._row_tests = [x for x in self._row_tests if x not in vectorized_checks]
+                self._row_tests.append(columnar.ColumnarChecks(headers, vectorized_checks))
+
+        fused_checks = [x for x in self._row_tests if format_tests.FusedValueTests.supports(x)]
+        if fused_checks and not self._options.profile:
+            self._row_tests = [x for x in self._row_tests if x not in fused_checks]
+            self._row_tests.append(format_tests.FusedValueTests(fused_checks))
+
+        # The tests that read the row context share the values that it derives from each row.
+        self._context_tests = [x for x in self._row_tests if hasattr(x, "test_context")]
+        self._row_tests = [x for x in self._row_tests if x not in self._context_tests]
+
+        if self._options.profile:
+            self._context_tests = [profiling.TimedTest(x) for x in self._context_tests]
+            self._row_tests = [profiling.TimedTest(x) for x in self._row_tests]
+
+        for check in self._header_checks:
+            check.test(headers)
+        if test_row:
+            self.test(headers)
+
+    def test(self, row: list[str], context: Optional[RowContext] = None):
+        """
+        Tests `row`.  If the suites that test the row share a `context`, it must already be updated with the row.
+        """
+        for row_test in self._row_tests:
+            row_test.test(row)
+
+        if self._context_tests:
+            if context is None:
+                context = self._context
+                context.update(row)
+            for context_test in self._context_tests:
+                context_test.test_context(context)
+
+    def _get_check_name(self, check) -> str:
+        return type(check).__name__
+
+    def _sorted_checks(self) -> list:
+        return self.checks
+
+
+class SingleCheckSuite(CheckSuite):
+    def __init__(self, headers: list[str], csv_file: Optional[str] = None, options: RunOptions = RunOptions()):
+        super().__init__(headers, csv_file=csv_file, options=options)
+        self._row_checks.append(self._create_check(headers, csv_file))
+
+    def get_console_message(self, max_examples: int = -1) -> str:
+        return self.get_failure_message(max_examples=max_examples)
+
+    def iter_failure_message(self, max_examples: int = -1) -> Iterator[str]:
+        return self._row_checks[0].iter_failure_message(max_examples=max_examples)
+
+    def _create_check(self, headers: list[str], csv_file: Optional[str]):
+        raise NotImplementedError()
+
+
+class DuplicateEntriesSuite(SingleCheckSuite):
+    name = "duplicate_entries"
+
+    def _create_check(self, headers: list[str], csv_file: Optional[str]):
+        # When the file is known, only the row fingerprints are kept in memory, and the duplicate rows are read again
+        # from the file when the failure message is built.
+        return DuplicateEntries(headers, csv_file=csv_file)
+
+
+class FileFormatSuite(CheckSuite):
+    name = "file_format"
+
+    def __init__(self, headers: list[str], csv_file: Optional[str] = None, options: RunOptions = RunOptions()):
+        super().__init__(headers, csv_file=csv_file, options=options)
+        self._header_checks.extend([
+            format_tests.EmptyHeaders(),
+            format_tests.LowercaseHeaders(),
+            format_tests.UnknownHeaders(),
+            format_tests.WhitespaceInHeaders(),
+        ])
+        self._row_checks.extend([
+            format_tests.ConsecutiveSpaces(),
+            format_tests.EmptyRows(),
+            format_tests.InconsistentNumberOfColumns(headers),
+            format_tests.LeadingAndTrailingSpaces(),
+            format_tests.NegativeVotes(headers),
+            format_tests.NonIntegerVotes(headers),
+            format_tests.PrematureLineBreaks(),
+            format_tests.TabCharacters(),
+        ])
+
+    def _sorted_checks(self) -> list:
+        return sorted(self.checks, key=lambda x: type(x).__name__)
+
+
+class MissingValuesSuite(CheckSuite):
+    name = "missing_values"
+
+    def __init__(self, headers: list[str], csv_file: Optional[str] = None, options: RunOptions = RunOptions()):
+        super().__init__(headers, csv_file=csv_file, options=options)
+        self._row_checks.extend([
+            MissingValue("county", headers),
+            MissingValue("precinct", headers),
+            MissingValue("office", headers),
+        ])
+
+    def _get_check_name(self, check) -> str:
+        return f"{type(check).__name__}({check.required_value})"
+
+
+class VoteBreakdownTotalsSuite(SingleCheckSuite):
+    name = "vote_breakdown_totals"
+
+    def _create_check(self, headers: list[str], csv_file: Optional[str]):
+        return VoteBreakdownTotals(headers)
+
+
+SUITES = {suite.name: suite for suite in (FileFormatSuite, DuplicateEntriesSuite, MissingValuesSuite,
+                                          VoteBreakdownTotalsSuite)}
+
+
+def run_suites(csv_file: str, suite_classes: list[Type[CheckSuite]], options: RunOptions = RunOptions(),
+               timers: Optional[dict[str, profiling.Timer]] = None) -> list[CheckSuite]:
+    """
+    Reads and parses `csv_file` once, sending the headers and each row to every suite in `suite_classes`.  If `timers`
+    are provided, the time spent reading and parsing the file is added to its "read" timer, and the time spent scanning
+    the raw contents to its "prescan" timer.
+    """
+    rows = files.read_rows(csv_file)
+    if timers is not None:
+        rows = profiling.time_iterator(rows, timers["read"])
+    headers = next(rows)
+
+    suites = [suite_class(headers, csv_file=csv_file, options=options) for suite_class in suite_classes]
+    start = time.perf_counter()
+    with files.map_file(csv_file) as data:
+        if data is not None:
+            for suite in suites:
+                suite.prescan(data)
+    if timers is not None:
+        timers["prescan"].add(start)
+
+    for suite in suites:
+        suite.test_headers(headers)
+    if options.stop_after_examples or options.fail_fast:
+        rows = _until_saturated(rows, suites)
+
+    # The suites share a single row context, so the values that it derives from each row are only derived once.
+    context = RowContext(headers)
+    for row in rows:
+        context.update(row)
+        for suite in suites:
+            suite.test(row, context)
+
+    for suite in suites:
+        suite.finish()
+
+    return suites
+
+
+def _until_saturated(rows: Iterator[list[str]], suites: list[CheckSuite]) -> Iterator[list[str]]:
+    # The checks are asked whether they're saturated before every `saturation_interval` rows, and the rest of the rows
+    # aren't read once no check tests them.
+    while not all([suite.drop_saturated_tests() for suite in suites]):
+        interval_rows = list(itertools.islice(rows, CheckSuite.saturation_interval))
+        if not interval_rows:
+            return
+        yield from interval_rows
+
+
+def _get_results(file_suites: list[CheckSuite], max_examples: int, log_max_examples: int) -> dict[str, FileResult]:
+    results = {}
+    for suite in file_suites:
+        results[suite.name] = suite.get_result(max_examples, log_max_examples)
+        suite.close()
+
+    return results
+
+
+def validate_file(csv_file: str, suite_names: list[str], max_examples: int, log_max_examples: int,
+                  options: RunOptions = RunOptions(), pool=None, chunk_count: int = 1) -> dict[str, FileResult]:
+    """
+    Runs the suites in `suite_names` over `csv_file`, returning the compact result of each suite keyed by its name.  If
+    the suites are profiled, the profile of the file is attached to the result of the first suite.  If a `pool` of
+    processes is provided, the file is split into up to `chunk_count` chunks that are validated by its workers, unless
+    the file can't be split, or the suites are profiled or sample their examples.
+    """
+    # Only the examples that appear in the messages are kept.  The rows after the examples printed to the console aren't
+    # tested if the checks stop after their examples, so the log file doesn't have more examples.
+    if options.stop_after_examples and max_examples >= 0:
+        options = options._replace(max_examples=max_examples)
+    elif max_examples < 0 or log_max_examples < 0:
+        options = options._replace(max_examples=-1)
+    else:
+        options = options._replace(max_examples=max(max_examples, log_max_examples))
+
+    if pool is not None and chunk_count > 1 and not (options.profile or options.sample_examples or
+                                                     options.stop_after_examples or options.fail_fast):
+        file_suites = chunks.run_chunked(csv_file, [SUITES[x] for x in suite_names], options, pool, chunk_count)
+        if file_suites is not None:
+            return _get_results(file_suites, max_examples, log_max_examples)
+
+    if not options.profile:
+        file_suites = run_suites(csv_file, [SUITES[x] for x in suite_names], options=options)
+        return _get_results(file_suites, max_examples, log_max_examples)
+
+    start = time.perf_counter()
+    timers = {"read": profiling.Timer(), "prescan": profiling.Timer(), "results": profiling.Timer()}
+    file_suites = run_suites(csv_file, [SUITES[x] for x in suite_names], options=options, timers=timers)
+
+    results = {}
+    for suite in file_suites:
+        results_start = time.perf_counter()
+        results[suite.name] = suite.get_result(max_examples, log_max_examples)
+        suite.close()
+        timers["results"].add(results_start)
+
+    timings = {name: (timer.calls, timer.seconds) for name, timer in timers.items()}
+    for suite in file_suites:
+        for name, (calls, seconds) in suite.get_timings().items():
+            total_calls, total_seconds = timings.get(name, (0, 0.0))
+            timings[name] = (total_calls + calls, total_seconds + seconds)
+
+    profile = profiling.FileProfile(timers["read"].calls, time.perf_counter() - start, timings)
+    results[suite_names[0]] = results[suite_names[0]]._replace(profile=profile)
+    return results
@@ -1,15 +1,65 @@
-import csv
-import glob
-import logging
+import functools
+import math
+import multiprocessing
+import multiprocessing.pool
 import os
 import pathlib
+import time
 import unittest
-from typing import Iterator
-
-from data_tests import format_tests
-from data_tests.duplicate_entries import DuplicateEntries
-from data_tests.inconsistencies import VoteBreakdownTotals
-from data_tests.missing_values import MissingValue
+from typing import Callable, Iterator, Optional, Union
+
+from data_tests import cache, scheduling, schemas, shards, suites
+from data_tests.cross_file_duplicates import CrossFileDuplicates
+from data_tests.failures import SpooledMessage
+from data_tests.files import expand_archive, get_stored_size, is_compressed, is_csv_file, matches, \
+    split_archive_path, walk_csv_files
+from data_tests.prefetch import Prefetcher
+from data_tests.profiling import Profiler
+from data_tests.reports import ReportWriter
+
+
+def _validate_file(csv_file_entry: tuple[str, str, str], suite_names: list[str], max_examples: int,
+                   log_max_examples: int, cache_dir: Optional[str] = None,
+                   options: suites.RunOptions = suites.RunOptions(), pool: Optional[multiprocessing.pool.Pool] = None,
+                   chunk_count: int = 1
+                   ) -> tuple[tuple[str, str, str], dict[str, Union[suites.FileResult, Exception]]]:
+    # Exceptions are returned rather than raised, so that they can be reported against the file that caused them
+    # regardless of whether the file was validated in this process or in a worker process.
+    try:
+        if cache_dir is None:
+            results = suites.validate_file(csv_file_entry[0], suite_names, max_examples, log_max_examples,
+                                           options=options, pool=pool, chunk_count=chunk_count)
+        else:
+            result_cache = cache.get_cache(cache_dir)
+            content_hash = cache.get_content_hash(csv_file_entry[0])
+
+            results = {}
+            for suite_name in suite_names:
+                result = result_cache.get(content_hash, suite_name, max_examples, log_max_examples)
+                if result is not None:
+                    results[suite_name] = result
+
+            uncached_suite_names = [x for x in suite_names if x not in results]
+            if uncached_suite_names:
+                uncached_results = suites.validate_file(csv_file_entry[0], uncached_suite_names, max_examples,
+                                                        log_max_examples, options=options, pool=pool,
+                                                        chunk_count=chunk_count)
+                for suite_name, result in uncached_results.items():
+                    result_cache.put(content_hash, suite_name, max_examples, log_max_examples, result)
+                results.update(uncached_results)
+    except Exception as exception:
+        results = {x: exception for x in suite_names}
+
+    return csv_file_entry, results
+
+
+def _time_validation(indexed_entry: tuple[int, tuple[str, str, str]], validate: Callable
+                     ) -> tuple[int, tuple[tuple[str, str, str], dict, float]]:
+    # The time is measured in the worker, so that it doesn't include the time that the file waited for a worker.
+    index, csv_file_entry = indexed_entry
+    start = time.perf_counter()
+    csv_file_entry, results = validate(csv_file_entry)
+    return index, (csv_file_entry, results, time.perf_counter() - start)
 
 
 class TestResult(unittest.TextTestResult):
@@ -36,179 +86,309 @@ class TestResult(unittest.TextTestResult):
 
 
 class TestCase(unittest.TestCase):
-    files = list()
-    log_file = None
+    cache_dir = None
+
+    # The size in bytes above which the files that are validated in parallel are split into chunks that are validated
+    # by all the workers, or 0 to validate every file in a single worker.
+    chunk_size = 0
+    cross_file_scope = "year"
+    engine = "python"
+    exclude = ()
+    fail_fast = False
+    files = None
+    include = ()
+    jobs = 1
     max_examples = -1
+    prefetch = 0
+    prefetch_max_bytes = 256 * 1024 * 1024
+    profiler: Optional[Profiler] = None
+    report_writer: Optional[ReportWriter] = None
     root_path = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+    schedule = "cost"
+    shard: Optional[tuple[int, int]] = None
+    stop_after_examples = False
+    tests = list()
+
+    # The number of seconds that each file took to validate, keyed by the path of the file relative to the root path,
+    # which are read from the timings of a previous run and updated with the timings of this run.
+    timings = {}
     truncate_log_file = False
+    years: Optional[set[str]] = None
 
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
+    # Results computed for suites whose tests have yet to run, keyed by file and then by suite name.  This allows all
+    # the selected suites to share a single read of each file.
+    _completed_suites = set()
+    _pending_results = {}
 
-        if TestCase.log_file is None:
-            self._logger = None
+    def _assertTrue(self, result: bool, description: str, console_message: str, log_message: SpooledMessage):
+        if not result and TestCase.report_writer is not None:
+            TestCase.report_writer.write_failure(description, log_message)
         else:
-            self._logger = TestCase._get_logger(type(self).__name__, TestCase.log_file)
-
-    def _assertTrue(self, result: bool, description: str, console_message: str, log_message: str):
-        if not result:
-            self._log_failure(description, log_message)
+            log_message.close()
         self.assertTrue(result, console_message)
 
-    def _log_failure(self, description: str, message: str):
-        if self._logger is not None:
-            self._logger.debug("======================================================================")
-            self._logger.debug(f"FAIL: {description}")
-            self._logger.debug("----------------------------------------------------------------------")
-            self._logger.debug(f"{message}\n")
+    @staticmethod
+    def discard_pending_results():
+        """
+        Removes the log messages of the results that were kept for suites whose tests didn't run, e.g., because the run
+        was interrupted.
+        """
+        for results in TestCase._pending_results.values():
+            for result in results.values():
+                if not isinstance(result, Exception):
+                    result.log_message.close()
+        TestCase._pending_results.clear()
+
+    @staticmethod
+    def _report_result(short_path: str, year: str, test: str, result: Union[suites.FileResult, Exception]):
+        if TestCase.report_writer is None:
+            return
 
-    def get_csv_files(self) -> Iterator[str]:
-        if TestCase.files:
-            file_list = [os.path.join(TestCase.root_path, x) for x in TestCase.files]
+        record = {"path": short_path, "year": year, "test": test}
+        if isinstance(result, Exception):
+            TestCase.report_writer.write_record({**record, "error": repr(result)})
         else:
-            file_list = glob.glob(os.path.join(TestCase.root_path, "[0-9]" * 4, "**", "*"), recursive=True)
+            # The counts of the files whose rows weren't all tested are marked as lower bounds.
+            if not result.complete:
+                record["lower_bound"] = True
+            for check in result.checks:
+                TestCase.report_writer.write_record({
+                    **record,
+                    "check": check.name,
+                    "passed": check.passed,
+                    "count": check.failure_count,
+                    "row_numbers": [x[0] for x in check.examples],
+                    "rows": [x[1] for x in check.examples],
+                })
+
+    def get_csv_files(self) -> Iterator[tuple[str, str, str]]:
+        if TestCase.shard is None:
+            yield from self._find_csv_files()
+            return
+
+        # All the files are found before any of them is tested, since the shards are balanced by the sizes of all the
+        # files.
+        csv_file_entries = list(self._find_csv_files())
+        costs = {}
+        for csv_file_entry in csv_file_entries:
+            unit = self._get_shard_unit(csv_file_entry)
+            costs[unit] = costs.get(unit, 0) + get_stored_size(csv_file_entry[0]) + shards.FILE_OVERHEAD
+
+        assignments = shards.assign_shards(costs, TestCase.shard[1])
+        for csv_file_entry in csv_file_entries:
+            if assignments[self._get_shard_unit(csv_file_entry)] == TestCase.shard[0]:
+                yield csv_file_entry
+
+    def _find_csv_files(self) -> Iterator[tuple[str, str, str]]:
+        if TestCase.files is not None:
+            # The specific files are filtered like the files that are found under the root path, and the members of
+            # the specific archives are tested instead of the archives.
+            file_list = (
+                y for x in TestCase.files for y in expand_archive(os.path.join(TestCase.root_path, x))
+                if TestCase._is_selected(pathlib.PurePath(os.path.relpath(y, TestCase.root_path)).parts)
+            )
+        else:
+            # The files are yielded as they are found, so that the first files are tested while the rest are found.
+            file_list = walk_csv_files(TestCase.root_path, years=TestCase.years, include=TestCase.include,
+                                       exclude=TestCase.exclude)
 
         for file in file_list:
-            if file.lower().endswith(".csv"):
+            # Archives are only left as they are if they couldn't be listed, so that the error is reported.
+            if is_csv_file(file) or file.lower().endswith(".zip"):
                 short_path = os.path.relpath(file, start=TestCase.root_path)
                 year = pathlib.Path(short_path).parts[0]
                 yield file, short_path, year
 
+    def _get_shard_unit(self, csv_file_entry: tuple[str, str, str]) -> str:
+        # The files are assigned to the shards one by one, unless a test compares them with each other.
+        return csv_file_entry[1]
+
     @staticmethod
-    def _get_logger(name: str, log_file: str) -> logging.Logger:
-        handler = logging.FileHandler(log_file)
-        handler.setFormatter(logging.Formatter("%(message)s"))
+    def _get_chunk_count(csv_file: str) -> int:
+        # Files are split into chunks of about `chunk_size` bytes, and into at least one chunk per worker.  Compressed
+        # files can't be split, since their byte ranges can't be read separately.
+        size = get_stored_size(csv_file)
+        if TestCase.chunk_size <= 0 or size <= TestCase.chunk_size or is_compressed(csv_file):
+            return 1
+        return max(math.ceil(size / TestCase.chunk_size), TestCase.jobs)
 
-        logger = logging.getLogger(name)
-        logger.setLevel(logging.DEBUG)
-        logger.addHandler(handler)
+    @staticmethod
+    def _get_log_max_examples() -> int:
+        # Every failing row is only kept when the log file has all of them.
+        if TestCase.truncate_log_file or TestCase.report_writer is None or not TestCase.report_writer.has_log_file:
+            return TestCase.max_examples
+        return -1
 
-        return logger
+    @staticmethod
+    def _is_selected(parts: tuple[str, ...]) -> bool:
+        if TestCase.years is not None and parts[0] not in TestCase.years:
+            return False
+        short_path = "/".join(parts)
+        return (not TestCase.include or matches(short_path, TestCase.include)) and \
+            not matches(short_path, TestCase.exclude)
+
+    def _get_results(self, suite_name: str) -> Iterator[tuple[tuple[str, str, str], dict]]:
+        suite_names = [suite_name]
+        suite_names.extend(x for x in TestCase.tests
+                           if x != suite_name and x in suites.SUITES and x not in TestCase._completed_suites)
+
+        validate = functools.partial(
+            _validate_file,
+            suite_names=suite_names,
+            max_examples=TestCase.max_examples,
+            log_max_examples=TestCase._get_log_max_examples(),
+            cache_dir=TestCase.cache_dir,
+            options=suites.RunOptions(engine=TestCase.engine, profile=TestCase.profiler is not None,
+                                      stop_after_examples=TestCase.stop_after_examples, fail_fast=TestCase.fail_fast)
+        )
+
+        # Files are only validated in parallel by the first suite to run.  The results of the remaining suites are
+        # kept until their tests run.
+        if TestCase.jobs <= 1 or TestCase._pending_results:
+            csv_file_entries = self.get_csv_files()
+            # The files whose results are pending have already been read, so there's nothing to read ahead.
+            if TestCase.prefetch > 0 and not TestCase._pending_results:
+                # The archives are read ahead for their members.
+                csv_file_entries = Prefetcher(csv_file_entries, get_path=lambda x: split_archive_path(x[0])[0],
+                                              depth=TestCase.prefetch, max_bytes=TestCase.prefetch_max_bytes)
+
+            for csv_file_entry in csv_file_entries:
+                pending_results = TestCase._pending_results.pop(csv_file_entry[0], None)
+                if pending_results is None:
+                    start = time.perf_counter()
+                    results = validate(csv_file_entry)
+                    TestCase.timings[csv_file_entry[1]] = time.perf_counter() - start
+                    yield results
+                else:
+                    yield csv_file_entry, pending_results
+        else:
+            csv_file_entries = self.get_csv_files()
+            if TestCase.schedule == "cost":
+                # All the files are found before any of them is validated, so that the most costly files are
+                # validated first rather than last.
+                csv_file_entries = list(csv_file_entries)
+                costs = scheduling.estimate_costs([get_stored_size(x[0]) for x in csv_file_entries],
+                                                  [TestCase.timings.get(x[1]) for x in csv_file_entries])
+                indexed_entries = [(i, csv_file_entries[i]) for i in scheduling.get_schedule(costs)]
+            else:
+                indexed_entries = enumerate(csv_file_entries)
+
+            chunked_entries = []
+            if TestCase.chunk_size > 0:
+                indexed_entries = list(indexed_entries)
+                chunked_entries = [x for x in indexed_entries if TestCase._get_chunk_count(x[1][0]) > 1]
+                chunked_indices = {x[0] for x in chunked_entries}
+                indexed_entries = [x for x in indexed_entries if x[0] not in chunked_indices]
+
+            # The workers compile the headers with the same known schemas and exemptions as this process.
+            registry = schemas.get_registry()
+            with multiprocessing.Pool(TestCase.jobs, initializer=schemas.set_registry,
+                                      initargs=(registry.known_schemas, registry.exemptions)) as pool:
+                # The files are sent to the workers one at a time as they become idle, and the results are returned in
+                # the order of the files, so that the output is deterministic.  The files that are split into chunks
+                # are validated first, one at a time, by all the workers.
+                def validate_all() -> Iterator[tuple[int, tuple[tuple[str, str, str], dict, float]]]:
+                    for indexed_entry in chunked_entries:
+                        chunk_count = TestCase._get_chunk_count(indexed_entry[1][0])
+                        yield _time_validation(indexed_entry, functools.partial(validate, pool=pool,
+                                                                                chunk_count=chunk_count))
+                    yield from pool.imap_unordered(functools.partial(_time_validation, validate=validate),
+                                                   indexed_entries)
+
+                for csv_file_entry, results, seconds in scheduling.in_order(validate_all()):
+                    TestCase.timings[csv_file_entry[1]] = seconds
+                    yield csv_file_entry, results
+
+    def _test_files(self, suite_name: str):
+        for (csv_file, short_path, year), results in self._get_results(suite_name):
+            with self.subTest(msg=f"{short_path}", group=year):
+                result = results.pop(suite_name)
+                if results:
+                    # The log messages of the results that are kept until their suites run are moved out of memory,
+                    # since the results of every file are kept.
+                    for pending_result in results.values():
+                        if not isinstance(pending_result, Exception):
+                            pending_result.log_message.spill()
+                    TestCase._pending_results[csv_file] = results
 
+                if TestCase.profiler is not None and getattr(result, "profile", None) is not None:
+                    TestCase.profiler.add(short_path, result.profile)
+                TestCase._report_result(short_path, year, suite_name, result)
+                if isinstance(result, Exception):
+                    raise result
 
-class DuplicateEntriesTest(TestCase):
-    def test_duplicate_entries(self):
-        log_file_max_examples = TestCase.max_examples if TestCase.truncate_log_file else -1
-        for csv_file, short_path, year in self.get_csv_files():
-            with self.subTest(msg=f"{short_path}", group=year):
-                with open(csv_file, "r") as csv_data:
-                    reader = csv.reader(csv_data)
-                    headers = next(reader)
+                self._assertTrue(result.passed, f"{self} [{short_path}]", result.console_message, result.log_message)
+
+        TestCase._completed_suites.add(suite_name)
+
+
+class CrossFileDuplicatesTest(TestCase):
+    def _get_shard_unit(self, csv_file_entry: tuple[str, str, str]) -> str:
+        # The files that are compared with each other are assigned to the same shard.
+        return CrossFileDuplicatesTest._get_scope(csv_file_entry)
+
+    @staticmethod
+    def _get_scope(csv_file_entry: tuple[str, str, str]) -> str:
+        if TestCase.cross_file_scope == "directory":
+            return os.path.dirname(csv_file_entry[1])
+        else:
+            return csv_file_entry[2]
+
+    def test_cross_file_duplicates(self):
+        scopes = {}
+        for csv_file_entry in self.get_csv_files():
+            scopes.setdefault(CrossFileDuplicatesTest._get_scope(csv_file_entry), []).append(csv_file_entry)
+
+        for scope in sorted(scopes):
+            index = CrossFileDuplicates()
+            try:
+                results = []
+                for csv_file, short_path, year in scopes[scope]:
+                    try:
+                        results.append(index.add_file(csv_file, short_path))
+                    except Exception as exception:
+                        results.append(exception)
+
+                for (csv_file, short_path, year), result in zip(scopes[scope], results):
+                    with self.subTest(msg=f"{short_path}", group=year):
+                        if isinstance(result, Exception):
+                            TestCase._report_result(short_path, year, "cross_file_duplicates", result)
+                            raise result
+
+                        log_file_max_examples = TestCase._get_log_max_examples()
+                        if result.passed:
+                            file_result = suites.FileResult(True, 0, "", SpooledMessage(),
+                                                            (suites.CheckResult(type(result).__name__, True, 0, []),))
+                        else:
+                            check_result = suites.CheckResult(type(result).__name__, False, result.failure_count,
+                                                              list(result.examples(TestCase.max_examples)))
+                            file_result = suites.FileResult(
+                                False, result.failure_count, result.get_failure_message(TestCase.max_examples),
+                                SpooledMessage(result.iter_failure_message(log_file_max_examples)), (check_result,)
+                            )
+
+                        TestCase._report_result(short_path, year, "cross_file_duplicates", file_result)
+                        self._assertTrue(file_result.passed, f"{self} [{short_path}]", file_result.console_message,
+                                         file_result.log_message)
+            finally:
+                index.close()
 
-                    data_test = DuplicateEntries(headers)
-                    data_test.test(headers)
-                    for row in reader:
-                        data_test.test(row)
 
-                console_message = data_test.get_failure_message(max_examples=TestCase.max_examples)
-                log_message = data_test.get_failure_message(max_examples=log_file_max_examples)
-                self._assertTrue(data_test.passed, f"{self} [{short_path}]", console_message, log_message)
+class DuplicateEntriesTest(TestCase):
+    def test_duplicate_entries(self):
+        self._test_files(suites.DuplicateEntriesSuite.name)
 
 
 class FileFormatTests(TestCase):
     def test_format(self):
-        log_file_max_examples = TestCase.max_examples if TestCase.truncate_log_file else -1
-        for csv_file, short_path, year in self.get_csv_files():
-            tests = set()
-
-            header_tests = {
-                format_tests.EmptyHeaders(),
-                format_tests.LowercaseHeaders(),
-                format_tests.UnknownHeaders(),
-                format_tests.WhitespaceInHeaders(),
-            }
-            tests.update(header_tests)
-
-            tests.add(format_tests.ConsecutiveSpaces())
-            tests.add(format_tests.EmptyRows())
-            tests.add(format_tests.LeadingAndTrailingSpaces())
-            tests.add(format_tests.PrematureLineBreaks())
-            tests.add(format_tests.TabCharacters())
-
-            with self.subTest(msg=f"{short_path}", group=year):
-                with open(csv_file, "r") as csv_data:
-                    reader = csv.reader(csv_data)
-                    headers = next(reader)
-
-                    tests.add(format_tests.InconsistentNumberOfColumns(headers))
-                    tests.add(format_tests.NegativeVotes(headers))
-                    tests.add(format_tests.NonIntegerVotes(headers))
-
-                    for test in tests:
-                        test.test(headers)
-
-                    row_tests = tests - header_tests
-                    for row in reader:
-                        for test in row_tests:
-                            test.test(row)
-
-                passed = True
-                console_message = ""
-                log_message = ""
-                is_first_message = True
-                for test in sorted(tests, key=lambda x: type(x).__name__):
-                    if not test.passed:
-                        passed = False
-                        console_message += f"\n\n* {test.get_failure_message(max_examples=TestCase.max_examples)}"
-                        if not is_first_message:
-                            log_message += "\n\n"
-                        log_message += f"* {test.get_failure_message(max_examples=log_file_max_examples)}"
-                        is_first_message = False
-
-                self._assertTrue(passed, f"{self} [{short_path}]", console_message, log_message)
+        self._test_files(suites.FileFormatSuite.name)
 
 
 class MissingValuesTest(TestCase):
     def test_missing_values(self):
-        log_file_max_examples = TestCase.max_examples if TestCase.truncate_log_file else -1
-        for csv_file, short_path, year in self.get_csv_files():
-            with self.subTest(msg=f"{short_path}", group=year):
-                tests = []
-                with open(csv_file, "r") as csv_data:
-                    reader = csv.reader(csv_data)
-                    headers = next(reader)
-
-                    tests.append(MissingValue("county", headers))
-                    tests.append(MissingValue("precinct", headers))
-                    tests.append(MissingValue("office", headers))
-
-                    for test in tests:
-                        test.test(headers)
-
-                    for row in reader:
-                        for test in tests:
-                            test.test(row)
-
-                passed = True
-                console_message = ""
-                log_message = ""
-                is_first_message = True
-                for test in tests:
-                    if not test.passed:
-                        passed = False
-                        console_message += f"\n\n* {test.get_failure_message(max_examples=TestCase.max_examples)}"
-                        if not is_first_message:
-                            log_message += "\n\n"
-                        log_message += f"* {test.get_failure_message(max_examples=log_file_max_examples)}"
-                        is_first_message = False
-
-                self._assertTrue(passed, f"{self} [{short_path}]", console_message, log_message)
+        self._test_files(suites.MissingValuesSuite.name)
 
 
 class VoteBreakdownTotalsTest(TestCase):
     def test_vote_method_totals(self):
-        log_file_max_examples = TestCase.max_examples if TestCase.truncate_log_file else -1
-        for csv_file, short_path, year in self.get_csv_files():
-            with self.subTest(msg=f"{short_path}", group=year):
-                with open(csv_file, "r") as csv_data:
-                    reader = csv.reader(csv_data)
-                    headers = next(reader)
-
-                    data_test = VoteBreakdownTotals(headers)
-                    data_test.test(headers)
-                    for row in reader:
-                        data_test.test(row)
-
-                console_message = data_test.get_failure_message(max_examples=TestCase.max_examples)
-                log_message = data_test.get_failure_message(max_examples=log_file_max_examples)
-                self._assertTrue(data_test.passed, f"{self} [{short_path}]", console_message, log_message)
+        self._test_files(suites.VoteBreakdownTotalsSuite.name)
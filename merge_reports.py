@@ -0,0 +1,33 @@
+import argparse
+import json
+import sys
+
+from data_tests.reports import format_failures, read_reports
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Combines the report files of several runs, e.g., of the shards of a "
+                                                 "run, and prints their failures.")
+    parser.add_argument("report_files", type=str, metavar="REPORT_FILE", nargs="+",
+                        help="the report files written by run_tests.py with --report-file")
+    parser.add_argument("--output", type=str,
+                        help="the path to a file that the combined records will be written to, one record per line")
+    parser.add_argument("--group-failures", action="store_true",
+                        help="group the failures by year using the GitHub Actions group and endgroup workflow commands")
+    args = parser.parse_args()
+
+    try:
+        records = read_reports(args.report_files)
+    except (OSError, ValueError, KeyError) as error:
+        parser.error(f"invalid report file: {error!r}")
+
+    if args.output is not None:
+        with open(args.output, "w") as output_data:
+            for record in records:
+                output_data.write(f"{json.dumps(record)}\n")
+
+    print(format_failures(records, group_failures=args.group_failures), end="", file=sys.stderr)
+
+    if any("error" in x or not x["passed"] for x in records):
+        exit(1)
+    else:
+        exit(0)
@@ -1,50 +1,221 @@
 import argparse
+import os
+import subprocess
+import sys
 import unittest
 
-from data_tests.test_data import (DuplicateEntriesTest, FileFormatTests, MissingValuesTest, TestCase, TestResult,
-                                  VoteBreakdownTotalsTest)
+from data_tests import columnar, schemas
+from data_tests.cache import ResultCache
+from data_tests.changes import get_changed_files
+from data_tests.files import parse_years
+from data_tests.profiling import Profiler
+from data_tests.reports import ReportWriter
+from data_tests.scheduling import load_timings, save_timings
+from data_tests.shards import parse_shard
+from data_tests.suites import SUITES
+from data_tests.test_data import (CrossFileDuplicatesTest, DuplicateEntriesTest, FileFormatTests, MissingValuesTest,
+                                  TestCase, TestResult, VoteBreakdownTotalsTest)
+
+test_classes = {
+    "file_format": FileFormatTests,
+    "duplicate_entries": DuplicateEntriesTest,
+    "missing_values": MissingValuesTest,
+    "vote_breakdown_totals": VoteBreakdownTotalsTest,
+    "cross_file_duplicates": CrossFileDuplicatesTest,
+}
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
-    parser.add_argument("test", choices=["file_format", "duplicate_entries", "missing_values",
-                                         "vote_breakdown_totals"], type=str, help="the data test to run")
+    parser.add_argument("test", type=str, metavar=f"{{all,{','.join(test_classes)}}}",
+                        help="the data test to run.  Several tests can be run over a single read of each file by "
+                             "separating them with commas, or by specifying 'all', which runs every test except "
+                             "cross_file_duplicates.")
     parser.add_argument("root_path", type=str, help="the absolute path to the repository containing files to test")
+    parser.add_argument("--cache-dir", type=str,
+                        help="the path to a directory where the results are cached.  Files whose contents haven't "
+                             "changed since they were last tested are not tested again.")
+    parser.add_argument("--cache-max-age", type=float, metavar="DAYS",
+                        help="evict cached results that haven't been used in this many days")
+    parser.add_argument("--cache-max-entries", type=int, metavar="N",
+                        help="evict the least recently used cached results beyond this many entries")
+    parser.add_argument("--clear-cache", action="store_true", help="clear the cached results before running the tests")
+    parser.add_argument("--cross-file-scope", choices=["year", "directory"], default="year",
+                        help="the files that are compared by the cross_file_duplicates test: all the files of the same "
+                             "year, or all the files in the same directory")
+    parser.add_argument("--engine", choices=["python", "numpy"], default="python",
+                        help="the engine that runs the checks.  The numpy engine runs the vote, whitespace, tab and "
+                             "newline checks as vectorized operations over chunks of rows, and requires NumPy.")
     parser.add_argument("--files", type=str, metavar="FILE", nargs="+", help="limit the tests to these specific files, "
                                                                              "specified relative to the root path")
+    parser.add_argument("--include", type=str, metavar="GLOB", nargs="+", default=(),
+                        help="limit the tests to the files whose paths relative to the root path match one of these "
+                             "globs, e.g., '2020/counties/*'")
+    parser.add_argument("--exclude", type=str, metavar="GLOB", nargs="+", default=(),
+                        help="skip the files and directories whose paths relative to the root path match one of these "
+                             "globs")
+    parser.add_argument("--years", type=str, metavar="YEARS",
+                        help="limit the tests to the files of these years, as a comma-separated list of years and "
+                             "ranges of years, e.g., 2016-2020,2022")
+    parser.add_argument("--since", type=str, metavar="REF",
+                        help="limit the tests to the files that have been added or modified since this git revision, "
+                             "including uncommitted and untracked files")
+    parser.add_argument("--shard", type=str, metavar="I/N",
+                        help="split the files into N shards balanced by their sizes, and only test the files of shard "
+                             "I, from 1 to N, e.g., 2/4.  Every run with the same files and N assigns them to the same "
+                             "shards, and the report files of the shards can be combined with merge_reports.py.")
     parser.add_argument("--group-failures", action="store_true",
                         help="group the failures by year in the console output using the GitHub Actions group and "
                              "endgroup workflow commands")
+    parser.add_argument("--jobs", type=int, default=1, metavar="N",
+                        help="the number of processes that files are validated in.  If 0 is provided, the number of "
+                             "CPUs is used.")
+    parser.add_argument("--chunk-size", type=int, default=0, metavar="MB",
+                        help="split the files larger than this many megabytes into chunks of about this size that are "
+                             "validated by all the processes, and into at least one chunk per process.  Only applies "
+                             "when --jobs isn't 1, and not to compressed files or when --profile is specified.")
+    parser.add_argument("--schedule", choices=["cost", "path"], default="cost",
+                        help="the order that files are validated in when --jobs isn't 1: from the most to the least "
+                             "costly, as estimated from --timings-file or from their sizes, or in the order of their "
+                             "paths, which starts validating files before all of them have been found.  The results "
+                             "are reported in the order of the paths either way.")
+    parser.add_argument("--timings-file", type=str,
+                        help="the path to a JSON file that the time taken to validate each file is read from, to "
+                             "estimate how costly the files are, and written to once the tests have run")
     parser.add_argument("--log-file", type=str, help="the absolute path to a file that the full failure messages will "
                                                      "be written to")
+    parser.add_argument("--prefetch", type=int, default=0, metavar="N",
+                        help="read up to this many of the next files in the background while a file is tested, so "
+                             "that they are in the page cache by the time they are tested.  Only applies when --jobs "
+                             "is 1.")
+    parser.add_argument("--prefetch-memory", type=int, default=256, metavar="MB",
+                        help="the maximum number of megabytes that are read ahead of the tests by --prefetch.  "
+                             "Larger files are only partly read ahead.")
+    parser.add_argument("--profile", action="store_true",
+                        help="measure the time spent reading each file and in each check, and report the time per "
+                             "check and the slowest files once the tests have run.  Each check is timed separately, "
+                             "so the checks that are otherwise run together, including by the numpy engine, are run "
+                             "one by one.  Cached results aren't profiled.")
+    parser.add_argument("--report-file", type=str,
+                        help="the absolute path to a file that a JSON record of the result of each check for each file "
+                             "will be written to, one record per line")
+    parser.add_argument("--schemas-file", type=str,
+                        help="the path to a JSON file with additional known schemas, whose vote breakdowns are "
+                             "compared with the votes for equality by the vote_breakdown_totals test, and additional "
+                             "rules that exempt candidates from the vote checks")
     parser.add_argument("--truncate-log-file", action="store_true",
                         help="truncate the entries in the log file according to the --max-examples option.")
     parser.add_argument("--max-examples", type=int, default=10, metavar="N",
                         help="the maximum number of failing rows to print to the console. If a negative value is "
                              "provided, all failures will be printed.")
+    parser.add_argument("--stop-after-examples", action="store_true",
+                        help="stop testing the rows of a file with each check once it has found --max-examples failing "
+                             "rows, and stop reading the file once every check has stopped.  The failure counts are "
+                             "then lower bounds, and the log file only has the examples printed to the console.")
+    parser.add_argument("--fail-fast", action="store_true",
+                        help="stop testing the rows of a file for a test once any of its checks has failed, and stop "
+                             "reading the file once every test has stopped.  The failure counts are then lower bounds, "
+                             "and only the first failing rows are printed.  Doesn't apply to cross_file_duplicates.")
     args = parser.parse_args()
 
+    selected_tests = args.test.split(",")
+    unknown_tests = [x for x in selected_tests if x != "all" and x not in test_classes]
+    if unknown_tests:
+        parser.error(f"argument test: invalid choice: {', '.join(repr(x) for x in unknown_tests)} (choose from "
+                     f"{', '.join(repr(x) for x in ['all', *test_classes])})")
+
+    tests = [x for x in test_classes if x in selected_tests or ("all" in selected_tests and x in SUITES)]
+
+    if args.engine == "numpy" and not columnar.is_available():
+        parser.error("argument --engine: the numpy engine requires NumPy to be installed")
+
+    if args.schemas_file is not None:
+        try:
+            schemas.get_registry().load(args.schemas_file)
+        except (OSError, ValueError) as error:
+            parser.error(f"argument --schemas-file: {error}")
+
+    years = None
+    if args.years is not None:
+        try:
+            years = parse_years(args.years)
+        except ValueError as error:
+            parser.error(f"argument --years: {error}")
+
+    timings = {}
+    if args.timings_file is not None:
+        try:
+            timings = load_timings(args.timings_file)
+        except (OSError, ValueError) as error:
+            parser.error(f"argument --timings-file: {error}")
+
+    shard = None
+    if args.shard is not None:
+        try:
+            shard = parse_shard(args.shard)
+        except ValueError as error:
+            parser.error(f"argument --shard: {error}")
+
+    files = args.files
+    if args.since is not None:
+        try:
+            changed_files = get_changed_files(args.root_path, args.since)
+        except subprocess.CalledProcessError as error:
+            parser.error(f"argument --since: {error.stderr.decode().strip()}")
+
+        if files is None:
+            files = changed_files
+        else:
+            files = [x for x in files if os.path.normpath(x) in changed_files]
+
+    if args.cache_dir is not None:
+        result_cache = ResultCache(args.cache_dir)
+        if args.clear_cache:
+            result_cache.clear()
+        max_age = None if args.cache_max_age is None else args.cache_max_age * 24 * 60 * 60
+        result_cache.evict(max_entries=args.cache_max_entries, max_age=max_age)
+        result_cache.close()
+
+    TestCase.cache_dir = args.cache_dir
+    TestCase.chunk_size = args.chunk_size * 1024 * 1024
     TestCase.root_path = args.root_path
-    TestCase.files = args.files
-    TestCase.log_file = args.log_file
+    TestCase.cross_file_scope = args.cross_file_scope
+    TestCase.engine = args.engine
+    TestCase.exclude = args.exclude
+    TestCase.fail_fast = args.fail_fast
+    TestCase.files = files
+    TestCase.include = args.include
+    TestCase.jobs = args.jobs if args.jobs > 0 else os.cpu_count()
     TestCase.max_examples = args.max_examples
+    TestCase.prefetch = args.prefetch
+    TestCase.prefetch_max_bytes = args.prefetch_memory * 1024 * 1024
+    TestCase.profiler = Profiler() if args.profile else None
+    TestCase.schedule = args.schedule
+    TestCase.shard = shard
+    TestCase.stop_after_examples = args.stop_after_examples
+    TestCase.tests = tests
+    TestCase.timings = timings
     TestCase.truncate_log_file = args.truncate_log_file
-
-    test_class = None
-    if args.test == "file_format":
-        test_class = FileFormatTests
-    elif args.test == "duplicate_entries":
-        test_class = DuplicateEntriesTest
-    elif args.test == "missing_values":
-        test_class = MissingValuesTest
-    elif args.test == "vote_breakdown_totals":
-        test_class = VoteBreakdownTotalsTest
-    else:
-        raise ValueError(f"Unrecognized data test '{args.test}'.")
+    TestCase.years = years
 
     result_class = TestResult if args.group_failures else None
     test_runner = unittest.TextTestRunner(resultclass=result_class)
-    test_suite = unittest.defaultTestLoader.loadTestsFromTestCase(test_class)
-    result = test_runner.run(test_suite)
+    test_suite = unittest.TestSuite(
+        unittest.defaultTestLoader.loadTestsFromTestCase(test_classes[test]) for test in tests
+    )
+    if args.log_file is not None or args.report_file is not None:
+        TestCase.report_writer = ReportWriter(log_file=args.log_file, report_file=args.report_file)
+    try:
+        result = test_runner.run(test_suite)
+    finally:
+        TestCase.discard_pending_results()
+        if TestCase.report_writer is not None:
+            TestCase.report_writer.close()
+
+    if args.timings_file is not None:
+        save_timings(args.timings_file, TestCase.timings)
+
+    if TestCase.profiler is not None:
+        print(f"\n{TestCase.profiler.get_report()}", file=sys.stderr)
 
     if result.wasSuccessful():
         exit(0)
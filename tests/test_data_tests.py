@@ -1,15 +1,432 @@
 import csv
 import glob
+import json
+import multiprocessing
 import os
+import pathlib
+import pickle
 import re
 import subprocess
 import tempfile
+import threading
 import unittest
+import warnings
+import zipfile
+from unittest import mock
 
-from data_tests import duplicate_entries, inconsistencies, missing_values
+from benchmarks import corpus
+from data_tests import cache, candidates, changes, chunks, columnar, cross_file_duplicates, duplicate_entries, \
+    failures, files, format_tests, inconsistencies, missing_values, prefetch, row_context, scheduling, \
+    schemas, shards, suites, test_data
+
+
+class CandidateClassifierTest(unittest.TestCase):
+    def test_classify(self):
+        classifier = candidates.CandidateClassifier()
+        self.assertEqual(frozenset(), classifier.get_exemptions("Jane Doe"))
+        self.assertEqual({"NegativeVotes", "VoteBreakdownTotals"}, classifier.get_exemptions("Over / Under Votes"))
+        self.assertEqual({"NegativeVotes"}, classifier.get_exemptions("Under Votes"))
+        self.assertEqual(frozenset(), classifier.get_exemptions("Under Votes Cast"))
+        self.assertEqual({"NonIntegerVotes"}, classifier.get_exemptions("Turnout PCT"))
+
+        classifier.get_exemptions("Jane Doe")
+        self.assertEqual(1, classifier.get_exemptions.cache_info().hits)
+
+    def test_rules(self):
+        rule = candidates.ExemptionRule(r"\Atotal", frozenset({"NegativeVotes", "NonIntegerVotes"}))
+        classifier = candidates.CandidateClassifier([*candidates.DEFAULT_EXEMPTIONS, rule])
+        self.assertEqual({"NegativeVotes", "NonIntegerVotes"}, classifier.get_exemptions("Total Percent"))
+        self.assertEqual(frozenset(), classifier.get_exemptions("Grand Total"))
+
+        with mock.patch.object(schemas, "_registry", schemas.SchemaRegistry(exemptions=[rule])):
+            check = format_tests.NegativeVotes(["candidate", "votes"])
+            for row in [["candidate", "votes"], ["Total", "-1"], ["Under Votes", "-2"]]:
+                check.test(row)
+        self.assertEqual([3], [x[0] for x in check.examples()])
+
+
+class ChangedFilesTest(unittest.TestCase):
+    def setUp(self):
+        self.repository = tempfile.TemporaryDirectory()
+        self.git("init", "-q")
+
+        for path in ["2020/a.csv", "2020/b.csv", "2020/c.csv", "2020/d.csv", "2020/e.txt", "2022/counties/f.csv"]:
+            self.write(path)
+        self.git("add", "-A")
+        self.git("commit", "-q", "-m", "Initial commit")
+
+    def tearDown(self):
+        self.repository.cleanup()
+
+    def git(self, *args):
+        subprocess.run(["git", "-C", self.repository.name, "-c", "user.name=test", "-c", "user.email=test@test",
+                        *args], check=True, capture_output=True)
+
+    def write(self, path, contents="a,b\n1,2\n"):
+        full_path = os.path.join(self.repository.name, path)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        with open(full_path, "w") as file:
+            file.write(contents)
+
+    def test_changes(self):
+        self.assertEqual([], changes.get_changed_files(self.repository.name, "HEAD"))
+
+        self.write("2020/a.csv", "a,b\n1,3\n")
+        self.git("rm", "-q", "2020/b.csv")
+        self.git("mv", "2020/c.csv", "2020/g.csv")
+        self.write("2020/e.txt", "modified")
+        self.write("2021/h.csv")
+        self.write("i.csv")
+        self.git("add", "-A")
+        self.git("commit", "-q", "-m", "Second commit")
+        self.write("2022/counties/f.csv", "a,b\n1,3\n")
+        self.write("2022/j.csv")
+
+        expected_files = [os.path.join("2020", "a.csv"), os.path.join("2020", "g.csv"), os.path.join("2021", "h.csv"),
+                          os.path.join("2022", "counties", "f.csv"), os.path.join("2022", "j.csv")]
+        self.assertEqual(expected_files, changes.get_changed_files(self.repository.name, "HEAD~1"))
+        self.assertEqual(expected_files[3:], changes.get_changed_files(self.repository.name, "HEAD"))
+
+    def test_invalid_ref(self):
+        with self.assertRaises(subprocess.CalledProcessError):
+            changes.get_changed_files(self.repository.name, "missing-ref")
+
+
+class ChunksTest(unittest.TestCase):
+    def test_find_boundaries(self):
+        data = b'a,b\n1,"x\ny"\n2,"""\n"""\n3,z\n4,"\n\n"\n'
+        boundaries = chunks.find_boundaries(data, 8)
+        self.assertEqual(4, boundaries[0])
+        self.assertEqual(len(data), boundaries[-1])
+        self.assertEqual(sorted(set(boundaries)), boundaries)
+        for start, end in zip(boundaries, boundaries[1:]):
+            self.assertEqual(0, data.count(b'"', 0, end) % 2)
+            self.assertEqual(data[start:end], b"".join(x for x in [b'1,"x\ny"\n', b'2,"""\n"""\n', b"3,z\n",
+                                                                     b'4,"\n\n"\n'] if start <= data.find(x) < end))
+
+        self.assertEqual([["1", "x\ny"]], chunks._parse(b'1,"x\ny"\n', is_last=False))
+        self.assertEqual([["1", 'x"y']], chunks._parse(b'1,x"y\n', is_last=False))
+        self.assertIsNone(chunks._parse(b'1,"x\n', is_last=False))
+
+    def test_validate(self):
+        headers = ["county", "precinct", "office", "district", "candidate", "votes", "election_day", "mail"]
+        rows = [headers]
+        for i in range(300):
+            row = [f"County {i % 5}", f"Precinct {i % 40}", "Office\nA" if i % 23 == 0 else "Office", "1",
+                   "Over Votes" if i % 31 == 0 else f"Candidate {i % 3}", str(i % 17 - 2), "1", "2.5" if i % 19 else ""]
+            rows.append(row)
+            if i % 37 == 0:
+                rows.append([])
+            if i % 41 == 0:
+                rows.append(row[:-1])
+
+        # Duplicates of rows in earlier chunks, and within a chunk.
+        rows.extend(rows[1:300:29])
+        rows.extend(rows[-3:])
+
+        with tempfile.NamedTemporaryFile("w", suffix=".csv", newline="") as csv_file:
+            csv.writer(csv_file).writerows(rows)
+            csv_file.flush()
+
+            expected_results = suites.validate_file(csv_file.name, list(suites.SUITES), 5, -1)
+            with multiprocessing.Pool(2) as pool:
+                for chunk_count in [2, 7, 50]:
+                    for engine in ["python", "numpy"] if columnar.is_available() else ["python"]:
+                        self.assertIsNotNone(chunks.run_chunked(csv_file.name, list(suites.SUITES.values()),
+                                                                suites.RunOptions(engine=engine), pool, chunk_count))
+                        results = suites.validate_file(csv_file.name, list(suites.SUITES), 5, -1,
+                                                       options=suites.RunOptions(engine=engine), pool=pool,
+                                                       chunk_count=chunk_count)
+                        self.assertEqual(expected_results, results)
+
+        for suite_name in suites.SUITES:
+            self.assertFalse(expected_results[suite_name].passed)
+
+
+@unittest.skipUnless(columnar.is_available(), "NumPy isn't installed")
+class ColumnarChecksTest(unittest.TestCase):
+    def test_engines(self):
+        values = ["1", "-1", "2.5", "3.0", "", "x", "nan", "inf", "-0", "1e3", "٣", " 4 ", "99999999999999999999",
+                  "999999999999999", "1000000000000001", "0012"]
+        entries = ["a", "b c", "b  c", " a", "a ", "a\tb", "a\nb", "\u3000a", "a\xa0\xa0b", "a" * 300 + "  "]
+        candidates = ["A", "Over Votes", "under", "Total", "Registered Voters", "Ballots Cast"]
+        headers = ["county", "precinct", "office", "district", "candidate", "votes", "early_voting", "election_day",
+                   "provisional", "mail"]
+
+        rows = [headers]
+        for i in range(500):
+            row = [entries[i % len(entries)], entries[(i // 3) % len(entries)], "office", "1",
+                   candidates[(i // 7) % len(candidates)]]
+            row.extend(values[(i * j + j) % len(values)] for j in range(5))
+            rows.append(row if i % 50 else row[:-1])
+
+        with tempfile.NamedTemporaryFile("w", suffix=".csv", newline="") as csv_file:
+            csv.writer(csv_file).writerows(rows)
+            csv_file.flush()
+
+            expected_results = suites.validate_file(csv_file.name, list(suites.SUITES), -1, -1)
+            for chunk_size in [1, 7, 10000]:
+                with mock.patch.object(columnar.ColumnarChecks, "chunk_size", chunk_size):
+                    results = suites.validate_file(csv_file.name, list(suites.SUITES), -1, -1,
+                                                   options=suites.RunOptions(engine="numpy"))
+                self.assertEqual(expected_results, results)
+
+        self.assertFalse(expected_results["file_format"].passed)
+        self.assertFalse(expected_results["vote_breakdown_totals"].passed)
+
+    def test_infinite_components(self):
+        rows = [["county", "precinct", "office", "district", "candidate", "votes", "early_voting", "election_day"],
+                ["a", "b", "c", "1", "d", "1", "inf", "-inf"], ["a", "b", "c", "1", "e", "2", "1", "1"]]
+        with tempfile.NamedTemporaryFile("w", suffix=".csv", newline="") as csv_file:
+            csv.writer(csv_file).writerows(rows)
+            csv_file.flush()
+
+            expected_results = suites.validate_file(csv_file.name, ["vote_breakdown_totals"], -1, -1)
+            with warnings.catch_warnings():
+                warnings.simplefilter("error")
+                results = suites.validate_file(csv_file.name, ["vote_breakdown_totals"], -1, -1,
+                                               options=suites.RunOptions(engine="numpy"))
+
+        self.assertEqual(expected_results, results)
+
+
+class CompressedFilesTest(unittest.TestCase):
+    def setUp(self):
+        self.root_path = tempfile.TemporaryDirectory()
+        self.rows = [["county", "candidate", "votes"], ["a", "b", "-1"], ["a", "b  c", "2.5"], [], ["a", "b", "1"]]
+        self.contents = "".join(",".join(x) + "\n" for x in self.rows).encode()
+
+        os.makedirs(os.path.join(self.root_path.name, "2020"))
+        for suffix, decompressor in files.DECOMPRESSORS.items():
+            with decompressor(os.path.join(self.root_path.name, "2020", f"a{suffix}"), "wb") as compressed_data:
+                compressed_data.write(self.contents)
+        with zipfile.ZipFile(os.path.join(self.root_path.name, "2020", "b.zip"), "w") as archive_data:
+            for member in ["c.csv", "d/e.csv", ".f.csv", "g.txt"]:
+                archive_data.writestr(member, self.contents)
+        with open(os.path.join(self.root_path.name, "2020", "h.csv"), "wb") as csv_data:
+            csv_data.write(self.contents)
+
+    def tearDown(self):
+        self.root_path.cleanup()
+
+    def test_walk(self):
+        paths = [os.path.relpath(x, self.root_path.name).replace(os.sep, "/")
+                 for x in files.walk_csv_files(self.root_path.name)]
+        self.assertEqual(["2020/a.csv.bz2", "2020/a.csv.gz", "2020/a.csv.xz", "2020/b.zip/c.csv", "2020/b.zip/d/e.csv",
+                          "2020/h.csv"], paths)
+        self.assertEqual(["2020/b.zip/d/e.csv"],
+                         [os.path.relpath(x, self.root_path.name).replace(os.sep, "/")
+                          for x in files.walk_csv_files(self.root_path.name, include=["*/d/*"])])
+
+    def test_read(self):
+        expected_results = suites.validate_file(os.path.join(self.root_path.name, "2020", "h.csv"),
+                                                list(suites.SUITES), -1, -1)
+        self.assertFalse(expected_results["file_format"].passed)
+
+        for csv_file in files.walk_csv_files(self.root_path.name):
+            self.assertEqual(self.rows, list(files.read_rows(csv_file)))
+            self.assertEqual(expected_results, suites.validate_file(csv_file, list(suites.SUITES), -1, -1))
+            with files.map_file(csv_file) as data:
+                self.assertEqual(csv_file.endswith("h.csv"), data is not None)
+
+    def test_streaming(self):
+        csv_file = os.path.join(self.root_path.name, "2020", "a.csv.gz")
+        with mock.patch.object(files.DecompressedStream, "chunk_size", 5), \
+                mock.patch.object(files.DecompressedStream, "queue_size", 1):
+            self.assertEqual(self.rows, list(files.read_rows(csv_file)))
+
+            # The decompression stops when the file isn't read to the end.
+            thread_count = threading.active_count()
+            rows = files.read_rows(csv_file)
+            self.assertEqual(self.rows[0], next(rows))
+            self.assertEqual(thread_count + 1, threading.active_count())
+            rows.close()
+            self.assertEqual(thread_count, threading.active_count())
+
+    def test_invalid(self):
+        for name in ["i.csv.gz", "j.zip"]:
+            with open(os.path.join(self.root_path.name, "2020", name), "w") as invalid_data:
+                invalid_data.write("a,b\n")
+
+        paths = list(files.walk_csv_files(self.root_path.name, include=["2020/[ij]*"]))
+        self.assertEqual([os.path.join(self.root_path.name, "2020", x) for x in ["i.csv.gz", "j.zip"]], paths)
+        for path in paths:
+            with self.assertRaises(Exception):
+                list(files.read_rows(path))
+
+
+class CorpusTest(unittest.TestCase):
+    def test_clean(self):
+        with tempfile.TemporaryDirectory() as root_path:
+            csv_file = os.path.join(root_path, "a.csv")
+            corpus.write_file(csv_file, 1000, corpus.Corpus(quote_rate=0.5))
+            for suite in suites.run_suites(csv_file, list(suites.SUITES.values())):
+                self.assertTrue(suite.passed, suite.name)
+
+    def test_errors(self):
+        options = corpus.Corpus(error_rate=0.2, quote_rate=0.1, ragged_rate=0.05, seed=3)
+        rows = list(corpus.generate_rows(1000, options))
+        self.assertEqual(1001, len(rows))
+        self.assertEqual(rows, list(corpus.generate_rows(1000, options)))
+        self.assertNotEqual(rows, list(corpus.generate_rows(1000, options._replace(seed=4))))
+
+        with tempfile.TemporaryDirectory() as root_path:
+            csv_file = os.path.join(root_path, "a.csv")
+            corpus.write_file(csv_file, 1000, options)
+            # Rows whose only entry is empty are written as empty lines.
+            self.assertEqual([x if x != [""] else [] for x in rows], list(files.read_rows(csv_file)))
+            for suite in suites.run_suites(csv_file, list(suites.SUITES.values())):
+                self.assertFalse(suite.passed, suite.name)
+
+
+class CrossFileDuplicatesTest(unittest.TestCase):
+    def test_duplicates(self):
+        files = {
+            "a.csv": [
+                ["county", "precinct", "candidate", "votes"],
+                ["a", "1", "x", "10"],
+                ["a", "2", "x", "20"],
+                ["a", "3", "x", "30"],
+                ["", "", "", ""],
+            ],
+            "b.csv": [
+                ["precinct", "county", "votes", "candidate"],  # Same columns in a different order
+                ["1", "a", "11", "x"],  # Duplicate of a.csv row 2
+                ["4", "a", "40", "x"],
+                ["3", "a"],  # Ragged
+                ["", "", "", ""],
+            ],
+            "c.csv": [
+                ["county", "precinct", "office", "votes"],  # Different columns
+                ["a", "1", "x", "10"],
+            ],
+            "d.csv": [
+                ["county", "precinct", "candidate", "votes"],
+                ["a", "5", "x", "50"],
+                ["a", "5", "x", "50"],  # Duplicate within the same file
+            ],
+        }
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            index = cross_file_duplicates.CrossFileDuplicates()
+            results = {}
+            for name, rows in files.items():
+                csv_file_path = os.path.join(temp_dir, name)
+                with open(csv_file_path, "w") as csv_file:
+                    csv.writer(csv_file).writerows(rows)
+                results[name] = index.add_file(csv_file_path, name)
+
+            self.assertFalse(results["a.csv"].passed)
+            self.assertEqual(1, results["a.csv"].failure_count)
+            failure_message = results["a.csv"].get_failure_message()
+            self.assertRegex(failure_message, "1 entries are duplicated")
+            self.assertRegex(failure_message, "Row 2: " + re.escape(f"{files['a.csv'][1]}") + r" \(also b.csv, row 2\)")
+            self.assertNotRegex(failure_message, "Row [345]")
+
+            self.assertFalse(results["b.csv"].passed)
+            failure_message = results["b.csv"].get_failure_message(max_examples=0)
+            self.assertRegex(failure_message, "1 entries are duplicated")
+            self.assertRegex(failure_message, "Truncated to 0 examples")
+            self.assertNotRegex(failure_message, "Row 2")
+
+            self.assertTrue(results["c.csv"].passed)
+            self.assertTrue(results["d.csv"].passed)
+            index.close()
 
 
 class DuplicateEntriesTest(unittest.TestCase):
+    def test_compact(self):
+        rows = [
+            ["header 1", "header 2", "votes"],
+            ["a", "b", "1"],
+            ["c", "d", "2"],
+            ["c", "d", "3"],
+            ["a", "b", "4"],
+            ["", "", ""],
+            ["a", "b"],
+            ["a", "b", "5"],
+            ["a", "b"],
+            ["", "", ""],
+        ]
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            csv_file_path = os.path.join(temp_dir, "data.csv")
+            with open(csv_file_path, "w") as csv_file:
+                csv.writer(csv_file).writerows(rows)
+
+            data_test = duplicate_entries.DuplicateEntries(rows[0])
+            compact_data_test = duplicate_entries.DuplicateEntries(rows[0], csv_file=csv_file_path)
+            for row in rows:
+                data_test.test(row)
+                compact_data_test.test(row)
+
+            self.assertFalse(compact_data_test.passed)
+            self.assertEqual(5, compact_data_test.failure_count)
+            for max_examples in [-1, 0, 2, 3, 7]:
+                self.assertEqual(data_test.get_failure_message(max_examples=max_examples),
+                                 compact_data_test.get_failure_message(max_examples=max_examples))
+
+            # The examples are kept when the duplicates are verified, so the file is only read again for more examples
+            # than were kept.
+            for max_examples, read_count in [(3, 1), (-1, 2)]:
+                compact_data_test = duplicate_entries.DuplicateEntries(rows[0], csv_file=csv_file_path)
+                compact_data_test.max_examples = 3
+                for row in rows:
+                    compact_data_test.test(row)
+
+                with mock.patch.object(duplicate_entries.files, "read_rows",
+                                       wraps=duplicate_entries.files.read_rows) as read_rows:
+                    self.assertEqual(data_test.get_failure_message(max_examples=3),
+                                     compact_data_test.get_failure_message(max_examples=3))
+                    self.assertEqual(list(data_test.examples(max_examples=3)),
+                                     list(compact_data_test.examples(max_examples=3)))
+                    self.assertEqual(data_test.get_failure_message(max_examples=max_examples),
+                                     compact_data_test.get_failure_message(max_examples=max_examples))
+                self.assertEqual(read_count, read_rows.call_count)
+
+    def test_fingerprint(self):
+        self.assertEqual(16, len(duplicate_entries.fingerprint(["a", "b"])))
+        self.assertEqual(duplicate_entries.fingerprint(["a", "b"]), duplicate_entries.fingerprint(["a", "b"]))
+        self.assertNotEqual(duplicate_entries.fingerprint(["a", "b"]), duplicate_entries.fingerprint(["a", "c"]))
+
+        # The fingerprint must not depend on the per-process salt of the built-in hash.
+        completed_process = subprocess.run(
+            ["python", "-c", "from data_tests import duplicate_entries; "
+                             "print(duplicate_entries.fingerprint(['a', 'b']).hex())"],
+            capture_output=True, cwd=RunTestsTest.root_path, env={**os.environ, "PYTHONHASHSEED": "random"}
+        )
+        self.assertEqual(duplicate_entries.fingerprint(["a", "b"]).hex(), completed_process.stdout.decode().strip())
+
+    def test_fingerprint_collisions(self):
+        rows = [
+            ["header 1", "header 2", "votes"],
+            ["a", "b", "1"],
+            ["c", "d", "2"],
+            ["c", "d", "3"],
+            ["a", "b", "4"],
+            ["e", "f", "5"],
+        ]
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            csv_file_path = os.path.join(temp_dir, "data.csv")
+            with open(csv_file_path, "w") as csv_file:
+                csv.writer(csv_file).writerows(rows)
+
+            expected_data_test = duplicate_entries.DuplicateEntries(rows[0])
+            for row in rows:
+                expected_data_test.test(row)
+
+            # Every row has the same fingerprint, so the duplicates can only be detected by comparing the rows.
+            with mock.patch.object(duplicate_entries, "fingerprint", return_value=bytes(16)):
+                for csv_file in [None, csv_file_path]:
+                    data_test = duplicate_entries.DuplicateEntries(rows[0], csv_file=csv_file)
+                    for row in rows:
+                        data_test.test(row)
+
+                    self.assertFalse(data_test.passed)
+                    self.assertEqual(2, data_test.failure_count)
+                    self.assertEqual(expected_data_test.get_failure_message(), data_test.get_failure_message())
+
     def test_ragged_with_duplicates(self):
         rows = [
             ["header 1", "votes", "header 3", "early_voting", "election_day", "mail", "provisional", "absentee"],
@@ -96,6 +513,227 @@ class DuplicateEntriesTest(unittest.TestCase):
         self.assertTrue(data_test.passed)
 
 
+class FailureCollectorTest(unittest.TestCase):
+    def test_limit(self):
+        collector = failures.FailureCollector()
+        collector.limit(3)
+        for i in range(10):
+            collector.add(i, [f"{i}"])
+            collector.add(i, [f"{i}"])
+
+        self.assertEqual(10, len(collector))
+        self.assertEqual([(0, ["0"]), (1, ["1"]), (2, ["2"])], list(collector.examples()))
+        self.assertEqual([(0, ["0"])], list(collector.examples(1)))
+        self.assertRaises(ValueError, collector.limit, 5)
+
+    def test_saturate(self):
+        collector = failures.FailureCollector()
+        collector.limit(1, saturate_after=2)
+        collector.add(1, ["1"])
+        self.assertFalse(collector.saturated)
+        collector.add(2, ["2"])
+        self.assertTrue(collector.saturated)
+        self.assertEqual([(1, ["1"])], list(collector.examples()))
+
+        self.assertFalse(failures.FailureCollector().saturated)
+        collector = failures.FailureCollector(1, sample=True, saturate_after=1)
+        collector.add(1, ["1"])
+        self.assertFalse(collector.saturated)
+
+    def test_sample(self):
+        collector = failures.FailureCollector(5, sample=True)
+        for i in range(1000):
+            collector.add(i, [f"{i}"])
+
+        examples = list(collector.examples())
+        self.assertEqual(1000, len(collector))
+        self.assertEqual(5, len(examples))
+        self.assertEqual(sorted(examples), examples)
+        self.assertLess(examples[0][0], examples[-1][0])
+
+    def test_spill(self):
+        collector = failures.FailureCollector()
+        with mock.patch.object(failures.FailureCollector, "batch_size", 7):
+            for i in range(100):
+                collector.add(i, [f"{i}"])
+
+            self.assertEqual(100, len(collector))
+            self.assertEqual([(i, [f"{i}"]) for i in range(100)], list(collector.examples()))
+            self.assertEqual([(i, [f"{i}"]) for i in range(9)], list(collector.examples(9)))
+
+        collector.close()
+        collector.close()
+
+
+class ShardsTest(unittest.TestCase):
+    def test_assign_shards(self):
+        costs = {"a": 100, "b": 60, "c": 50, "d": 40, "e": 10, "f": 10}
+        assignments = shards.assign_shards(costs, 2)
+        self.assertEqual({"a": 1, "b": 2, "c": 2, "d": 1, "e": 2, "f": 2}, assignments)
+        self.assertEqual(assignments, shards.assign_shards(dict(reversed(costs.items())), 2))
+        self.assertEqual({1}, set(shards.assign_shards(costs, 1).values()))
+        self.assertEqual(3, len(set(shards.assign_shards(costs, 3).values())))
+
+    def test_parse_shard(self):
+        self.assertEqual((2, 4), shards.parse_shard("2/4"))
+        self.assertEqual((1, 1), shards.parse_shard(" 1/1"))
+        for shard in ["0/4", "5/4", "1/0", "1", "a/b", "1/2/3"]:
+            self.assertRaises(ValueError, shards.parse_shard, shard)
+
+
+class SpooledMessageTest(unittest.TestCase):
+    def test_memory(self):
+        message = failures.SpooledMessage(["a\n", "b", "c"])
+        self.assertEqual(4, len(message))
+        self.assertEqual("a\nbc", str(message))
+        self.assertEqual(["a\nbc"], list(message.chunks()))
+        message.close()
+
+    def test_spill(self):
+        pieces = [f"\n\tRow {i}: ['\u00e9', 'b']" for i in range(1000)]
+        with mock.patch.object(failures.SpooledMessage, "max_size", 100):
+            message = failures.SpooledMessage(pieces)
+
+        self.assertEqual("".join(pieces), str(message))
+        self.assertEqual("".join(pieces), "".join(message.chunks(chunk_size=7)))
+
+        # Messages that have spilled over are sent to other processes as the path of their file.
+        unpickled_message = pickle.loads(pickle.dumps(message))
+        self.assertEqual(message, unpickled_message)
+
+        unpickled_message.close()
+        self.assertRaises(FileNotFoundError, str, message)
+
+    def test_spill_on_demand(self):
+        message = failures.SpooledMessage(["a\n", "\u00e9"])
+        message.spill()
+        self.assertEqual("a\n\u00e9", str(message))
+        self.assertEqual(message, pickle.loads(pickle.dumps(message)))
+
+        message.close()
+        self.assertEqual("", str(message))
+        self.assertEqual([""], list(message.chunks()))
+        message.close()
+
+    def test_discard_pending_results(self):
+        message = failures.SpooledMessage(["a"])
+        message.spill()
+        test_data.TestCase._pending_results["data.csv"] = {
+            "missing_values": suites.FileResult(False, 1, "a", message, ()), "file_format": ValueError("b")
+        }
+
+        test_data.TestCase.discard_pending_results()
+        self.assertEqual({}, test_data.TestCase._pending_results)
+        self.assertEqual("", str(message))
+
+
+class PrefetcherTest(unittest.TestCase):
+    def test_prefetch(self):
+        with tempfile.TemporaryDirectory() as root_path:
+            paths = []
+            for i in range(6):
+                paths.append(os.path.join(root_path, f"{i}.csv"))
+                with open(paths[-1], "w") as csv_file:
+                    csv_file.write("a" * 10 * i)
+            paths.insert(3, os.path.join(root_path, "missing.csv"))
+            entries = [(x, i) for i, x in enumerate(paths)]
+
+            with mock.patch.object(prefetch.Prefetcher, "chunk_size", 4):
+                prefetcher = prefetch.Prefetcher(entries, get_path=lambda x: x[0], depth=3, max_bytes=16)
+                prefetched_entries = []
+                for entry in prefetcher:
+                    self.assertLessEqual(prefetcher.read_ahead_bytes, 16)
+                    prefetched_entries.append(entry)
+                self.assertEqual(entries, prefetched_entries)
+                self.assertEqual(0, prefetcher.read_ahead_bytes)
+
+                prefetcher = prefetch.Prefetcher(entries, get_path=lambda x: x[0], depth=3, max_bytes=16)
+                for _ in prefetcher:
+                    break
+                self.assertEqual(0, prefetcher.read_ahead_bytes)
+
+    def test_no_entries(self):
+        self.assertEqual([], list(prefetch.Prefetcher([], get_path=lambda x: x, depth=2, max_bytes=16)))
+
+
+class ResultCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.result_cache = cache.ResultCache(self.cache_dir.name)
+
+    def tearDown(self):
+        self.result_cache.close()
+        self.cache_dir.cleanup()
+
+    def test_evict(self):
+        for i in range(5):
+            self.result_cache.put(f"hash {i}", "file_format", 10, -1, suites.FileResult(True, 0, "", ""))
+        self.result_cache.get("hash 0", "file_format", 10, -1)
+
+        self.result_cache.evict(max_entries=2)
+        self.assertEqual(2, len(self.result_cache))
+        self.assertIsNotNone(self.result_cache.get("hash 0", "file_format", 10, -1))
+        self.assertIsNone(self.result_cache.get("hash 1", "file_format", 10, -1))
+
+        self.result_cache.evict(max_age=0)
+        self.assertEqual(0, len(self.result_cache))
+
+    def test_get_and_put(self):
+        check_results = (suites.CheckResult("TabCharacters", False, 3, [(2, ["a\tb"])]),)
+        result = suites.FileResult(False, 3, "console message", "log message", check_results)
+        self.assertIsNone(self.result_cache.get("hash", "file_format", 10, -1))
+
+        self.result_cache.put("hash", "file_format", 10, -1, result)
+        self.assertEqual(result, self.result_cache.get("hash", "file_format", 10, -1))
+        self.assertIsNone(self.result_cache.get("hash", "file_format", 10, 10))
+        self.assertIsNone(self.result_cache.get("hash", "missing_values", 10, -1))
+        self.assertIsNone(self.result_cache.get("other hash", "file_format", 10, -1))
+
+        self.result_cache.clear()
+        self.assertIsNone(self.result_cache.get("hash", "file_format", 10, -1))
+
+
+class RowContextTest(unittest.TestCase):
+    def test_context(self):
+        context = row_context.RowContext(["County", " Candidate ", "Votes", "mail", "notes"])
+        context.update(["a", "Under Votes", "-3", "", "1"])
+        self.assertFalse(context.is_empty)
+        self.assertFalse(context.is_ragged)
+        self.assertEqual(1, context.candidate_index)
+        self.assertEqual(frozenset({"NegativeVotes"}), context.exemptions)
+        self.assertEqual({2: -3.0}, context.votes)
+
+        context.update(["a", "b", "1.5", " 2 ", "3", "4"])
+        self.assertTrue(context.is_ragged)
+        self.assertEqual(frozenset(), context.exemptions)
+        self.assertEqual({}, context.votes)
+
+        context.update(["a", "b", "x", " 2 ", "1"])
+        self.assertEqual({3: 2.0}, context.votes)
+
+        context.update([" ", "", " ", "", "\t"])
+        self.assertTrue(context.is_empty)
+        self.assertEqual({}, context.votes)
+
+    def test_shared_context(self):
+        headers = ["county", "candidate", "votes", "mail", "election_day"]
+        rows = [headers, ["a", "b", "-1.5", "1", "2"], ["a", "b", "3", "1", "2"], ["", "", "", "", ""], ["a"]]
+
+        with tempfile.NamedTemporaryFile("w", suffix=".csv", newline="") as csv_file:
+            csv.writer(csv_file).writerows(rows)
+            csv_file.flush()
+
+            results = suites.validate_file(csv_file.name, list(suites.SUITES), -1, -1)
+            separate_results = {x: suites.validate_file(csv_file.name, [x], -1, -1)[x] for x in suites.SUITES}
+
+        self.assertEqual(separate_results, results)
+        self.assertEqual([2], [x[0] for x in results["vote_breakdown_totals"].checks[0].examples])
+        checks = {x.name: x for x in results["file_format"].checks}
+        self.assertEqual(1, checks["EmptyRows"].failure_count)
+        self.assertEqual([2], [x[0] for x in checks["NegativeVotes"].examples])
+        self.assertEqual([2], [x[0] for x in checks["NonIntegerVotes"].examples])
+
+
 # noinspection DuplicatedCode
 class MissingValueTest(unittest.TestCase):
     def test_empty(self):
@@ -224,10 +862,67 @@ class RunTestsTest(unittest.TestCase):
         completed_process = subprocess.run(command, capture_output=True)
         return completed_process
 
+    def test_all(self):
+        self.verify_success("all")
+        self.verify_failure("all", "1 duplicate entries", [2, 3, 4, 5])
+
+        with open(self.log_file.name, "r") as log_file:
+            log_file_contents = "\n".join(log_file.readlines())
+
+        self.assertRegex(log_file_contents, "FAIL: test_duplicate_entries")
+        self.assertRegex(log_file_contents, "(?s)FAIL: test_missing_values.*?1 rows.*?missing.*?county")
+        self.assertRegex(log_file_contents, "(?s)FAIL: test_vote_method_totals.*?1 rows.*?absentee")
+
+    def test_cache(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            self.verify_failure("missing_values", "1 rows.*missing.*county", [4], f"--cache-dir={cache_dir}")
+
+            # Replace the cached result, in order to verify that it is used instead of testing the file again.
+            result_cache = cache.ResultCache(cache_dir)
+            csv_file = glob.glob(os.path.join(self.bad_data_dir.name, self.year, "*.csv"))[0]
+            result = suites.FileResult(False, 1, "cached console message", "cached log message")
+            result_cache.put(cache.get_content_hash(csv_file), "missing_values", 10, -1, result)
+            result_cache.close()
+
+            completed_process = self.run_test("missing_values", self.bad_data_dir.name, f"--cache-dir={cache_dir}")
+            self.assertEqual(1, completed_process.returncode)
+            self.assertRegex(completed_process.stderr.decode(), "cached console message")
+
+            self.verify_failure("missing_values", "1 rows.*missing.*county", [4], f"--cache-dir={cache_dir}",
+                                "--clear-cache")
+
+    def test_cross_file_duplicates(self):
+        self.verify_success("cross_file_duplicates")
+
+        with tempfile.TemporaryDirectory() as data_dir:
+            RunTestsTest.create_data(data_dir, self.year, self.bad_rows)
+            os.mkdir(os.path.join(data_dir, self.year, "counties"))
+            _, csv_file_path = tempfile.mkstemp(suffix=".csv", dir=os.path.join(data_dir, self.year, "counties"))
+            with open(csv_file_path, "w") as csv_file:
+                csv.writer(csv_file).writerows([self.bad_rows[0], ["c", "d", "0", "0"]])
+
+            completed_process = self.run_test("cross_file_duplicates", data_dir)
+            self.assertEqual(1, completed_process.returncode)
+            self.assertRegex(completed_process.stderr.decode(), "1 entries are duplicated in other files")
+            self.assertRegex(completed_process.stderr.decode(), "Row 5.*also.*row 2")
+            self.assertRegex(completed_process.stderr.decode(), "Row 2.*also.*row 5")
+
+            completed_process = self.run_test("cross_file_duplicates", data_dir, "--cross-file-scope=directory")
+            self.assertEqual(0, completed_process.returncode)
+
     def test_duplicate_entries(self):
         self.verify_success("duplicate_entries")
         self.verify_failure("duplicate_entries", "1 duplicate entries", [2, 3])
 
+    @unittest.skipUnless(columnar.is_available(), "NumPy isn't installed")
+    def test_engine(self):
+        self.verify_success("all", "--engine=numpy")
+        self.verify_failure("all", "1 duplicate entries", [2, 3, 4, 5], "--engine=numpy")
+
+    def test_fail_fast(self):
+        self.verify_success("all", "--fail-fast")
+        self.verify_failure("all", "(?s)1 duplicate entries.*lower bounds", [2, 3, 4, 5], "--fail-fast")
+
     def test_group_failures(self):
         completed_process = self.run_test("duplicate_entries", self.bad_data_dir.name)
         ungrouped_output = completed_process.stderr.decode()
@@ -246,10 +941,113 @@ class RunTestsTest(unittest.TestCase):
         grouped_output = completed_process.stderr.decode()
         self.assertRegex(grouped_output, rf"::group::{self.year}\s*{re.escape(expected_group_body)}\s*::endgroup::")
 
+    def test_jobs(self):
+        self.verify_success("all", "--jobs", "2")
+        self.verify_failure("all", "1 duplicate entries", [2, 3, 4, 5], "--jobs", "2")
+
+        serial_output = self.run_test("all", self.bad_data_dir.name).stderr.decode()
+        parallel_output = self.run_test("all", self.bad_data_dir.name, "--jobs", "2").stderr.decode()
+        self.assertEqual(re.sub(r"Ran .*", "", serial_output), re.sub(r"Ran .*", "", parallel_output))
+
+        with tempfile.TemporaryDirectory() as timings_dir:
+            timings_file = os.path.join(timings_dir, "timings.json")
+            for schedule in ["cost", "path", "cost"]:
+                parallel_output = self.run_test("all", self.bad_data_dir.name, "--jobs", "2", "--schedule", schedule,
+                                                f"--timings-file={timings_file}").stderr.decode()
+                self.assertEqual(re.sub(r"Ran .*", "", serial_output), re.sub(r"Ran .*", "", parallel_output))
+
+            timings = scheduling.load_timings(timings_file)
+            self.assertEqual([self.year], [pathlib.PurePath(x).parts[0] for x in timings])
+
     def test_missing_values(self):
         self.verify_success("missing_values")
         self.verify_failure("missing_values", "1 rows.*missing.*county", [4])
 
+    def test_multiple(self):
+        self.verify_success("missing_values,vote_breakdown_totals")
+        self.verify_failure("missing_values,vote_breakdown_totals", "1 rows.*missing.*county", [4, 5])
+        self.assertEqual(2, self.run_test("bad_test,missing_values", self.good_data_dir.name).returncode)
+
+    def test_profile(self):
+        for engine in ["python", "numpy"] if columnar.is_available() else ["python"]:
+            with self.subTest(engine=engine):
+                completed_process = self.run_test("all", self.bad_data_dir.name, "--profile", f"--engine={engine}")
+                self.assertEqual(1, completed_process.returncode)
+
+                output = completed_process.stderr.decode()
+                self.assertRegex(output, f"Profiled 1 files with {len(self.bad_rows)} rows")
+                for operation in ["read", "DuplicateEntries", "MissingValue", "VoteBreakdownTotals",
+                                  "LeadingAndTrailingSpaces", "NegativeVotes"]:
+                    self.assertRegex(output, f"\n{operation} +[0-9]+ +[0-9.]+")
+                self.assertNotRegex(output, "FusedValueTests|ColumnarChecks")
+                self.assertRegex(output,
+                                 f"(?s)Slowest files:.*{self.year}.*\\.csv \\({len(self.bad_rows)} rows\\)")
+
+    def test_report_file(self):
+        with tempfile.NamedTemporaryFile(suffix=".jsonl") as report_file:
+            self.verify_failure("missing_values,vote_breakdown_totals", "1 rows.*missing.*county", [4, 5],
+                                f"--report-file={report_file.name}")
+            records = [json.loads(x) for x in report_file]
+
+        self.assertEqual(["missing_values"] * 3 + ["vote_breakdown_totals"], [x["test"] for x in records])
+        self.assertEqual({f"{self.year}"}, {x["year"] for x in records})
+
+        failures = {x["check"]: x for x in records if not x["passed"]}
+        self.assertEqual(["MissingValue(county)", "VoteBreakdownTotals"], sorted(failures))
+        self.assertEqual(1, failures["MissingValue(county)"]["count"])
+        self.assertEqual([4], failures["MissingValue(county)"]["row_numbers"])
+        self.assertEqual([self.bad_rows[3]], failures["MissingValue(county)"]["rows"])
+        self.assertEqual([5], failures["VoteBreakdownTotals"]["row_numbers"])
+
+    def test_schemas_file(self):
+        with tempfile.NamedTemporaryFile("w", suffix=".json") as schemas_file:
+            json.dump({"known_schemas": [self.bad_rows[0]]}, schemas_file)
+            schemas_file.flush()
+            self.verify_failure("vote_breakdown_totals", "4 rows.*not equal to", [2, 3, 4, 5],
+                                f"--schemas-file={schemas_file.name}", "--jobs=2")
+
+            schemas_file.seek(0)
+            schemas_file.truncate()
+            json.dump({"known_schemas": "county"}, schemas_file)
+            schemas_file.flush()
+            completed_process = self.run_test("vote_breakdown_totals", self.bad_data_dir.name,
+                                              f"--schemas-file={schemas_file.name}")
+            self.assertEqual(2, completed_process.returncode)
+            self.assertRegex(completed_process.stderr.decode(), "known_schemas")
+
+    def test_selected_files(self):
+        self.verify_failure("missing_values", "1 rows.*missing.*county", [4], "--years", f"2016-{self.year}")
+        for args in [["--years", "2016-2019"], ["--exclude", f"{self.year}/*.csv"], ["--include", "2016/*"]]:
+            self.assertEqual(0, self.run_test("missing_values", self.bad_data_dir.name, *args).returncode)
+
+        completed_process = self.run_test("missing_values", self.bad_data_dir.name, "--years", "2020-2016")
+        self.assertEqual(2, completed_process.returncode)
+        self.assertRegex(completed_process.stderr.decode(), "invalid years")
+
+    def test_shard(self):
+        with tempfile.TemporaryDirectory() as report_dir:
+            report_files = [os.path.join(report_dir, f"{x}.jsonl") for x in ["all", "1", "2", "merged"]]
+            self.run_test("all", self.bad_data_dir.name, f"--report-file={report_files[0]}")
+            shard_return_codes = [
+                self.run_test("all", self.bad_data_dir.name, f"--shard={x}/2", f"--report-file={y}").returncode
+                for x, y in [(1, report_files[1]), (2, report_files[2])]
+            ]
+            self.assertEqual([0, 1], sorted(shard_return_codes))
+
+            completed_process = subprocess.run(["python", os.path.join(RunTestsTest.root_path, "merge_reports.py"),
+                                                *report_files[1:3], f"--output={report_files[3]}", "--group-failures"],
+                                               capture_output=True)
+            self.assertEqual(1, completed_process.returncode)
+            self.assertRegex(completed_process.stderr.decode(),
+                             rf"(?s)::group::{self.year}\s*FAIL: duplicate_entries.*::endgroup::\s*3 failures")
+
+            with open(report_files[0], "r") as report_data, open(report_files[3], "r") as merged_report_data:
+                self.assertEqual(report_data.read(), merged_report_data.read())
+
+        completed_process = self.run_test("all", self.bad_data_dir.name, "--shard=0/2")
+        self.assertEqual(2, completed_process.returncode)
+        self.assertRegex(completed_process.stderr.decode(), "invalid shard")
+
     def test_specific_files(self):
         good_files = [
             os.path.relpath(f, self.good_data_dir.name)
@@ -263,6 +1061,11 @@ class RunTestsTest(unittest.TestCase):
         ]
         self.verify_failure("missing_values", "1 rows.*missing.*county", [4], "--files", f"{' '.join(bad_files)}")
 
+    def test_stop_after_examples(self):
+        self.verify_success("all", "--stop-after-examples")
+        self.verify_failure("missing_values", "(?s)1 rows.*missing.*county.*lower bounds", [4], "--stop-after-examples",
+                            "--max-examples=1")
+
     def test_vote_breakdown_totals(self):
         self.verify_success("vote_breakdown_totals")
         self.verify_failure("vote_breakdown_totals", "1 rows.*absentee.*", [5])
@@ -284,6 +1087,119 @@ class RunTestsTest(unittest.TestCase):
                 self.assertNotRegex(log_file_contents, f"Row {i}.*")
 
 
+class StopEarlyTest(unittest.TestCase):
+    def test_stop_early(self):
+        headers = ["county", "precinct", "office", "district", "candidate", "votes", "election_day", "mail"]
+        rows = [headers]
+        for i in range(2000):
+            row = [f"County {i % 5}", f"Precinct {i % 40}", "Office  A" if i % 23 == 0 else "Office", "1",
+                   f"Candidate {i % 3}", str(i % 17 - 2), "1", "2.5" if i % 19 else ""]
+            rows.append(row if i % 41 else [])
+
+        with tempfile.NamedTemporaryFile("w", suffix=".csv", newline="") as csv_file:
+            csv.writer(csv_file).writerows(rows)
+            csv_file.flush()
+
+            expected_results = suites.validate_file(csv_file.name, list(suites.SUITES), 3, 3)
+            with mock.patch.object(suites.CheckSuite, "saturation_interval", 10):
+                for engine in ["python", "numpy"] if columnar.is_available() else ["python"]:
+                    for mode in ["stop_after_examples", "fail_fast"]:
+                        options = suites.RunOptions(engine=engine, **{mode: True})
+                        results = suites.validate_file(csv_file.name, list(suites.SUITES), 3, 3, options=options)
+                        for suite_name, expected_result in expected_results.items():
+                            result = results[suite_name]
+                            self.assertEqual(expected_result.passed, result.passed)
+                            if result.complete:
+                                self.assertEqual(expected_result, result)
+                                continue
+
+                            self.assertLess(result.failure_count, expected_result.failure_count)
+                            # The examples of duplicate entries are grouped by their first row, so the first groups
+                            # that are found aren't necessarily the first groups of the file.
+                            if mode == "stop_after_examples" and suite_name != "duplicate_entries":
+                                self.assertEqual(expected_result.checks,
+                                                 tuple(x._replace(failure_count=y.failure_count)
+                                                       for x, y in zip(result.checks, expected_result.checks)))
+
+        self.assertFalse(expected_results["file_format"].passed)
+        self.assertFalse(expected_results["duplicate_entries"].passed)
+
+
+class SchedulingTest(unittest.TestCase):
+    def test_schedule(self):
+        costs = scheduling.estimate_costs([100, 400, 200, 300], [None, 1.0, None, None])
+        self.assertEqual([0.25, 1.0, 0.5, 0.75], costs)
+        self.assertEqual([1, 3, 2, 0], scheduling.get_schedule(costs))
+        self.assertEqual([1, 0, 2], scheduling.get_schedule(scheduling.estimate_costs([2, 3, 2], [None] * 3)))
+
+    def test_in_order(self):
+        received = []
+        indexed_results = iter([(2, "c"), (0, "a"), (3, "d"), (1, "b")])
+        for result in scheduling.in_order(x for x in indexed_results if not received.append(x[0])):
+            received.append(result)
+        self.assertEqual([2, 0, "a", 3, 1, "b", "c", "d"], received)
+
+    def test_timings(self):
+        with tempfile.TemporaryDirectory() as timings_dir:
+            timings_file = os.path.join(timings_dir, "timings.json")
+            self.assertEqual({}, scheduling.load_timings(timings_file))
+            scheduling.save_timings(timings_file, {"2020/a.csv": 1.5})
+            self.assertEqual({"2020/a.csv": 1.5}, scheduling.load_timings(timings_file))
+
+            with open(timings_file, "w") as timings_data:
+                json.dump({"2020/a.csv": "slow"}, timings_data)
+            self.assertRaises(ValueError, scheduling.load_timings, timings_file)
+
+
+class SchemaRegistryTest(unittest.TestCase):
+    def test_load(self):
+        headers = ["county", "candidate", "votes", "mail"]
+        registry = schemas.SchemaRegistry()
+        self.assertFalse(registry.get_plan(headers).check_equality)
+        fingerprint = registry.fingerprint
+
+        with tempfile.NamedTemporaryFile("w", suffix=".json") as schemas_file:
+            json.dump({"known_schemas": [list(reversed(headers))],
+                       "exemptions": [{"pattern": "turnout", "checks": ["NonIntegerVotes"]}]}, schemas_file)
+            schemas_file.flush()
+            registry.load(schemas_file.name)
+
+            for config in [{"exemptions": [{"pattern": "("}]}, {"exemptions": [{"pattern": "(", "checks": ["a"]}]}]:
+                schemas_file.seek(0)
+                schemas_file.truncate()
+                json.dump(config, schemas_file)
+                schemas_file.flush()
+                self.assertRaises(ValueError, registry.load, schemas_file.name)
+
+            schemas_file.seek(0)
+            schemas_file.truncate()
+            json.dump([headers], schemas_file)
+            schemas_file.flush()
+            self.assertRaises(ValueError, registry.load, schemas_file.name)
+
+        self.assertTrue(registry.get_plan(headers).check_equality)
+        self.assertEqual({"NonIntegerVotes"}, registry.classifier.get_exemptions("Turnout"))
+        self.assertNotEqual(fingerprint, registry.fingerprint)
+        self.assertEqual(registry.fingerprint,
+                         schemas.SchemaRegistry(registry.known_schemas, registry.exemptions).fingerprint)
+
+    def test_plan(self):
+        headers = ["county", " Candidate ", "votes", "absentee", "Mail", "total votes", "county"]
+        registry = schemas.SchemaRegistry()
+        plan = registry.get_plan(headers)
+        self.assertIs(plan, registry.get_plan(list(headers)))
+
+        self.assertEqual(0, plan.column_indices["county"])
+        self.assertEqual(1, plan.candidate_index)
+        self.assertEqual((2, 3, 4), plan.vote_indices)
+        self.assertEqual((3,), plan.component_indices)
+        self.assertEqual((0, 1, 6), plan.indices_to_hash)
+        self.assertTrue(plan.has_breakdowns)
+        self.assertFalse(plan.check_equality)
+        self.assertFalse(registry.get_plan(["county", "votes"]).has_breakdowns)
+        self.assertFalse(registry.get_plan(["county"]).has_votes)
+
+
 class VoteBreakdownTotalsTest(unittest.TestCase):
     def test_equality(self):
         headers = ["county", "precinct", "office", "district", "party", "candidate", "election_day", "votes",
@@ -357,3 +1273,52 @@ class VoteBreakdownTotalsTest(unittest.TestCase):
         data_test.test(["Total Over / Under", "-1", "0"])
         data_test.test(["Under/ Over Votes", "-1", ""])
         self.assertTrue(data_test.passed)
+
+
+class WalkCsvFilesTest(unittest.TestCase):
+    def setUp(self):
+        self.root_path = tempfile.TemporaryDirectory()
+        for path in ["2020/b.csv", "2020/a.CSV", "2020/c.txt", "2020/.hidden.csv", "2020/.git/d.csv",
+                     "2020/counties/e.csv", "2020/precincts/f.csv", "2022/g.csv", "20200/h.csv", "other/i.csv",
+                     "j.csv"]:
+            full_path = os.path.join(self.root_path.name, path)
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            open(full_path, "w").close()
+
+    def tearDown(self):
+        self.root_path.cleanup()
+
+    def walk(self, **kwargs):
+        return [os.path.relpath(x, self.root_path.name).replace(os.sep, "/")
+                for x in files.walk_csv_files(self.root_path.name, **kwargs)]
+
+    def test_filters(self):
+        self.assertEqual(["2020/a.CSV", "2020/b.csv", "2020/counties/e.csv", "2020/precincts/f.csv", "2022/g.csv"],
+                         self.walk())
+        self.assertEqual(["2022/g.csv"], self.walk(years={"2021", "2022"}))
+        self.assertEqual(["2020/counties/e.csv", "2022/g.csv"], self.walk(include=["*/counties/*", "2022/*"]))
+        self.assertEqual(["2020/a.CSV", "2020/b.csv", "2022/g.csv"], self.walk(exclude=["2020/*/*"]))
+        self.assertEqual(["2020/b.csv", "2020/precincts/f.csv"],
+                         self.walk(years={"2020"}, include=["2020/[bp]*"], exclude=["2020/a.CSV"]))
+
+    def test_pruning(self):
+        scanned_paths = []
+        scandir = os.scandir
+
+        def record_scandir(path):
+            scanned_paths.append(os.path.relpath(path, self.root_path.name).replace(os.sep, "/"))
+            return scandir(path)
+
+        with mock.patch.object(os, "scandir", record_scandir):
+            self.assertEqual(["2020/counties/e.csv"], self.walk(years={"2020"}, include=["2020/counties/*.csv"]))
+            self.assertEqual([".", "2020", "2020/counties"], scanned_paths)
+
+            scanned_paths.clear()
+            self.assertEqual(["2022/g.csv"], self.walk(exclude=["2020"]))
+            self.assertEqual([".", "2022"], scanned_paths)
+
+    def test_parse_years(self):
+        self.assertEqual({"2016", "2017", "2018", "2022"}, files.parse_years("2016-2018, 2022"))
+        self.assertEqual({"2020"}, files.parse_years("2020-2020"))
+        for years in ["2018-2016", "20", "2016-", "abcd", ""]:
+            self.assertRaises(ValueError, files.parse_years, years)
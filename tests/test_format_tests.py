@@ -2,6 +2,7 @@ import csv
 import os
 import re
 import subprocess
+import sys
 import tempfile
 import unittest
 
@@ -9,6 +10,21 @@ from data_tests import format_tests
 
 
 class ConsecutiveSpacesTest(unittest.TestCase):
+    def test_could_fail(self):
+        format_test = format_tests.ConsecutiveSpaces()
+        self.assertFalse(format_test.could_fail(b"a,b c\nd ,\r\n e,f\n"))
+        self.assertFalse(format_test.could_fail(b'"a","b"\r\n"c d","e"\r\n'))
+        self.assertTrue(format_test.could_fail(b"a,b  c\n"))
+        self.assertTrue(format_test.could_fail(b'a,"b "" c"\n'))
+        self.assertTrue(format_test.could_fail(b'a,"b \r\nc"\n'))
+        self.assertTrue(format_test.could_fail(b'a,"\r\n\r\n"\n'))
+
+        for character in (chr(x) for x in range(sys.maxunicode + 1) if chr(x).isspace()):
+            data = f'"a{character}{character}"'.encode()
+            self.assertTrue(format_test.could_fail(data), repr(character))
+            if character not in "\r\n":
+                self.assertTrue(format_test.could_fail(data.replace(b'"', b"")), repr(character))
+
     def test_empty(self):
         format_test = format_tests.ConsecutiveSpaces()
         self.assertTrue(format_test.passed)
@@ -86,6 +102,65 @@ class EmptyRowsTest(unittest.TestCase):
         self.assertRegex(failure_message, "2 empty rows")
 
 
+class FusedValueTestsTest(unittest.TestCase):
+    def test_row(self):
+        rows = [
+            ["a", "b", "c"],
+            ["a", "b  c", "d"],
+            [" a", "b", "c\t"],
+            ["a", "b", "c\n"],
+            ["a\x00 ", "b", "c"],
+            ["a", "\u3000", ""],
+            [],
+        ]
+
+        fused_checks = [format_tests.ConsecutiveSpaces(), format_tests.LeadingAndTrailingSpaces(),
+                        format_tests.PrematureLineBreaks(), format_tests.TabCharacters()]
+        fused_value_tests = format_tests.FusedValueTests(fused_checks)
+        for row in rows:
+            fused_value_tests.test(row)
+
+        for fused_check in fused_checks:
+            check = type(fused_check)()
+            for row in rows:
+                check.test(row)
+            self.assertEqual(check.get_failure_message(), fused_check.get_failure_message())
+
+    def test_saturated(self):
+        fused_checks = [format_tests.ConsecutiveSpaces(), format_tests.TabCharacters()]
+        for fused_check in fused_checks:
+            fused_check.failures.limit(1, saturate_after=1)
+        fused_value_tests = format_tests.FusedValueTests(fused_checks)
+
+        for row in [["a  b"], ["a b"], ["a  b"]]:
+            fused_value_tests.drop_saturated()
+            fused_value_tests.test(row)
+        self.assertFalse(fused_value_tests.saturated)
+        self.assertEqual([(1, ["a  b"])], list(fused_checks[0].examples()))
+        self.assertEqual(1, fused_checks[0].failure_count)
+
+        fused_value_tests.test(["a\tb"])
+        fused_value_tests.drop_saturated()
+        self.assertTrue(fused_value_tests.saturated)
+        self.assertEqual([(4, ["a\tb"])], list(fused_checks[1].examples()))
+
+    def test_supports(self):
+        self.assertTrue(format_tests.FusedValueTests.supports(format_tests.TabCharacters()))
+        self.assertFalse(format_tests.FusedValueTests.supports(format_tests.NonAlphanumericEntries()))
+        self.assertFalse(format_tests.FusedValueTests.supports(format_tests.EmptyRows()))
+
+        # A subclass that changes which values are bad doesn't inherit the pattern of the bad values.
+        class TabsOrPipes(format_tests.TabCharacters):
+            def is_bad_value(self, value):
+                return super().is_bad_value(value) or "|" in value
+
+        class Tabs(format_tests.TabCharacters):
+            pass
+
+        self.assertFalse(format_tests.FusedValueTests.supports(TabsOrPipes()))
+        self.assertTrue(format_tests.FusedValueTests.supports(Tabs()))
+
+
 class InconsistentNumberOfColumnsTest(unittest.TestCase):
     def test_empty(self):
         format_test = format_tests.InconsistentNumberOfColumns(["a", "b", "c"])
@@ -174,6 +249,17 @@ class NegativeVotesTest(unittest.TestCase):
         format_test = format_tests.NegativeVotes(["a", "b", "c"])
         self.assertTrue(format_test.passed)
 
+    def test_exempt_subclass(self):
+        class StrictNegativeVotes(format_tests.NegativeVotes):
+            pass
+
+        for check_class in [format_tests.NegativeVotes, StrictNegativeVotes]:
+            format_test = check_class(["candidate", "votes"])
+            format_test.test(["Under Votes", "-1"])
+            self.assertTrue(format_test.passed)
+            format_test.test(["A", "-1"])
+            self.assertFalse(format_test.passed)
+
     def test_row(self):
         # This should pass because the "bad" value does not occur in a vote column.
         format_test = format_tests.NegativeVotes(["a", "b", "c"])
@@ -251,6 +337,11 @@ class NonIntegerVotesTest(unittest.TestCase):
 
 
 class PrematureLineBreaks(unittest.TestCase):
+    def test_could_fail(self):
+        format_test = format_tests.PrematureLineBreaks()
+        self.assertFalse(format_test.could_fail(b"a,b\r\nc,d\n"))
+        self.assertTrue(format_test.could_fail(b'a,"b\nc"\n'))
+
     def test_empty(self):
         format_test = format_tests.PrematureLineBreaks()
         self.assertTrue(format_test.passed)
@@ -276,6 +367,20 @@ class PrematureLineBreaks(unittest.TestCase):
 
 
 class TabCharacters(unittest.TestCase):
+    def test_could_fail(self):
+        format_test = format_tests.TabCharacters()
+        self.assertFalse(format_test.could_fail(b"a,b c\n"))
+        self.assertTrue(format_test.could_fail(b"a,b\tc\n"))
+        self.assertTrue(format_test.defines_with_is_bad_value("could_fail"))
+
+        # The raw contents are only scanned for the bad values of the class that defines the scan.
+        class TabsOrPipes(format_tests.TabCharacters):
+            def is_bad_value(self, value):
+                return super().is_bad_value(value) or "|" in value
+
+        self.assertFalse(TabsOrPipes().defines_with_is_bad_value("could_fail"))
+        self.assertFalse(format_tests.NonAlphanumericEntries().defines_with_is_bad_value("could_fail"))
+
     def test_empty(self):
         format_test = format_tests.TabCharacters()
         self.assertTrue(format_test.passed)